@@ -9,12 +9,22 @@ import signal
 import sys
 import atexit
 
+import prairiedog.config
 from prairiedog.logger import setup_logging
 from prairiedog.prairiedog import Prairiedog
 from prairiedog.graph import Graph
-from prairiedog.lemon_graph import LGGraph, DB_PATH
+from prairiedog.lemon_graph import LGGraph, DB_PATH, ReadPool, compact_store
 from prairiedog.dgraph_bundled import DgraphBundled
 from prairiedog.kmers import recommended_procs_kmers
+from prairiedog.unitigs import Unitigs, UnitigGraph
+from prairiedog.path_table import PathTables, PathTableGraph
+from prairiedog.edge_types import EdgeTypes
+from prairiedog.colored_graph import ColoredGraph, COLORED_PATH
+from prairiedog.fasta import is_fasta
+from prairiedog.fasta_index import FastaIndexes
+from prairiedog.manifest import Manifest, manifest_path
+from prairiedog.subgraph_ref import SubgraphRef
+from prairiedog.commit import CommitPolicy
 from prairiedog.profiler import Profiler, profiler_stop
 
 # If cli is imported, re-setup logging to level INFO
@@ -46,13 +56,49 @@ def connect_dgraph(**kwargs) -> DgraphBundled:
     return g
 
 
-def parse_backend(backend: str) -> Graph:
+def connect_writable(backend: str, edge_types: EdgeTypes,
+                     packed_keys: bool = False) -> Graph:
+    if backend == 'lemongraph':
+        return LGGraph()
+    elif backend == 'colored':
+        if os.path.exists(COLORED_PATH):
+            return ColoredGraph.load(COLORED_PATH, edge_types)
+        return ColoredGraph(edge_types)
+    return connect_dgraph(packed_keys=packed_keys)
+
+
+def writable_edge_types() -> EdgeTypes:
+    """Edge types of the samples already in the graph."""
+    path = os.path.join(prairiedog.config.OUTPUT_DIRECTORY, 'edge_types')
+    return EdgeTypes.load(path) if os.path.exists(path) else EdgeTypes()
+
+
+def save_writable(sg: SubgraphRef):
+    sg.save(None)
+    # The colored graph lives in memory
+    if isinstance(sg.graph, ColoredGraph):
+        sg.graph.dump(COLORED_PATH)
+
+
+def backend_manifest(backend: str) -> str:
+    """Path of the manifest of the samples in a backend graph."""
+    if backend == 'lemongraph':
+        return manifest_path(DB_PATH)
+    elif backend == 'colored':
+        return manifest_path(COLORED_PATH)
+    return manifest_path(
+        os.path.join(prairiedog.config.OUTPUT_DIRECTORY, 'dgraph'))
+
+
+def parse_backend(backend: str, packed_keys: bool = False) -> Graph:
     if backend == 'dgraph':
-        g = connect_dgraph()
+        g = connect_dgraph(packed_keys=packed_keys)
     elif backend == 'lemongraph':
         g = connect_lemongraph()
+    elif backend == 'colored':
+        g = ColoredGraph.load(COLORED_PATH)
     else:
-        g = connect_dgraph()
+        g = connect_dgraph(packed_keys=packed_keys)
     return g
 
 
@@ -83,13 +129,153 @@ def cli(debug, profiler):
 @click.argument('src', nargs=1)
 @click.argument('dst', nargs=1)
 @click.option('--backend', default='dgraph', help='Backend graph database')
-def query(src: str, dst: str, backend: str):
+@click.option('--canonical/--no-canonical',
+              default=prairiedog.config.CANONICAL,
+              help='Search both strands of a graph of canonical k-mers')
+@click.option('--unitigs', default=None,
+              help='Unitig index of a graph built with unitigs')
+@click.option('--packed-keys/--no-packed-keys',
+              default=prairiedog.config.PACKED_KEYS,
+              help='The graph was built with packed k-mer keys')
+@click.option('--edge-types',
+              default=os.path.join(prairiedog.config.OUTPUT_DIRECTORY,
+                                   'edge_types'),
+              help='Side table(s) of the edge types in the graph')
+@click.option('--path-tables', default=None,
+              help='Path table(s) of the contigs in the graph, ie. '
+                   'outputs/paths')
+@click.option('--fasta-index',
+              default=os.path.join(prairiedog.config.OUTPUT_DIRECTORY,
+                                   'fasta_index'),
+              help='Index(es) of the graphed FASTA files, hits are read from '
+                   'the files instead of walking their nodes')
+def query(src: str, dst: str, backend: str, canonical: bool, unitigs: str,
+          packed_keys: bool, edge_types: str, path_tables: str,
+          fasta_index: str):
     """Query the pan-genome for a path between two k-mers."""
-    g = parse_backend(backend)
-    pdg = Prairiedog(g=g)
+    g = parse_backend(backend, packed_keys)
+    if path_tables is not None:
+        g = PathTableGraph(g, PathTables(path_tables))
+    if unitigs is not None:
+        g = UnitigGraph(g, Unitigs(unitigs))
+    # Graphs built before edge types were interned don't have a side table
+    edge_types = EdgeTypes.load(edge_types) if os.path.exists(
+        edge_types) else None
+    # Edges of a unitig graph aren't positions in the contigs
+    fasta_indexes = FastaIndexes(fasta_index) if unitigs is None and \
+        os.path.exists(fasta_index) else None
+    pdg = Prairiedog(g=g, canonical=canonical, edge_types=edge_types,
+                     fasta_indexes=fasta_indexes, packed_keys=packed_keys)
     pdg.query(src, dst)
 
 
+@cli.command()
+@click.argument('pairs', type=click.File('r'))
+@click.option('--workers', default=None, type=int,
+              help='Threads running the queries, the number of CPUs by '
+                   'default')
+@click.option('--canonical/--no-canonical',
+              default=prairiedog.config.CANONICAL,
+              help='Search both strands of a graph of canonical k-mers')
+@click.option('--packed-keys/--no-packed-keys',
+              default=prairiedog.config.PACKED_KEYS,
+              help='The graph was built with packed k-mer keys')
+@click.option('--edge-types',
+              default=os.path.join(prairiedog.config.OUTPUT_DIRECTORY,
+                                   'edge_types'),
+              help='Side table(s) of the edge types in the graph')
+def queries(pairs, workers: int, canonical: bool, packed_keys: bool,
+            edge_types: str):
+    """Query the LemonGraph pan-genome for paths between many pairs of
+    k-mers at once, given as a "src dst" pair per line of PAIRS."""
+    pairs = [tuple(line.split()) for line in pairs if line.strip()]
+    edge_types = EdgeTypes.load(edge_types) if os.path.exists(
+        edge_types) else None
+    # Each query reads its own snapshot, so the graph can be queried while
+    # samples are being added
+    pool = ReadPool(DB_PATH, workers)
+
+    def _query(g: Graph, pair: tuple):
+        return Prairiedog(g=g, canonical=canonical, edge_types=edge_types,
+                          packed_keys=packed_keys).query(*pair)
+
+    for (src, dst), hits in zip(pairs, pool.map(_query, pairs)):
+        click.echo("{} {}: {}".format(src, dst, hits))
+
+
+@cli.command()
+@click.argument('samples', nargs=-1, required=True)
+@click.option('--backend', default='lemongraph', help='Backend graph database')
+@click.option('--canonical/--no-canonical',
+              default=prairiedog.config.CANONICAL,
+              help='Store canonical k-mers, as the graph was built')
+@click.option('--packed-keys/--no-packed-keys',
+              default=prairiedog.config.PACKED_KEYS,
+              help='Store packed k-mer keys, as the graph was built')
+@click.option('--procs', default=1,
+              help='Processes preparing the edges of the samples')
+@click.option('--update/--no-update', default=False,
+              help='Replace the samples whose file changed')
+def add(samples: tuple, backend: str, canonical: bool, packed_keys: bool,
+        procs: int, update: bool):
+    """Add new samples, or directories of samples, to the pan-genome."""
+    paths = []
+    for p in samples:
+        if os.path.isdir(p):
+            paths.extend(sorted(os.path.join(p, f) for f in os.listdir(p)
+                                if is_fasta(f)))
+        else:
+            paths.append(p)
+    edge_types = writable_edge_types()
+    g = connect_writable(backend, edge_types, packed_keys)
+    path = backend_manifest(backend)
+    manifest = Manifest.load(path)
+    sg = SubgraphRef(g, edge_types, packed_keys)
+    added = sg.add_samples(paths, manifest, update=update,
+                           canonical=canonical, procs=procs,
+                           policy=CommitPolicy(overhead=0.05))
+    # The manifest is only updated once the samples are in the graph
+    save_writable(sg)
+    manifest.save(path)
+    click.echo("Added {} samples: {}".format(len(added), ' '.join(added)))
+
+
+@cli.command()
+@click.argument('samples', nargs=-1, required=True)
+@click.option('--backend', default='lemongraph', help='Backend graph database')
+@click.option('--packed-keys/--no-packed-keys',
+              default=prairiedog.config.PACKED_KEYS,
+              help='The graph was built with packed k-mer keys')
+def remove(samples: tuple, backend: str, packed_keys: bool):
+    """Remove samples from the pan-genome, by name."""
+    path = backend_manifest(backend)
+    manifest = Manifest.load(path)
+    edge_types = writable_edge_types()
+    sg = SubgraphRef(connect_writable(backend, edge_types, packed_keys),
+                     edge_types, packed_keys)
+    for sample in samples:
+        sg.remove_sample(sample, manifest)
+    save_writable(sg)
+    manifest.save(path)
+    click.echo("Removed {} samples".format(len(samples)))
+
+
+@cli.command()
+def stats():
+    """Report the size of the LemonGraph pan-genome store."""
+    for k, v in connect_lemongraph().stats().items():
+        click.echo("{}: {}".format(k, v))
+
+
+@cli.command()
+def compact():
+    """Rewrite the LemonGraph pan-genome store without its free pages, while
+    nothing else uses it."""
+    before, after = compact_store(DB_PATH)
+    click.echo("Compacted {} from {} to {} bytes ({:.1%} reclaimed)".format(
+        DB_PATH, before, after, 1 - after / before if before else 0))
+
+
 @cli.command()
 def dgraph():
     """Create a pan-genome."""
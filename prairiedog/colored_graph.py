@@ -0,0 +1,430 @@
+import array
+import bisect
+import logging
+import os
+import typing
+
+import dill
+
+import prairiedog.config
+from prairiedog.edge import Edge, EdgeBatch, ORIENTATION_LABEL
+from prairiedog.edge_types import EdgeTypes
+from prairiedog.graph import Graph
+from prairiedog.node import Node, NodeBatch
+
+log = logging.getLogger("prairiedog")
+
+COLORED_PATH = os.path.join(
+    prairiedog.config.OUTPUT_DIRECTORY,
+    'pangenome.colored')
+
+# A position packs a contig ID, an edge value and an orientation code into
+# one int, so sorted positions are ordered by contig then value
+LABEL_BITS = 3
+VALUE_BITS = 32
+CONTIG_SHIFT = VALUE_BITS + LABEL_BITS
+VALUE_MASK = (1 << VALUE_BITS) - 1
+# Orientation labels by code, 0 is no label
+ORIENTATIONS = (None, '++', '+-', '-+', '--')
+_ORIENTATION_CODES = {o: i for i, o in enumerate(ORIENTATIONS)}
+
+
+def pack_position(contig: int, value: int, code: int = 0) -> int:
+    return (contig << CONTIG_SHIFT) | (value << LABEL_BITS) | code
+
+
+def unpack_position(position: int) -> typing.Tuple[int, int, int]:
+    """
+    :return: (contig ID, edge value, orientation code)
+    """
+    return (position >> CONTIG_SHIFT,
+            (position >> LABEL_BITS) & VALUE_MASK,
+            position & ((1 << LABEL_BITS) - 1))
+
+
+class ColoredEdge:
+    """
+    A distinct (src, tgt) edge. colors is a bitmap with a bit set per sample
+    having the edge, positions is a sorted array with an int per contig
+    position of the edge, see pack_position().
+    """
+    __slots__ = ('colors', 'positions')
+
+    def __init__(self):
+        self.colors = 0
+        self.positions = array.array('q')
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, position: int):
+        # Contigs are mostly added in order, so this is usually an append
+        if not self.positions or position > self.positions[-1]:
+            self.positions.append(position)
+        else:
+            bisect.insort(self.positions, position)
+
+    def find(self, contig: int, value: int) -> int:
+        """
+        :return: Index of the position of the edge at a value of a contig,
+            or -1.
+        """
+        lo = pack_position(contig, value)
+        i = bisect.bisect_left(self.positions, lo)
+        if i < len(self.positions) and \
+                self.positions[i] < lo + (1 << LABEL_BITS):
+            return i
+        return -1
+
+
+class ColoredGraph(Graph):
+    """
+    Colored de Bruijn graph kept in memory, where every distinct edge is
+    stored once with the samples having it as a color set, instead of once
+    per sample. The contig positions of an edge are packed into one sorted
+    array of ints. connected() intersects the color sets of the edges of
+    both nodes before matching any position, and only the positions of the
+    shared colors are read.
+
+    Edges of a contig are expected by increasing value, as SubgraphRef adds
+    them, so the runs of a contig split by Ns are found from gaps in the
+    values.
+    """
+
+    def __init__(self, edge_types: EdgeTypes = None):
+        """
+        :param edge_types: Side table used to color the edge types by
+            sample. Edge types not in the table are their own color.
+        """
+        self.edge_types = edge_types if edge_types is not None else \
+            EdgeTypes()
+        self.colors = []  # Color : sample
+        self._color_ids = {}  # Sample : color
+        self._nodes = {}  # Node value : labels
+        self._edges = {}  # (src, tgt) : ColoredEdge
+        self._out = {}  # Node value : set of targets
+        self._in = {}  # Node value : set of sources
+        self._contig_ids = {}  # Edge type : contig ID
+        self._contig_types = []  # Contig ID : edge type, None once removed
+        self._contig_colors = []  # Contig ID : color
+        # Contig ID : sorted list of (value, source node) of the first edge
+        # of every run
+        self._runs = []
+        self._last = []  # Contig ID : value of the last edge added
+        self._labels = {}  # (contig ID, value) : labels besides orientation
+
+    def __getstate__(self):
+        # The side table is saved separately
+        state = dict(self.__dict__)
+        state['edge_types'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.edge_types = EdgeTypes()
+
+    def color(self, edge_type: str) -> int:
+        if edge_type in self.edge_types:
+            sample = self.edge_types.resolve(edge_type)[0]
+        else:
+            sample = edge_type
+        c = self._color_ids.get(sample)
+        if c is None:
+            c = self._color_ids[sample] = len(self.colors)
+            self.colors.append(sample)
+        return c
+
+    def samples(self, colors: int) -> typing.List[str]:
+        """
+        :param colors: A color set.
+        :return: Names of the samples in the set.
+        """
+        return [sample for c, sample in enumerate(self.colors)
+                if colors >> c & 1]
+
+    def upsert_node(self, node: Node, echo: bool = True) -> typing.Optional[
+            Node]:
+        labels = self._nodes.setdefault(node.value, {})
+        if node.labels is not None:
+            labels.update(node.labels)
+        if echo:
+            return Node(value=node.value, labels=labels or None)
+
+    def upsert_nodes(self, nodes: typing.Iterable[Node]):
+        if isinstance(nodes, NodeBatch):
+            for value in nodes.values:
+                self._nodes.setdefault(value, {})
+            return
+        super().upsert_nodes(nodes)
+
+    def _contig(self, edge_type: str) -> int:
+        cid = self._contig_ids.get(edge_type)
+        if cid is None:
+            cid = self._contig_ids[edge_type] = len(self._contig_types)
+            self._contig_types.append(edge_type)
+            self._contig_colors.append(self.color(edge_type))
+            self._runs.append([])
+            self._last.append(None)
+        return cid
+
+    def _add(self, src: str, tgt: str, cid: int, value: int,
+             orientation: str = None):
+        key = (src, tgt)
+        ce = self._edges.get(key)
+        if ce is None:
+            ce = self._edges[key] = ColoredEdge()
+            self._nodes.setdefault(src, {})
+            self._nodes.setdefault(tgt, {})
+            self._out.setdefault(src, set()).add(tgt)
+            self._in.setdefault(tgt, set()).add(src)
+        ce.colors |= 1 << self._contig_colors[cid]
+        ce.add(pack_position(cid, value, _ORIENTATION_CODES[orientation]))
+        last = self._last[cid]
+        if last is None or value != last + 1:
+            bisect.insort(self._runs[cid], (value, src))
+        self._last[cid] = value
+
+    def add_edge(self, edge: Edge, echo: bool = True) -> typing.Optional[Edge]:
+        cid = self._contig(edge.edge_type)
+        labels = dict(edge.labels or {})
+        orientation = labels.pop(ORIENTATION_LABEL, None)
+        if labels:
+            self._labels[(cid, edge.edge_value)] = labels
+        self._add(edge.src, edge.tgt, cid, edge.edge_value, orientation)
+        if echo:
+            return edge
+
+    def add_edges(self, edges: typing.Iterable[Edge]):
+        if not isinstance(edges, EdgeBatch):
+            super().add_edges(edges)
+            return
+        cid = self._contig(edges.edge_type)
+        nodes = edges.nodes
+        for i in range(len(edges)):
+            self._add(nodes[i], nodes[i + 1], cid, edges.edge_value + i,
+                      None if edges.orientations is None
+                      else edges.orientations[i])
+
+    def clear(self):
+        self.__init__(self.edge_types)
+
+    @property
+    def nodes(self) -> typing.Set[Node]:
+        return set(Node(value=v) for v in self._nodes)
+
+    def _edge(self, src: str, tgt: str, position: int) -> Edge:
+        cid, value, code = unpack_position(position)
+        labels = dict(self._labels.get((cid, value), {}))
+        if code:
+            labels[ORIENTATION_LABEL] = ORIENTATIONS[code]
+        return Edge(src=src, tgt=tgt, edge_type=self._contig_types[cid],
+                    edge_value=value, labels=labels or None)
+
+    def _expand(self, src: str, tgt: str, colors: int = -1
+                ) -> typing.Generator:
+        """
+        Positions of an edge in the samples of a color set.
+        :return: Generator of (contig ID, value, position).
+        """
+        ce = self._edges[(src, tgt)]
+        if not ce.colors & colors:
+            return
+        for position in ce.positions:
+            cid, value, _ = unpack_position(position)
+            if colors >> self._contig_colors[cid] & 1:
+                yield cid, value, position
+
+    @property
+    def edges(self) -> typing.Set[Edge]:
+        """
+        Every edge of every sample, see distinct_edges for the number of
+        edges stored.
+        """
+        return set(self._edge(src, tgt, position)
+                   for (src, tgt), ce in self._edges.items()
+                   for position in ce.positions)
+
+    @property
+    def distinct_edges(self) -> int:
+        return len(self._edges)
+
+    def get_labels(self, node: str) -> dict:
+        return dict(self._nodes[node])
+
+    def save(self, f: str = None):
+        """
+        Commits are no-ops as the graph lives in memory, see dump().
+        """
+        pass
+
+    def dump(self, f: str = COLORED_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(f)), exist_ok=True)
+        with open(f, 'wb') as fl:
+            dill.dump(self, fl, protocol=4)
+        log.info("Wrote colored graph of {} nodes and {} edges to {}".format(
+            len(self), self.distinct_edges, f))
+
+    @staticmethod
+    def load(f: str = COLORED_PATH,
+             edge_types: EdgeTypes = None) -> 'ColoredGraph':
+        with open(f, 'rb') as fl:
+            g = dill.load(fl)
+        if edge_types is not None:
+            g.edge_types = edge_types
+        return g
+
+    @property
+    def edgelist(self) -> typing.Generator:
+        return ("{} {}".format(src, tgt) for src, tgt in self._edges)
+
+    def set_graph_labels(self, labels: dict):
+        pass
+
+    def filter(self):
+        pass
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _out_colors(self, node: str) -> int:
+        colors = 0
+        for tgt in self._out.get(node, ()):
+            colors |= self._edges[(node, tgt)].colors
+        return colors
+
+    def _in_colors(self, node: str) -> int:
+        colors = 0
+        for src in self._in.get(node, ()):
+            colors |= self._edges[(src, node)].colors
+        return colors
+
+    def _run_end(self, cid: int, value: int) -> int:
+        """
+        :return: First value after the run of a contig holding value, ie.
+            where the next run starts.
+        """
+        runs = self._runs[cid]
+        i = bisect.bisect_left(runs, (value + 1,))
+        return runs[i][0] if i < len(runs) else VALUE_MASK + 1
+
+    def _spans(self, node_a: str, node_b: str, colors: int
+               ) -> typing.Generator:
+        """
+        Edges of the contigs going from node_a to node_b without spanning
+        an N, in the samples of a color set.
+        :return: Tuples of (target of the first edge, its position, value of
+            the last edge).
+        """
+        # Values of the edges reaching node_b, by contig
+        ends = {}
+        for src in self._in.get(node_b, ()):
+            for cid, value, _ in self._expand(src, node_b, colors):
+                ends.setdefault(cid, []).append(value)
+        for values in ends.values():
+            values.sort()
+        for tgt in sorted(self._out.get(node_a, ())):
+            for cid, value, position in self._expand(node_a, tgt, colors):
+                values = ends.get(cid)
+                if values is None:
+                    continue
+                lo = bisect.bisect_left(values, value)
+                hi = bisect.bisect_left(values, self._run_end(cid, value))
+                for last in values[lo:hi]:
+                    yield tgt, position, last
+
+    def connected(self, node_a: str, node_b: str) -> typing.Tuple[
+            bool, typing.Tuple]:
+        # Samples having both an edge from node_a and an edge to node_b
+        colors = self._out_colors(node_a) & self._in_colors(node_b)
+        if colors == 0:
+            log.warning("No samples connect {} and {}".format(node_a, node_b))
+            return False, ()
+        src_edges = []
+        seen = set()
+        for tgt, position, _ in self._spans(node_a, node_b, colors):
+            if position not in seen:
+                seen.add(position)
+                src_edges.append(self._edge(node_a, tgt, position))
+        return len(src_edges) > 0, tuple(src_edges)
+
+    def _next(self, node: str, cid: int, value: int) -> typing.Optional[str]:
+        """
+        :return: The target of the edge at a value of a contig, from node.
+        """
+        for tgt in self._out.get(node, ()):
+            ce = self._edges[(node, tgt)]
+            if ce.colors >> self._contig_colors[cid] & 1 and \
+                    ce.find(cid, value) >= 0:
+                return tgt
+        return None
+
+    def path(self, node_a: str, node_b: str) -> typing.Tuple[
+            typing.Tuple[typing.Tuple[Node], ...],
+            typing.Tuple[typing.Dict[str, typing.Any], ...]]:
+        colors = self._out_colors(node_a) & self._in_colors(node_b)
+        if colors == 0:
+            return tuple(), tuple()
+        paths = []
+        paths_meta = []
+        for tgt, position, last in self._spans(node_a, node_b, colors):
+            cid, first, _ = unpack_position(position)
+            nodes = [node_a, tgt]
+            for value in range(first + 1, last + 1):
+                nodes.append(self._next(nodes[-1], cid, value))
+            src_edge = self._edge(node_a, tgt, position)
+            paths.append(tuple(Node(value=n) for n in nodes))
+            paths_meta.append({'edge_type': src_edge.edge_type,
+                               **(src_edge.labels or {})})
+        return tuple(paths), tuple(paths_meta)
+
+    def node_edges(self, node: str) -> typing.Tuple[Edge, ...]:
+        edges = [self._edge(node, tgt, position)
+                 for tgt in self._out.get(node, ())
+                 for position in self._edges[(node, tgt)].positions]
+        edges += [self._edge(src, node, position)
+                  for src in self._in.get(node, ())
+                  for position in self._edges[(src, node)].positions]
+        return tuple(edges)
+
+    def _drop_edge(self, src: str, tgt: str):
+        del self._edges[(src, tgt)]
+        self._out[src].discard(tgt)
+        self._in[tgt].discard(src)
+        for node in (src, tgt):
+            if not self._out.get(node) and not self._in.get(node):
+                self._out.pop(node, None)
+                self._in.pop(node, None)
+                self._nodes.pop(node, None)
+
+    def remove_sample(self, edge_types: typing.Iterable[str]) -> int:
+        """
+        Every run of a contig is walked from its first edge, so only the
+        edges of the sample are visited.
+        :param edge_types:
+        :return:
+        """
+        removed = 0
+        for edge_type in edge_types:
+            cid = self._contig_ids.pop(edge_type, None)
+            if cid is None:
+                continue
+            c = self._contig_colors[cid]
+            for value, node in self._runs[cid]:
+                while node is not None:
+                    tgt = self._next(node, cid, value)
+                    if tgt is None:
+                        break
+                    ce = self._edges[(node, tgt)]
+                    del ce.positions[ce.find(cid, value)]
+                    self._labels.pop((cid, value), None)
+                    if not any(self._contig_colors[p >> CONTIG_SHIFT] == c
+                               for p in ce.positions):
+                        ce.colors &= ~(1 << c)
+                    if not ce.positions:
+                        self._drop_edge(node, tgt)
+                    removed += 1
+                    node = tgt
+                    value += 1
+            self._contig_types[cid] = None
+            self._runs[cid] = []
+        return removed
@@ -0,0 +1,168 @@
+import logging
+import queue
+import threading
+import time
+import typing
+
+from prairiedog.graph import Graph
+
+log = logging.getLogger("prairiedog")
+
+# Rough size of an edge in a transaction besides its node values and type
+EDGE_OVERHEAD_BYTES = 64
+
+# Batches built ahead of the background writer
+WRITER_QUEUE_SIZE = 2
+
+
+class CommitPolicy:
+    """
+    Decides when the open transaction of a graph is committed. A commit is
+    due when any of the limits is reached. Otherwise, with overhead set, the
+    commit interval adapts to the measured commit latency so commits take
+    about that fraction of the build time.
+    """
+
+    def __init__(self, max_items: int = None, max_bytes: int = None,
+                 max_seconds: float = None, overhead: float = None):
+        """
+        :param max_items: Nodes per transaction.
+        :param max_bytes: Estimated size of a transaction.
+        :param max_seconds: Time a transaction is kept open.
+        :param overhead: Fraction of the build time spent committing.
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.overhead = overhead
+        self.latency = None  # Of the last commit
+        self.commits = 0
+        self._reset()
+
+    def _reset(self):
+        self.items = 0
+        self.bytes = 0
+        self.opened = time.time()
+
+    def room(self) -> int:
+        """
+        :return: Number of items that can be added before max_items is
+            reached, at least 1. None if there is no limit.
+        """
+        if self.max_items is None:
+            return None
+        return max(1, self.max_items - self.items)
+
+    def record(self, items: int, n_bytes: int = 0):
+        self.items += items
+        self.bytes += n_bytes
+
+    def due(self) -> bool:
+        if self.items == 0:
+            return False
+        if self.max_items is not None and self.items >= self.max_items:
+            return True
+        if self.max_bytes is not None and self.bytes >= self.max_bytes:
+            return True
+        elapsed = time.time() - self.opened
+        if self.max_seconds is not None and elapsed >= self.max_seconds:
+            return True
+        if self.overhead is not None:
+            # Commit once to measure the latency
+            if self.latency is None:
+                return True
+            return elapsed * self.overhead >= self.latency
+        return False
+
+    def reset(self):
+        """
+        Called when a commit is issued, starts counting the next transaction.
+        """
+        self.commits += 1
+        self._reset()
+
+    def measured(self, latency: float):
+        self.latency = latency
+
+
+class GraphWriter:
+    """
+    Writes to a graph and commits it with graph.save() as the policy says.
+    In background mode every write and commit runs in order on a single
+    thread, fed by a queue of at most queue_size pending writes, so the
+    caller builds the next batch while the previous one is written and
+    committed. LMDB transactions must stay on the thread that opened them.
+    """
+
+    def __init__(self, graph: Graph, policy: CommitPolicy, out_file=None,
+                 background: bool = False,
+                 queue_size: int = WRITER_QUEUE_SIZE):
+        self.graph = graph
+        self.policy = policy
+        self.out_file = out_file
+        self.background = background
+        self._error = None
+        self._thread = None
+        if background:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # Pending writes are dropped after a failure
+            if self._error is not None:
+                continue
+            fn, args = item
+            try:
+                fn(*args)
+            except Exception as e:
+                self._error = e
+
+    def _raise(self):
+        if self._error is not None:
+            e, self._error = self._error, None
+            raise e
+
+    def write(self, fn: typing.Callable, *args):
+        """
+        Calls fn(*args), which writes to the graph.
+        """
+        if self._thread is None:
+            fn(*args)
+            return
+        self._raise()
+        self._queue.put((fn, args))
+
+    def _save(self):
+        st = time.time()
+        self.graph.save(self.out_file)
+        self.policy.measured(time.time() - st)
+
+    def commit(self):
+        self.policy.reset()
+        self.write(self._save)
+
+    def maybe_commit(self) -> bool:
+        if self.policy.due():
+            self.commit()
+            return True
+        return False
+
+    def close(self, commit: bool = True):
+        """
+        Waits for pending writes. Closing again does nothing.
+        :param commit: Also commit the writes since the last commit, on the
+            thread that opened the transaction. Skipped after a failed
+            write.
+        """
+        if commit and self._error is None and self.policy.items > 0:
+            self.commit()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise()
@@ -4,7 +4,13 @@
 
 import os
 
+from prairiedog.fasta import is_fasta
+
 K = 11
+# Store each kmer and its reverse complement as the same node
+CANONICAL = False
+# Key nodes by their 2-bit packed kmer instead of the kmer string
+PACKED_KEYS = False
 INPUT_DIRECTORY = 'samples/'
 MIC_CSV = 'samples/public_mic_class_dataframe.csv'
 
@@ -12,7 +18,7 @@ MIC_CSV = 'samples/public_mic_class_dataframe.csv'
 def _input_files():
     fls = [os.path.join(INPUT_DIRECTORY, f)
            for f in os.listdir(INPUT_DIRECTORY)
-           if f.endswith(('.fna', '.fasta', '.fa'))]
+           if is_fasta(f)]
     return fls
 
 
@@ -12,7 +12,7 @@ import grpc
 
 from prairiedog.edge import Edge
 from prairiedog.graph import Graph
-from prairiedog.node import Node, DEFAULT_NODE_TYPE
+from prairiedog.node import Node, NodeBatch, DEFAULT_NODE_TYPE
 from prairiedog.kmers import possible_kmers
 
 log = logging.getLogger("prairiedog")
@@ -22,6 +22,10 @@ DGRAPH_HOST = 'localhost'
 # This is specific to Dgraph
 DEFAULT_EDGE_PREDICATE = 'fd'
 
+# Edges upserted per request by Dgraph.upsert_edges(), each adds two query
+# blocks at most and a mutation
+UPSERT_BATCH_SIZE = 256
+
 
 def port(component: str, offset: int = 0) -> int:
     if component == "ZERO":
@@ -47,6 +51,20 @@ def decode(b: bytes):
         return json.loads(b)
 
 
+def label_nquads(subject: str, labels: typing.Optional[dict]) -> str:
+    """
+    Stores labels as string predicates of the subject.
+    :param subject: Either a blank node, ie. "_:e", or a uid in brackets.
+    :param labels:
+    :return:
+    """
+    if not labels:
+        return ""
+    return ''.join(
+        '{s} <{k}> "{v}" .\n'.format(s=subject, k=k, v=v)
+        for k, v in labels.items())
+
+
 class Dgraph(Graph):
 
     def __init__(self, port_offset: int = 0):
@@ -153,36 +171,186 @@ class Dgraph(Graph):
 
     def upsert_edge(self, edge: Edge, node_type: str = None,
                     edge_predicate: str = None):
-        log.debug("Upserting edge...")
+        self.upsert_edges([edge], node_type=node_type,
+                          edge_predicate=edge_predicate)
+
+    @staticmethod
+    def _upsert_block(edges: typing.List[Edge],
+                      node_type: str = DEFAULT_NODE_TYPE,
+                      edge_predicate: str = DEFAULT_EDGE_PREDICATE
+                      ) -> typing.Tuple[str, typing.List[
+                          typing.Tuple[str, str]]]:
+        """
+        Builds an upsert block for a batch of edges. The query binds every
+        node to a variable n{j} and every existing edge to e{i}, each
+        mutation is conditioned on its variable being empty. An empty uid()
+        variable stands for a new node, shared by every mutation of the
+        request, so edges reach nodes created by the same request.
+        :param edges: Distinct edges.
+        :param node_type:
+        :param edge_predicate:
+        :return: (query, list of (nquads, condition))
+        """
+        values = sorted({e.src for e in edges} | {e.tgt for e in edges})
+        names = {v: 'n{}'.format(j) for j, v in enumerate(values)}
+        blocks = []
+        mutations = []
+        for value in values:
+            n = names[value]
+            blocks.append('{n} as var(func: eq({nt}, "{v}"))'.format(
+                n=n, nt=node_type, v=value))
+            mutations.append((
+                'uid({n}) <{nt}> "{v}" .'.format(n=n, nt=node_type, v=value),
+                '@if(eq(len({}), 0))'.format(n)))
+        for i, edge in enumerate(edges):
+            a, b = names[edge.src], names[edge.tgt]
+            blocks.append("""var(func: uid({a})) @cascade {{
+                e{i} as {ep} @filter(
+                        eq(type, "{edge_type}") AND eq(value, {edge_value})
+                    ) {{
+                    {ep} @filter(uid({b}))
+                }}
+            }}""".format(a=a, b=b, i=i, ep=edge_predicate,
+                         edge_type=edge.edge_type,
+                         edge_value=edge.edge_value))
+            nquads = """
+            uid({a}) <{ep}> _:e{i} .
+            _:e{i} <{ep}> uid({b}) .
+            _:e{i} <type> "{edge_type}" .
+            _:e{i} <value> "{edge_value}" .
+            """.format(a=a, b=b, i=i, ep=edge_predicate,
+                       edge_type=edge.edge_type, edge_value=edge.edge_value)
+            nquads += label_nquads('_:e{}'.format(i), edge.labels)
+            mutations.append((nquads, '@if(eq(len(e{}), 0))'.format(i)))
+        query = "{{\n{}\n}}".format('\n'.join(blocks))
+        return query, mutations
+
+    def upsert_edges(self, edges: typing.Iterable[Edge],
+                     node_type: str = None, edge_predicate: str = None,
+                     batch_size: int = UPSERT_BATCH_SIZE):
+        """
+        Upserts edges and their nodes with one upsert block per batch, ie.
+        a single round trip and transaction for batch_size edges. Edges
+        that already exist are skipped.
+        :param edges:
+        :param node_type:
+        :param edge_predicate:
+        :param batch_size:
+        :return:
+        """
         if node_type is None:
             node_type = DEFAULT_NODE_TYPE
         if edge_predicate is None:
             edge_predicate = DEFAULT_EDGE_PREDICATE
-        exists, uid = self.exists_edge(edge, node_type=node_type,
-                                       edge_predicate=edge_predicate)
-        if exists:
-            log.warning("upsert_edge() was called with existing edge:")
-            log.warning(str(edge))
-            return
-        else:
-            uid_a = self.upsert_node(
-                Node(node_type=node_type, value=edge.src), echo=True).db_id
-            uid_b = self.upsert_node(
-                Node(node_type=node_type, value=edge.tgt), echo=True).db_id
-            nquads = """
-            <{a}> <{ep}> _:e .
-            _:e <{ep}> <{b}> .
-            _:e <type> "{edge_type}" .
-            _:e <value> "{edge_value}" .
-            """.format(a=uid_a, b=uid_b,
-                       ep=edge_predicate, edge_type=edge.edge_type,
-                       edge_value=edge.edge_value)
-            log.debug("Edge not found, adding nquad \n{}".format(nquads))
-            self.mutate(nquads)
+        # Duplicates in a batch would both see the edge as missing
+        distinct = {}
+        for edge in edges:
+            distinct.setdefault(
+                (edge.src, edge.tgt, edge.edge_type, edge.edge_value), edge)
+        edges = list(distinct.values())
+        for i in range(0, len(edges), batch_size):
+            query, mutations = self._upsert_block(
+                edges[i: i + batch_size], node_type, edge_predicate)
+            self.upsert(query, mutations)
 
     def add_edge(self, edge: Edge, echo: bool = True) -> typing.Optional[Edge]:
         return self.upsert_edge(edge)
 
+    def _uids(self, values: typing.Iterable[str],
+              node_type: str = DEFAULT_NODE_TYPE) -> typing.Dict[str, str]:
+        """
+        Looks up many nodes in one query.
+        :param values:
+        :param node_type:
+        :return: Node value : uid for the nodes that exist.
+        """
+        query = """{{
+            q(func: eq({nt}, {values})) {{
+                uid
+                {nt}
+            }}
+        }}
+        """.format(nt=node_type, values=json.dumps(sorted(set(values))))
+        r = self.query(query)
+        return {str(d[node_type]): d['uid'] for d in r['q']}
+
+    def upsert_nodes(self, nodes: typing.Iterable[Node]):
+        by_type = {}
+        if isinstance(nodes, NodeBatch):
+            by_type[nodes.node_type] = set(nodes.values)
+        else:
+            for node in nodes:
+                by_type.setdefault(node.node_type, set()).add(node.value)
+        nquads = ""
+        for node_type, values in by_type.items():
+            if not values:
+                continue
+            existing = self._uids(values, node_type)
+            nquads += ''.join(
+                '_:{value} <{type}> "{value}" .\n'.format(
+                    value=value, type=node_type)
+                for value in values if value not in existing)
+        if nquads:
+            self.mutate(nquads)
+
+    def add_edges(self, edges: typing.Iterable[Edge]):
+        self.upsert_edges(edges)
+
+    def remove_sample(self, edge_types: typing.Iterable[str]) -> int:
+        """
+        Edges are found with the index on their type, and their source
+        through the reverse of the edge predicate.
+        :param edge_types:
+        :return:
+        """
+        edge_types = sorted(set(edge_types))
+        if not edge_types:
+            return 0
+        query = """{{
+            q(func: eq(type, {types})) {{
+                uid
+                ~{ep} {{
+                    uid
+                }}
+                {ep} {{
+                    uid
+                }}
+            }}
+        }}
+        """.format(types=json.dumps(edge_types), ep=DEFAULT_EDGE_PREDICATE)
+        edges = self.query(query)['q']
+        if not edges:
+            return 0
+        nquads = []
+        touched = set()
+        for e in edges:
+            for src in e.get('~' + DEFAULT_EDGE_PREDICATE, []):
+                touched.add(src['uid'])
+                nquads.append('<{}> <{}> <{}> .\n'.format(
+                    src['uid'], DEFAULT_EDGE_PREDICATE, e['uid']))
+            for tgt in e.get(DEFAULT_EDGE_PREDICATE, []):
+                touched.add(tgt['uid'])
+            nquads.append('<{}> * * .\n'.format(e['uid']))
+        self.mutate(''.join(nquads), delete=True)
+        # Nodes left without edges in either direction
+        query = """{{
+            q(func: uid({uids})) {{
+                uid
+                out: count({ep})
+                in: count(~{ep})
+            }}
+        }}
+        """.format(uids=', '.join(sorted(touched)),
+                   ep=DEFAULT_EDGE_PREDICATE)
+        r = self.query(query)
+        orphans = ['<{}> * * .\n'.format(d['uid']) for d in r['q']
+                   if d.get('out', 0) == 0 and d.get('in', 0) == 0]
+        if orphans:
+            self.mutate(''.join(orphans), delete=True)
+        log.info("Removed {} edges and {} nodes left without edges".format(
+            len(edges), len(orphans)))
+        return len(edges)
+
     def clear(self):
         op = pydgraph.Operation(drop_all=True)
         self.client.alter(op)
@@ -192,7 +360,8 @@ class Dgraph(Graph):
         n = Node(value="")
         for k, v in d.items():
             if k == DEFAULT_NODE_TYPE:
-                n.value = v
+                # Packed keys are stored as ints
+                n.value = str(v)
             elif k == "uid":
                 n.db_id = v
         return n
@@ -223,7 +392,7 @@ class Dgraph(Graph):
         e = Edge(src=src, tgt="")
         for k, v in d.items():
             if k == edge_predicate:
-                e.tgt = v[0][node_type]
+                e.tgt = str(v[0][node_type])
             elif "type" in k:
                 e.edge_type = v
             elif "value" in k:
@@ -239,7 +408,7 @@ class Dgraph(Graph):
         src_arg = src
         for d in list_edges:
             if src_arg is None:
-                src = d[node_type]
+                src = str(d[node_type])
             else:
                 src = src_arg
             edges_list = d[edge_predicate]
@@ -256,7 +425,7 @@ class Dgraph(Graph):
         st = set()
         for d in list_edges:
             if src is None:
-                src = d[node_type]
+                src = str(d[node_type])
             e = Dgraph._parse_edge(src, d, node_type,
                                    edge_predicate)
             st.add(e)
@@ -288,13 +457,17 @@ class Dgraph(Graph):
     def get_labels(self, node: str) -> dict:
         pass
 
-    def mutate(self, nquads: str, depth: int = 1, max_depth: int = 3):
+    def mutate(self, nquads: str, depth: int = 1, max_depth: int = 3,
+               delete: bool = False):
         txn = self.client.txn()
         try:
             if depth > 1:
                 log.debug("Trying mutation attempt {}/{}".format(depth,
                                                                  max_depth))
-            txn.mutate(set_nquads=nquads)
+            if delete:
+                txn.mutate(del_nquads=nquads)
+            else:
+                txn.mutate(set_nquads=nquads)
             txn.commit()
             # self._txn = None
             if depth > 1:
@@ -307,7 +480,7 @@ class Dgraph(Graph):
                     rpc_error_call, depth, max_depth
                 ))
                 time.sleep(2 ** depth)
-                self.mutate(nquads=nquads, depth=depth + 1)
+                self.mutate(nquads=nquads, depth=depth + 1, delete=delete)
         except Exception as e:
             log.debug("Exception type was {}".format(type(e)))
             raise e
@@ -317,6 +490,40 @@ class Dgraph(Graph):
             txn.discard()
             # self._txn = None
 
+    def upsert(self, query: str, mutations: typing.List[typing.Tuple[
+            str, str]], depth: int = 1, max_depth: int = 3):
+        """
+        Runs an upsert block: the query and the mutations conditioned on its
+        variables, in one request committed as one transaction.
+        :param query:
+        :param mutations: List of (nquads, condition), where condition may
+            be None.
+        :param depth:
+        :param max_depth:
+        :return:
+        """
+        txn = self.client.txn()
+        try:
+            request = txn.create_request(
+                query=query,
+                mutations=[txn.create_mutation(set_nquads=nquads, cond=cond)
+                           for nquads, cond in mutations],
+                commit_now=True)
+            txn.do_request(request)
+        except (grpc.RpcError, pydgraph.errors.AbortedError) as e:
+            # Aborted by a concurrent transaction, rerunning the query sees
+            # what it wrote
+            if depth < max_depth:
+                log.debug("Ran into exception {}, retrying {}/{}...".format(
+                    e, depth, max_depth))
+                time.sleep(2 ** depth)
+                self.upsert(query, mutations, depth=depth + 1,
+                            max_depth=max_depth)
+            else:
+                raise e
+        finally:
+            txn.discard()
+
     def save(self, f: str = None):
         pass
 
@@ -359,52 +566,31 @@ class Dgraph(Graph):
         if not exists:
             log.warning("node_value {} doesn't exist".format(node_value))
             return tuple()
-        # Find the uid of the edge
+        # Every edge to the node, each with its own source through the
+        # reverse of the edge predicate
         query = """
         {{
             q(func: has({et})) @filter(uid_in({et}, {tgt})) {{
                 uid
-            }}
-        }}
-        """.format(et=DEFAULT_EDGE_PREDICATE, tgt=uid)
-        r = self.query(query)
-        if len(r['q']) == 0:
-            return tuple()
-        edge_uid = r['q'][0]['uid']
-
-        # Find the source edge
-        query_2 = """
-        {{
-            q(func: has({nt})) @filter(uid_in({et}, {uid})) {{
-                {nt}
-            }}
-        }}
-        """.format(nt=DEFAULT_NODE_TYPE, et=DEFAULT_EDGE_PREDICATE,
-                   uid=edge_uid)
-        r_2 = self.query(query_2)
-        src = r_2['q'][0][DEFAULT_NODE_TYPE]
-
-        # Finally, query the edge
-        query_3 = """
-        {{
-            q(func: has({et})) @filter(uid_in({et}, {tgt})) {{
-                expand(_all_) {{
-                    uid
-                    expand(_all_) {{
-                        {nt}
-                    }}
+                type
+                value
+                {et} {{
+                    {nt}
+                }}
+                ~{et} {{
+                    {nt}
                 }}
             }}
         }}
-        """.format(nv=node_value, nt=DEFAULT_NODE_TYPE,
-                   et=DEFAULT_EDGE_PREDICATE, tgt=uid)
-        r_3 = self.query(query_3)
-        if len(r_3['q']) == 0:
-            return tuple()
-
-        return self._parse_edges_reverse(
-            list_edges=r_3['q'], node_type=DEFAULT_NODE_TYPE,
-            edge_predicate=DEFAULT_EDGE_PREDICATE, src=src)
+        """.format(nt=DEFAULT_NODE_TYPE, et=DEFAULT_EDGE_PREDICATE, tgt=uid)
+        r = self.query(query)
+        edges = []
+        for d in r['q']:
+            for src in d.pop('~' + DEFAULT_EDGE_PREDICATE, []):
+                edges.append(self._parse_edge(
+                    str(src[DEFAULT_NODE_TYPE]), d, DEFAULT_NODE_TYPE,
+                    DEFAULT_EDGE_PREDICATE))
+        return tuple(edges)
 
     def connected(self, node_a: str, node_b: str) -> typing.Tuple[
             bool, typing.Tuple]:
@@ -420,6 +606,9 @@ class Dgraph(Graph):
             log.debug("src_edges are {}".format(src_edges))
             return True, src_edges
 
+    def node_edges(self, node: str) -> typing.Tuple[Edge, ...]:
+        return self.find_edges(node) + self.find_edges_reverse(node)
+
     @staticmethod
     def _parse_types(l: list, ep: str) -> typing.Set[str]:
         st = set()
@@ -493,12 +682,12 @@ class Dgraph(Graph):
 
     @staticmethod
     def _parse_path(d: dict, node_type: str, edge_predicate: str) -> tuple:
-        lt = [Node(value=d[node_type])]
+        lt = [Node(value=str(d[node_type]))]
         while True:
             if edge_predicate not in d:
                 break
             d = d[edge_predicate][0][edge_predicate][0]
-            v = d[node_type]
+            v = str(d[node_type])
             lt.append(Node(value=v))
         return tuple(lt)
 
@@ -565,26 +754,46 @@ class DgraphBulk(Graph):
             Node]:
         pass
 
-    def preload(self, k: int = 11):
+    def preload(self, k: int = 11, values: typing.Iterable[str] = None):
+        """
+        Creates the nodes up front.
+        :param k:
+        :param values: Node values, defaults to every possible kmer of k.
+        :return:
+        """
+        if values is None:
+            values = possible_kmers(k)
         self.nquads = '\n'.join(
             '_:{kmer} <{nt}> "{kmer}" .'.format(
                 kmer=kmer, nt=DEFAULT_NODE_TYPE
             )
-            for kmer in possible_kmers(k)
+            for kmer in values
         )
 
-    def add_edge(self, edge: Edge, echo: bool = True) -> typing.Optional[Edge]:
+    @staticmethod
+    def _edge_nquads(edge: Edge) -> str:
         # The hash is used to ensure blank nodes are unique before assignment
         e = hashlib.sha1("{}{}{}{}".format(
             edge.src, edge.tgt, edge.edge_type, edge.edge_value).encode(
             "utf-8")).hexdigest()
-        self.nquads += """
+        nquads = """
         _:{src} <{et}> _:{e} .
         _:{e} <{et}> _:{tgt} .
         _:{e} <type> "{fl}" .
         _:{e} <value> "{fv}" .
         """.format(src=edge.src, tgt=edge.tgt, fl=edge.edge_type,
                    fv=edge.edge_value, et=DEFAULT_EDGE_PREDICATE, e=e)
+        return nquads + label_nquads('_:{}'.format(e), edge.labels)
+
+    def add_edge(self, edge: Edge, echo: bool = True) -> typing.Optional[Edge]:
+        self.nquads += self._edge_nquads(edge)
+
+    def add_edges(self, edges: typing.Iterable[Edge]):
+        # Joined once instead of growing the string per edge
+        self.nquads += ''.join(self._edge_nquads(edge) for edge in edges)
+
+    def upsert_nodes(self, nodes: typing.Iterable[Node]):
+        pass
 
     def clear(self):
         pass
@@ -631,3 +840,6 @@ class DgraphBulk(Graph):
 
     def path(self, node_a: str, node_b: str) -> tuple:
         pass
+
+    def node_edges(self, node: str) -> typing.Tuple[Edge, ...]:
+        pass
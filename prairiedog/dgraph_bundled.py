@@ -18,9 +18,16 @@ log = logging.getLogger('prairiedog')
 
 offset = 0
 
-with open("dgraph/kmers.schema") as f:
+KMERS_SCHEMA_PATH = "dgraph/kmers.schema"
+# Schema of a graph built with packed keys, where km is an int
+KMERS_PACKED_SCHEMA_PATH = "dgraph/kmers_packed.schema"
+
+with open(KMERS_SCHEMA_PATH) as f:
     KMERS_SCHEMA = ''.join(line for line in f)
 
+with open(KMERS_PACKED_SCHEMA_PATH) as f:
+    KMERS_PACKED_SCHEMA = ''.join(line for line in f)
+
 
 def recommended_lru() -> int:
     vm_bytes = psutil.virtual_memory().total
@@ -132,6 +139,10 @@ class DgraphBundled(Dgraph):
 
     def set_schema(self):
         log.info("Setting dgraph schema...")
+        if self.packed_keys:
+            self.client.alter(
+                pydgraph.Operation(schema=KMERS_PACKED_SCHEMA))
+            return
         self.client.alter(pydgraph.Operation(schema=DgraphBundled.SCHEMA))
         self.client.alter(pydgraph.Operation(schema=KMERS_SCHEMA))
 
@@ -144,7 +155,10 @@ class DgraphBundled(Dgraph):
             self._p_ratel.terminate()
 
     def __init__(self, delete: bool = True, output_folder: str = None,
-                 ratel: bool = False, deploy: bool = False, delay: int = 10):
+                 ratel: bool = False, deploy: bool = False, delay: int = 10,
+                 packed_keys: bool = False):
+        # Node keys are packed kmers, see prairiedog.kmers.kmer_key()
+        self.packed_keys = packed_keys
         # Ratel is the UI
         self.ratel = ratel
         self.delete = delete
@@ -2,7 +2,8 @@ import logging
 import tempfile
 import pathlib
 
-from prairiedog.dgraph_bundled import DgraphBundled
+from prairiedog.dgraph_bundled import DgraphBundled, KMERS_SCHEMA_PATH, \
+    KMERS_PACKED_SCHEMA_PATH
 from dgraph.bulk import run_dgraph_bulk
 
 
@@ -11,7 +12,7 @@ log = logging.getLogger('prairiedog')
 
 class DgraphBundledHelper:
     """For loading arbitrary rdf and testing"""
-    def __init__(self, out_dir: str = None):
+    def __init__(self, out_dir: str = None, packed_keys: bool = False):
         # We have to create the first DgraphBundled instance in a temporary
         # directory and copy the postings from Dgraph Bulk over. Otherwise,
         # the Dgraph subprocesses will fail to start if initialized from the
@@ -22,20 +23,26 @@ class DgraphBundledHelper:
         else:
             self.final_output = pathlib.Path(tempfile.mkdtemp()).resolve()
         self._g = None
+        self.packed_keys = packed_keys
 
     def load(self, rdf_dir: str, delete_after: bool = True) -> pathlib.Path:
         log.info("Loading rdf from {} ...".format(rdf_dir))
         p = pathlib.Path(self.tmp_output, 'dgraph')
         p_final = pathlib.Path(self.final_output, 'dgraph')
         p_final_postings = pathlib.Path(p_final, 'p')
-        self._g = DgraphBundled(delete=False, output_folder=p)
+        self._g = DgraphBundled(delete=False, output_folder=p,
+                                packed_keys=self.packed_keys)
+        schema = KMERS_PACKED_SCHEMA_PATH if self.packed_keys else \
+            KMERS_SCHEMA_PATH
         run_dgraph_bulk(cwd=p, move_to=p_final_postings,
-                        rdfs=rdf_dir, zero_port=self.g.zero_port)
+                        rdfs=rdf_dir, zero_port=self.g.zero_port,
+                        schema=pathlib.Path(schema).resolve())
         # Reinitialize DgraphBundled after moving postings files
         self._g.shutdown_dgraph()
         del self._g
         self._g = DgraphBundled(delete=delete_after,
-                                output_folder=p_final)
+                                output_folder=p_final,
+                                packed_keys=self.packed_keys)
         return p
 
     @property
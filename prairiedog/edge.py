@@ -1,3 +1,12 @@
+import typing
+
+import numpy as np
+
+# Edge label with the strand of the source and target kmers, ie. "+-", when
+# the kmers are canonical
+ORIENTATION_LABEL = 'o'
+
+
 class Edge:
     """
     Defines a set structure for creating edges
@@ -26,3 +35,56 @@ class Edge:
 
     def __str__(self):
         return "prairiedog.edge.Edge with vars {}".format(vars(self))
+
+
+class EdgeBatch:
+    """
+    Consecutive edges of a contig kept as arrays: edge i goes from nodes[i]
+    to nodes[i + 1] with value edge_value + i. Iterating builds an Edge per
+    pair for backends that need them, others read the arrays directly.
+    """
+
+    def __init__(self, nodes: typing.Sequence[str], edge_type: str,
+                 edge_value: int = 0,
+                 orientations: typing.Sequence[str] = None):
+        """
+        :param nodes:
+        :param edge_type:
+        :param edge_value: Value of the first edge.
+        :param orientations: Orientation label of each edge, if canonical.
+        """
+        self.nodes = nodes
+        self.edge_type = edge_type
+        self.edge_value = edge_value
+        self.orientations = orientations
+
+    def __len__(self):
+        return max(len(self.nodes) - 1, 0)
+
+    def __str__(self):
+        return "EdgeBatch of {} edges of {} from value {}".format(
+            len(self), self.edge_type, self.edge_value)
+
+    @property
+    def src(self) -> typing.Sequence[str]:
+        return self.nodes[:-1]
+
+    @property
+    def tgt(self) -> typing.Sequence[str]:
+        return self.nodes[1:]
+
+    @property
+    def values(self) -> np.ndarray:
+        return np.arange(self.edge_value, self.edge_value + len(self),
+                         dtype=np.int64)
+
+    def labels(self, i: int) -> typing.Optional[dict]:
+        if self.orientations is None:
+            return None
+        return {ORIENTATION_LABEL: self.orientations[i]}
+
+    def __iter__(self) -> typing.Iterator[Edge]:
+        for i in range(len(self)):
+            yield Edge(src=self.nodes[i], tgt=self.nodes[i + 1],
+                       edge_type=self.edge_type,
+                       edge_value=self.edge_value + i, labels=self.labels(i))
@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import os
+import typing
+
+log = logging.getLogger("prairiedog")
+
+# Side tables are tab separated lines of: edge type ID, sample, contig
+EDGE_TYPES_EXTENSION = '.tsv'
+
+
+def edge_type_id(contig: str, sample: str) -> str:
+    """
+    Compact ID of the contig of a sample, stored as the edge type instead of
+    the full header. The ID is derived from the names only, so samples can
+    be graphed by separate processes without sharing a counter.
+    :param contig:
+    :param sample:
+    :return: A 63 bit int as a string.
+    """
+    digest = hashlib.sha1("{}\x00{}".format(sample, contig).encode(
+        "utf-8")).digest()
+    return str(int.from_bytes(digest[:8], 'little') >> 1)
+
+
+class EdgeTypes:
+    """
+    Side table of edge type IDs to their sample and contig names.
+    """
+
+    def __init__(self):
+        self.names = {}  # ID : (sample, contig)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, edge_type: str):
+        return edge_type in self.names
+
+    def _set(self, edge_type: str, sample: str, contig: str):
+        names = self.names.get(edge_type)
+        if names is not None and names != (sample, contig):
+            raise ValueError(
+                "Edge type {} is used by both {} and {}".format(
+                    edge_type, names, (sample, contig)))
+        self.names[edge_type] = (sample, contig)
+
+    def add(self, contig: str, sample: str) -> str:
+        """
+        Interns the contig of a sample.
+        :param contig:
+        :param sample:
+        :return: The edge type ID.
+        """
+        edge_type = edge_type_id(contig, sample)
+        self._set(edge_type, sample, contig)
+        return edge_type
+
+    def resolve(self, edge_type: str) -> typing.Tuple[str, str]:
+        """
+        :param edge_type:
+        :return: (sample, contig)
+        """
+        try:
+            return self.names[edge_type]
+        except KeyError:
+            raise KeyError("Unknown edge type {}".format(edge_type))
+
+    def of_sample(self, sample: str) -> 'EdgeTypes':
+        """
+        :param sample:
+        :return: The edge types of the contigs of one sample.
+        """
+        edge_types = EdgeTypes()
+        edge_types.names = {
+            edge_type: names for edge_type, names in self.names.items()
+            if names[0] == sample}
+        return edge_types
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            for edge_type, (sample, contig) in self.names.items():
+                f.write("{}\t{}\t{}\n".format(edge_type, sample, contig))
+        log.debug("Wrote {} edge types to {}".format(len(self), path))
+
+    def update(self, path: str):
+        """
+        Reads a side table written by save(), or every side table in a
+        directory.
+        :param path:
+        :return:
+        """
+        if os.path.isdir(path):
+            for f in sorted(os.listdir(path)):
+                if f.endswith(EDGE_TYPES_EXTENSION):
+                    self.update(os.path.join(path, f))
+            return
+        with open(path) as f:
+            for line in f:
+                edge_type, sample, contig = line.rstrip('\n').split('\t', 2)
+                self._set(edge_type, sample, contig)
+
+    @classmethod
+    def load(cls, path: str) -> 'EdgeTypes':
+        edge_types = cls()
+        edge_types.update(path)
+        return edge_types
@@ -0,0 +1,326 @@
+import codecs
+import gzip
+import io
+import itertools
+import logging
+import os
+import queue
+import threading
+import typing
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = logging.getLogger("prairiedog")
+
+# Number of characters read from the file at a time when streaming
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+FASTA_EXTENSIONS = ('.fna', '.fasta', '.fa')
+# bgzip files are valid gzip files
+COMPRESSED_EXTENSIONS = ('.gz', '.bgz', '.zst')
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Decompressed blocks passed from the background thread to the parser
+DECOMPRESS_BLOCK_SIZE = 1 << 20
+DECOMPRESS_QUEUE_SIZE = 8
+
+
+def is_fasta(path: str) -> bool:
+    """
+    Checks the extension of a possibly compressed FASTA file.
+    :param path:
+    :return:
+    """
+    root, ext = os.path.splitext(path)
+    if ext in COMPRESSED_EXTENSIONS:
+        ext = os.path.splitext(root)[1]
+    return ext in FASTA_EXTENSIONS
+
+
+def sample_name(path: str) -> str:
+    """
+    The file name of a FASTA file without its FASTA and compression
+    extensions, ie. "samples/a.fasta.gz" -> "a".
+    :param path:
+    :return:
+    """
+    name = os.path.basename(path)
+    root, ext = os.path.splitext(name)
+    if ext in COMPRESSED_EXTENSIONS:
+        root, ext = os.path.splitext(root)
+    if ext in FASTA_EXTENSIONS:
+        return root
+    return name
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    Reads a (decompressing) binary stream on a background thread, so
+    decompression overlaps with parsing. At most DECOMPRESS_QUEUE_SIZE
+    blocks are buffered.
+    """
+
+    def __init__(self, stream, block_size: int = DECOMPRESS_BLOCK_SIZE,
+                 queue_size: int = DECOMPRESS_QUEUE_SIZE):
+        super().__init__()
+        self._stream = stream
+        self._block_size = block_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._buffer = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self):
+        try:
+            while not self._stop.is_set():
+                block = self._stream.read(self._block_size)
+                if not block:
+                    break
+                if not self._put(block):
+                    return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and not self._eof:
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+            elif isinstance(item, Exception):
+                self._eof = True
+                raise item
+            else:
+                self._buffer = memoryview(item)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._stream.close()
+        super().close()
+
+
+def _magic(filepath: str) -> bytes:
+    with open(filepath, 'rb') as f:
+        return f.read(4)
+
+
+def is_compressed(filepath: str) -> bool:
+    magic = _magic(filepath)
+    return magic.startswith(GZIP_MAGIC) or magic == ZSTD_MAGIC
+
+
+def open_fasta(filepath: str) -> typing.TextIO:
+    """
+    Opens a FASTA file for reading as text. gzip, bgzip and zstd compressed
+    files are recognised by their magic bytes and decompressed on a
+    background thread.
+    :param filepath:
+    :return:
+    """
+    magic = _magic(filepath)
+    if magic.startswith(GZIP_MAGIC):
+        stream = gzip.open(filepath, 'rb')
+    elif magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ImportError(
+                "The zstandard package is required to read {}".format(
+                    filepath))
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            open(filepath, 'rb'), closefd=True)
+    else:
+        return open(filepath)
+    log.debug("Decompressing {} on a background thread".format(filepath))
+    return io.TextIOWrapper(io.BufferedReader(
+        ThreadedReader(stream), buffer_size=DECOMPRESS_BLOCK_SIZE))
+
+
+def contig_offsets(filepath: str,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> typing.List[int]:
+    """
+    Byte offsets of every header in an uncompressed FASTA file.
+    :param filepath:
+    :param chunk_size:
+    :return:
+    """
+    offsets = []
+    pos = 0
+    # The previous block ended a line, or this is the start of the file
+    line_start = True
+    with open(filepath, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            if line_start and block.startswith(b'>'):
+                offsets.append(pos)
+            i = block.find(b'\n>')
+            while i != -1:
+                offsets.append(pos + i + 1)
+                i = block.find(b'\n>', i + 1)
+            line_start = block.endswith(b'\n')
+            pos += len(block)
+    return offsets
+
+
+def contig_ranges(filepath: str,
+                  n: int) -> typing.List[typing.Tuple[int, int]]:
+    """
+    Splits an uncompressed FASTA file into at most n byte ranges of similar
+    size, each one starting at a contig header.
+    :param filepath:
+    :param n:
+    :return: List of (start, end) byte offsets.
+    """
+    size = os.path.getsize(filepath)
+    target = size / max(n, 1)
+    ranges = []
+    start = 0
+    for offset in contig_offsets(filepath):
+        if offset - start >= target:
+            ranges.append((start, offset))
+            start = offset
+    if start < size or not ranges:
+        ranges.append((start, size))
+    return ranges
+
+
+def _read_blocks(filepath: str, chunk_size: int, start: int = 0,
+                 end: int = None) -> typing.Generator:
+    if start == 0 and end is None:
+        with open_fasta(filepath) as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    return
+                yield block
+    # Byte ranges are only supported for uncompressed files
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        remaining = (os.path.getsize(filepath) if end is None else end) - start
+        while remaining > 0:
+            raw = f.read(min(chunk_size, remaining))
+            if not raw:
+                break
+            remaining -= len(raw)
+            block = decoder.decode(raw, final=remaining <= 0)
+            if block:
+                yield block
+
+
+def read_fasta_chunks(filepath: str,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE, start: int = 0,
+                      end: int = None) -> typing.Generator:
+    """
+    Streams a FASTA file in fixed size blocks and emits the sequence data as
+    pieces, never holding more than one block of the file in memory.
+    Multiline sequences are handled as newlines are dropped from the pieces.
+    Every contig emits an empty piece when its header is read so that contigs
+    without sequence still show up.
+    :param filepath:
+    :param chunk_size: Number of characters read from the file at a time.
+    :param start: Byte offset to start reading from, ie. from
+        contig_ranges(). Only supported for uncompressed files.
+    :param end: Byte offset to stop reading at.
+    :return: Generator of (contig index, header, sequence piece).
+    """
+    contig = -1
+    header = ""
+    # Header text is accumulated here if it spans two blocks
+    partial_header = None
+    for block in _read_blocks(filepath, chunk_size, start, end):
+        pos = 0
+        n = len(block)
+        while pos < n:
+            if partial_header is not None:
+                nl = block.find("\n", pos)
+                if nl == -1:
+                    partial_header += block[pos:]
+                    pos = n
+                    continue
+                header = (partial_header + block[pos:nl]).rstrip()
+                partial_header = None
+                contig += 1
+                pos = nl + 1
+                yield contig, header, ""
+                continue
+            gt = block.find(">", pos)
+            stop = n if gt == -1 else gt
+            piece = block[pos:stop].replace("\n", "").replace("\r", "")
+            if piece:
+                if contig == -1:
+                    # Sequence before any header, treat as one contig
+                    contig = 0
+                yield contig, header, piece
+            if gt == -1:
+                pos = n
+            else:
+                partial_header = ">"
+                pos = gt + 1
+    # A header on the last line without a trailing newline
+    if partial_header is not None:
+        yield contig + 1, partial_header.rstrip(), ""
+
+
+def read_fasta_contigs(filepath: str,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE, start: int = 0,
+                       end: int = None) -> typing.Generator:
+    """
+    Groups the pieces from read_fasta_chunks() by contig. The piece generator
+    of each contig is lazy, so a contig is never fully loaded into memory as
+    long as it is consumed piece by piece.
+    :param filepath:
+    :param chunk_size:
+    :param start:
+    :param end:
+    :return: Generator of (header, generator of sequence pieces).
+    """
+    chunks = read_fasta_chunks(filepath, chunk_size, start, end)
+    for _, group in itertools.groupby(chunks, key=lambda c: c[0]):
+        first = next(group)
+        header = first[1]
+        pieces = itertools.chain(
+            (first[2],), (piece for _, _, piece in group))
+        yield header, pieces
+
+
+def kmers_from_pieces(pieces: typing.Iterable[str],
+                      k: int) -> typing.Generator:
+    """
+    Emits every kmer of a sequence given as consecutive pieces. The last k-1
+    bases of a piece are carried over so kmers spanning two pieces are kept.
+    :param pieces:
+    :param k:
+    :return: Generator of kmer strings.
+    """
+    carry = ""
+    for piece in pieces:
+        s = carry + piece
+        for i in range(len(s) - k + 1):
+            yield s[i: i + k]
+        carry = s[max(0, len(s) - k + 1):]
@@ -0,0 +1,203 @@
+import logging
+import os
+import typing
+
+from prairiedog.fasta import is_compressed, read_fasta_contigs
+
+log = logging.getLogger("prairiedog")
+
+FAI_EXTENSION = '.fai'
+# Flat copy of a compressed FASTA file, which the index points into
+SEQ_EXTENSION = '.seq'
+
+
+class FastaIndex:
+    """
+    Offsets of the contigs of a FASTA file, as in a samtools .fai index, so
+    any range of a contig is read with a single seek. Compressed files can't
+    be seeked into, so their contigs are copied to a flat uncompressed file
+    next to the index instead.
+
+    The index is a tab separated file with the file the offsets point into
+    and the sample on its first line, then a line per contig of: length,
+    offset of the first base, bases per line, bytes per line, number of
+    bases other than ACGT, header. Bases per line is 0 for contigs with lines
+    of irregular length.
+    """
+
+    def __init__(self, source: str, sample: str = None):
+        """
+        :param source: File the offsets point into.
+        :param sample: Name of the sample as in Kmers, ie. the file name of
+            the FASTA file.
+        """
+        self.source = source
+        self.sample = sample if sample is not None else \
+            os.path.basename(source)
+        # Header : (length, offset, line bases, line width, invalid bases)
+        self.contigs = {}
+
+    def __len__(self):
+        return len(self.contigs)
+
+    def __contains__(self, header: str):
+        return header in self.contigs
+
+    def __str__(self):
+        return "FastaIndex of {}".format(self.sample)
+
+    def _scan(self):
+        header = None
+        length = offset = line_bases = line_width = invalid = 0
+        # A line shorter than the first has been seen, it must be the last
+        short = False
+        pos = 0
+        with open(self.source, 'rb') as f:
+            for line in f:
+                if line.startswith(b'>'):
+                    if header is not None:
+                        self.contigs[header] = (
+                            length, offset, line_bases, line_width, invalid)
+                    # Same header as Kmers, which strips the line
+                    header = line.decode('utf-8', 'replace').rstrip()
+                    length = line_bases = line_width = invalid = 0
+                    offset = pos + len(line)
+                    short = False
+                elif header is not None:
+                    seq = line.rstrip()
+                    bases = len(seq)
+                    invalid += len(seq.translate(None, b'ACGTacgt'))
+                    if length == 0 and line_width == 0:
+                        line_bases, line_width = bases, len(line)
+                    elif short or bases > line_bases or (
+                            bases == line_bases and len(line) != line_width):
+                        line_bases = 0
+                    if bases < line_bases:
+                        short = True
+                    length += bases
+                pos += len(line)
+        if header is not None:
+            self.contigs[header] = (
+                length, offset, line_bases, line_width, invalid)
+
+    @classmethod
+    def build(cls, filepath: str, path: str = None) -> 'FastaIndex':
+        """
+        :param filepath: FASTA file, possibly compressed.
+        :param path: Where the index is saved, required for compressed files
+            as the flat copy is written next to it.
+        :return:
+        """
+        sample = os.path.basename(filepath)
+        if is_compressed(filepath):
+            if path is None:
+                raise ValueError(
+                    "Indexing compressed file {} needs a path for the index"
+                    "".format(filepath))
+            source = path + SEQ_EXTENSION
+            os.makedirs(os.path.dirname(os.path.abspath(source)),
+                        exist_ok=True)
+            with open(source, 'w') as f:
+                for header, pieces in read_fasta_contigs(filepath):
+                    f.write(header + '\n')
+                    for piece in pieces:
+                        f.write(piece)
+                    f.write('\n')
+            log.debug("Copied the contigs of {} to {}".format(
+                filepath, source))
+        else:
+            source = filepath
+        index = cls(source, sample)
+        index._scan()
+        if path is not None:
+            index.save(path)
+        return index
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write("{}\t{}\n".format(self.source, self.sample))
+            for header, entry in self.contigs.items():
+                f.write("{}\t{}\t{}\t{}\t{}\t{}\n".format(*entry, header))
+        log.debug("Wrote index of {} contigs to {}".format(len(self), path))
+
+    @classmethod
+    def load(cls, path: str) -> 'FastaIndex':
+        with open(path) as f:
+            source, sample = f.readline().rstrip('\n').split('\t', 1)
+            index = cls(source, sample)
+            for line in f:
+                *entry, header = line.rstrip('\n').split('\t', 5)
+                index.contigs[header] = tuple(int(v) for v in entry)
+        return index
+
+    def fetch(self, header: str, start: int, end: int) -> str:
+        """
+        Reads bases start to end of a contig as one byte range.
+        :param header:
+        :param start:
+        :param end:
+        :return: The bases, in upper case as the kmers are.
+        """
+        length, offset, line_bases, line_width, _ = self.contigs[header]
+        end = min(end, length)
+        if start >= end:
+            return ""
+        with open(self.source, 'rb') as f:
+            if line_bases == 0:
+                # Irregular lines, read from the start of the contig
+                f.seek(offset)
+                seq = b''
+                while len(seq) < end:
+                    line = f.readline()
+                    if not line or line.startswith(b'>'):
+                        break
+                    seq += line.rstrip()
+                return seq[start:end].decode('ascii').upper()
+            first = offset + start // line_bases * line_width + \
+                start % line_bases
+            last = offset + (end - 1) // line_bases * line_width + \
+                (end - 1) % line_bases
+            f.seek(first)
+            raw = f.read(last - first + 1)
+        return raw.replace(b'\n', b'').replace(b'\r', b'').decode(
+            'ascii').upper()
+
+
+class FastaIndexes:
+    """
+    Indexes of many samples, ie. every index in a directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._indexes = {}  # Sample : index
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                     if f.endswith(FAI_EXTENSION)]
+        else:
+            files = [path]
+        for f in files:
+            index = FastaIndex.load(f)
+            self._indexes[index.sample] = index
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def __contains__(self, sample: str):
+        return sample in self._indexes
+
+    def fetch(self, sample: str, header: str, start: int,
+              end: int) -> typing.Optional[str]:
+        """
+        Reads bases start to end of a contig, where start and end are
+        positions of its kmers in the graph.
+        :return: None if the contig isn't indexed, or has bases other than
+            ACGT as the kmers spanning them aren't graphed, so a range
+            crossing them isn't a path of the graph.
+        """
+        index = self._indexes.get(sample)
+        if index is None or header not in index or \
+                index.contigs[header][4] > 0:
+            return None
+        return index.fetch(header, start, end)
@@ -27,6 +27,40 @@ class Graph(metaclass=abc.ABCMeta):
     def add_edge(self, edge: Edge, echo: bool = True) -> typing.Optional[Edge]:
         pass
 
+    def upsert_nodes(self, nodes: typing.Iterable[Node]):
+        """
+        Upsert many nodes at once. Backends override this with a faster path
+        than one upsert_node() call per node.
+        :param nodes: Nodes, or a NodeBatch whose values backends may read
+            without building a Node each.
+        :return:
+        """
+        for node in nodes:
+            self.upsert_node(node, echo=False)
+
+    def add_edges(self, edges: typing.Iterable[Edge]):
+        """
+        Add many edges at once. Backends override this with a faster path
+        than one add_edge() call per edge.
+        :param edges: Edges, or an EdgeBatch whose arrays backends may read
+            without building an Edge each.
+        :return:
+        """
+        for edge in edges:
+            self.add_edge(edge, echo=False)
+
+    def remove_sample(self, edge_types: typing.Iterable[str]) -> int:
+        """
+        Removes every edge of the given edge types, ie. the contigs of a
+        sample from EdgeTypes, then the nodes left without any edge. Backends
+        find the edges through an index on the edge type, so this takes time
+        proportional to the size of the sample.
+        :param edge_types:
+        :return: Number of edges removed.
+        """
+        raise NotImplementedError(
+            "{} can't remove samples".format(type(self).__name__))
+
     @abc.abstractmethod
     def clear(self):
         pass
@@ -79,6 +113,55 @@ class Graph(metaclass=abc.ABCMeta):
     def path(self, node_a: str, node_b: str) -> typing.Tuple[tuple, tuple]:
         pass
 
+    def path_spans(self, node_a: str, node_b: str) -> typing.Tuple[
+            typing.Tuple[str, int, int, dict], ...]:
+        """
+        Where the paths from node_a to node_b are on their contigs, without
+        walking them. Edge i of a contig goes from its kmer at position i to
+        the one at i + 1.
+        :param node_a:
+        :param node_b:
+        :return: Tuple of (edge type, value of the first edge, value of the
+            last edge, meta as in path()), or None if the nodes are connected
+            but no span was found, so the paths have to be walked.
+        """
+        connected, src_edges = self.connected(node_a, node_b)
+        if not connected:
+            return ()
+        tgt_edges = self._edges_to(node_b)
+        spans = []
+        for src_edge in src_edges:
+            for tgt_edge in tgt_edges:
+                if tgt_edge.edge_type == src_edge.edge_type and \
+                        tgt_edge.edge_value >= src_edge.edge_value:
+                    spans.append((
+                        src_edge.edge_type, src_edge.edge_value,
+                        tgt_edge.edge_value,
+                        {'edge_type': src_edge.edge_type,
+                         **(src_edge.labels or {})}))
+        if not spans:
+            log.debug("No spans found from {} to {}".format(node_a, node_b))
+            return None
+        return tuple(spans)
+
+    def _edges_to(self, node: str) -> typing.Tuple[Edge, ...]:
+        """
+        Edges reaching a node. Backends whose edges don't hold the value of
+        their target override this.
+        :param node:
+        :return:
+        """
+        return tuple(e for e in self.node_edges(node) if e.tgt == node)
+
+    @abc.abstractmethod
+    def node_edges(self, node: str) -> typing.Tuple[Edge, ...]:
+        """
+        Edges from or to a node.
+        :param node:
+        :return:
+        """
+        pass
+
     @staticmethod
     def matching_edges(src_edges: typing.Tuple[Edge],
                        tgt_edges: typing.Tuple[Edge]) -> typing.Tuple[
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import struct
+import typing
+
+import numpy as np
+
+log = logging.getLogger("prairiedog")
+
+# Binary kmer file layout, all little endian:
+#   - HEADER_FORMAT: magic, version, k, itemsize, flags, n_runs, n_kmers,
+#     run table offset, metadata offset, metadata length
+#   - packed kmers of every run back to back, starting at KMERS_OFFSET
+#   - run table, one RUN_DTYPE record per run of consecutive kmers
+#   - JSON metadata with the source file, contig headers and counts
+MAGIC = b'PDKMERS\x00'
+VERSION = 1
+HEADER_FORMAT = '<8sIIIIQQQQQ'
+KMERS_OFFSET = 64
+
+RUN_DTYPE = np.dtype([
+    ('contig', '<u4'),  # Index into the contig headers
+    ('start', '<u8'),  # Position of the first kmer in the contig
+    ('offset', '<u8'),  # Index of the first kmer in the packed kmers
+    ('length', '<u8'),  # Number of kmers in the run
+])
+
+
+def is_kmer_file(path: str) -> bool:
+    """
+    Checks for the magic bytes of a binary kmer file.
+    :param path:
+    :return:
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_kmer_file(path: str, k: int, dtype: np.dtype,
+                    runs: typing.Iterable[typing.Tuple[int, np.ndarray, int]],
+                    headers: typing.List[str], meta: dict = None,
+                    flags: int = 0) -> int:
+    """
+    Writes packed kmers to a binary kmer file. Runs are written as they come
+    in so only the run table is kept in memory.
+    :param path:
+    :param k:
+    :param dtype: Packed kmer type, ie. from prairiedog.kmers.packed_dtype().
+    :param runs: Iterable of (contig index, packed kmers, position of the first
+        kmer in the contig).
+    :param headers: Contig headers, indexed by the contig index of the runs.
+        Can be filled while the runs are consumed.
+    :param meta: Additional metadata to store.
+    :param flags:
+    :return: Number of kmers written.
+    """
+    dtype = np.dtype(dtype).newbyteorder('<')
+    table = []
+    n_kmers = 0
+    with open(path, 'wb') as f:
+        f.write(b'\x00' * KMERS_OFFSET)
+        for contig, values, start in runs:
+            values = np.ascontiguousarray(values, dtype=dtype)
+            f.write(values.tobytes())
+            table.append((contig, start, n_kmers, len(values)))
+            n_kmers += len(values)
+        table_offset = f.tell()
+        f.write(np.array(table, dtype=RUN_DTYPE).tobytes())
+        meta_offset = f.tell()
+        meta = dict(meta) if meta is not None else {}
+        meta['headers'] = list(headers)
+        meta_bytes = json.dumps(meta).encode('utf-8')
+        f.write(meta_bytes)
+        f.seek(0)
+        f.write(struct.pack(
+            HEADER_FORMAT, MAGIC, VERSION, k, dtype.itemsize, flags,
+            len(table), n_kmers, table_offset, meta_offset, len(meta_bytes)))
+    log.debug("Wrote {} kmers in {} runs to {}".format(
+        n_kmers, len(table), path))
+    return n_kmers
+
+
+class KmerFile:
+    """
+    Read-only view of a binary kmer file. The packed kmers are memory-mapped,
+    so opening is cheap and pages are shared between processes reading the
+    same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(struct.calcsize(HEADER_FORMAT))
+            (magic, version, self.k, itemsize, self.flags, n_runs,
+             self.n_kmers, table_offset, meta_offset,
+             meta_length) = struct.unpack(HEADER_FORMAT, header)
+            if magic != MAGIC:
+                raise ValueError("{} is not a kmer file".format(path))
+            if version > VERSION:
+                raise ValueError(
+                    "Kmer file {} has version {}, only <= {} is "
+                    "supported".format(path, version, VERSION))
+            f.seek(table_offset)
+            self.runs = np.frombuffer(
+                f.read(n_runs * RUN_DTYPE.itemsize), dtype=RUN_DTYPE)
+            f.seek(meta_offset)
+            self.meta = json.loads(f.read(meta_length).decode('utf-8'))
+        self.headers = self.meta.pop('headers')
+        self.dtype = np.dtype('<u{}'.format(itemsize))
+        if self.n_kmers == 0:
+            self.kmers = np.empty(0, dtype=self.dtype)
+        else:
+            self.kmers = np.memmap(path, dtype=self.dtype, mode='r',
+                                   offset=KMERS_OFFSET,
+                                   shape=(self.n_kmers,))
+
+    def __len__(self):
+        return self.n_kmers
+
+    def __str__(self):
+        return os.path.basename(self.path)
+
+    def iter_runs(self) -> typing.Generator:
+        """
+        :return: Generator of (contig index, packed kmers, position of the
+            first kmer in the contig).
+        """
+        for run in self.runs:
+            offset = int(run['offset'])
+            yield (int(run['contig']),
+                   self.kmers[offset: offset + int(run['length'])],
+                   int(run['start']))
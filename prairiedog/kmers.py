@@ -2,15 +2,33 @@ import logging
 import time
 import os
 import itertools
+import multiprocessing
 import typing
 
+import dill
+import numpy as np
+
 from prairiedog import recommended_procs
+from prairiedog.fasta import (DEFAULT_CHUNK_SIZE, read_fasta_contigs,
+                              kmers_from_pieces, open_fasta, is_compressed,
+                              contig_ranges)
+from prairiedog.kmer_file import (KmerFile, is_kmer_file, write_kmer_file,
+                                  RUN_DTYPE)
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # Python < 3.8, results are pickled back to the parent instead
+    shared_memory = None
 
 log = logging.getLogger("prairiedog")
 
 
 GB_PER_PROC_KMERS = 5
 
+# Default number of kmers per array emitted by Kmers.iter_batches()
+BATCH_SIZE = 1 << 16
+
 recommended_procs_kmers = recommended_procs(GB_PER_PROC_KMERS)
 
 
@@ -24,10 +42,508 @@ def possible_kmers(k: int = 11) -> typing.Generator:
     return kmers
 
 
+#########
+# 2-bit packed kmers
+#########
+
+# Bases are ordered so packed kmers sort the same way as their strings
+BASES = 'ACGT'
+INVALID_BASE = 4
+MAX_PACKED_K = 32
+
+# Lookup table from an ASCII byte to its 2-bit code, soft-masked (lowercase)
+# bases are treated as their uppercase equivalent
+_BASE_CODES = np.full(256, INVALID_BASE, dtype=np.uint8)
+for _code, _base in enumerate(BASES):
+    _BASE_CODES[ord(_base)] = _code
+    _BASE_CODES[ord(_base.lower())] = _code
+_CODE_BASES = np.frombuffer(BASES.encode('ascii'), dtype=np.uint8)
+
+
+def packed_dtype(k: int) -> np.dtype:
+    """
+    The smallest unsigned integer type that holds a kmer of length k at 2
+    bits per base.
+    :param k:
+    :return:
+    """
+    if k < 1 or k > MAX_PACKED_K:
+        raise ValueError(
+            "Packed kmers support 1 <= K <= {}, got {}".format(
+                MAX_PACKED_K, k))
+    if k <= 16:
+        return np.dtype(np.uint32)
+    return np.dtype(np.uint64)
+
+
+def encode_kmer(kmer: str) -> int:
+    """
+    Packs a kmer string into an int at 2 bits per base.
+    :param kmer:
+    :return:
+    """
+    packed_dtype(len(kmer))
+    value = 0
+    for base in kmer:
+        code = INVALID_BASE if ord(base) > 0xff else _BASE_CODES[ord(base)]
+        if code == INVALID_BASE:
+            raise ValueError(
+                "Can't pack base {} in kmer {}".format(base, kmer))
+        value = (value << 2) | int(code)
+    return value
+
+
+def decode_kmer(value: int, k: int) -> str:
+    """
+    Unpacks an int created by encode_kmer() back into a kmer string.
+    :param value:
+    :param k:
+    :return:
+    """
+    value = int(value)
+    return ''.join(
+        BASES[(value >> (2 * (k - 1 - i))) & 3] for i in range(k))
+
+
+def _decode_bytes(values: np.ndarray, k: int) -> np.ndarray:
+    values = np.asarray(values, dtype=np.uint64)
+    shifts = np.arange(2 * (k - 1), -1, -2, dtype=np.uint64)
+    codes = (values[:, None] >> shifts) & np.uint64(3)
+    chars = np.ascontiguousarray(_CODE_BASES[codes])
+    return chars.view('S{}'.format(k)).ravel()
+
+
+def decode_kmers(values: np.ndarray, k: int) -> typing.List[str]:
+    """
+    Vectorized decode_kmer() for an array of packed kmers.
+    :param values:
+    :param k:
+    :return:
+    """
+    return [b.decode('ascii') for b in _decode_bytes(values, k)]
+
+
+#########
+# Packed node keys
+#########
+
+def kmer_key(kmer: str) -> str:
+    """
+    Key of a kmer in a graph built with packed keys: its packed int as a
+    decimal string, ie. at most 7 characters for k = 11 instead of 11, and a
+    numeric index in Dgraph.
+    :param kmer:
+    :return:
+    """
+    return str(encode_kmer(kmer))
+
+
+def key_kmer(key, k: int) -> str:
+    """
+    Reverses kmer_key(), the key may also be an int as Dgraph returns it.
+    :param key:
+    :param k:
+    :return:
+    """
+    return decode_kmer(int(key), k)
+
+
+def kmer_keys(kmers: np.ndarray) -> typing.List[str]:
+    """
+    Vectorized kmer_key() for a NumPy string array of kmers, ie. a batch
+    from Kmers.iter_batches().
+    :param kmers:
+    :return:
+    """
+    kmers = np.asarray(kmers)
+    if len(kmers) == 0:
+        return []
+    k = len(kmers[0])
+    dtype = packed_dtype(k)
+    codes = _BASE_CODES[np.frombuffer(
+        kmers.astype('S{}'.format(k)).tobytes(), dtype=np.uint8)].reshape(
+        -1, k)
+    invalid = (codes == INVALID_BASE).any(axis=1)
+    if invalid.any():
+        raise ValueError("Can't pack kmer {} into a node key".format(
+            kmers[np.argmax(invalid)]))
+    values = np.zeros(len(kmers), dtype=dtype)
+    for i in range(k):
+        values <<= dtype.type(2)
+        values |= codes[:, i].astype(dtype)
+    return values.astype(str).tolist()
+
+
+def packed_kmer_keys(k: int = 11) -> typing.Generator:
+    """
+    Keys of every possible kmer of k, as possible_kmers() for a graph built
+    with packed keys.
+    :param k:
+    :return:
+    """
+    packed_dtype(k)
+    return (str(v) for v in range(4 ** k))
+
+
+def _encode_codes(seq: str,
+                  k: int) -> typing.Tuple[np.ndarray, np.ndarray, int]:
+    n = len(seq) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint8), np.empty(0, dtype=bool), 0
+    raw = np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)
+    codes = _BASE_CODES[raw]
+    # Count invalid bases in every window via a cumulative sum
+    invalid = np.concatenate(
+        ([0], np.cumsum(codes == INVALID_BASE, dtype=np.int64)))
+    valid = (invalid[k:] - invalid[:-k]) == 0
+    return codes & 3, valid, n
+
+
+def encode_sequence(seq: str, k: int, canonical: bool = False
+                    ) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Packs every kmer of a sequence. Each kmer is computed with the rolling
+    update value = (value << 2) | base, applied to all positions of the
+    sequence at once, so the work is k vectorized steps regardless of the
+    sequence length. Kmers containing bases other than ACGT can't be packed
+    and are flagged in the returned mask.
+    :param seq:
+    :param k:
+    :param canonical: Emit the smaller of each kmer and its reverse
+        complement.
+    :return: The packed kmers and a boolean mask of which ones are valid.
+    """
+    if canonical:
+        forward, reverse, valid = encode_sequence_strands(seq, k)
+        return np.minimum(forward, reverse), valid
+    dtype = packed_dtype(k)
+    codes, valid, n = _encode_codes(seq, k)
+    codes = codes.astype(dtype)
+    values = np.zeros(n, dtype=dtype)
+    for i in range(k):
+        values <<= dtype.type(2)
+        values |= codes[i: i + n]
+    return values, valid
+
+
+def encode_sequence_strands(seq: str, k: int) -> typing.Tuple[
+        np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Packs every kmer of a sequence and its reverse complement. The reverse
+    complement is rolled alongside the kmer with the O(1) update
+    rc = (rc >> 2) | ((3 - base) << 2 * (k - 1)).
+    :param seq:
+    :param k:
+    :return: The packed kmers, their packed reverse complements and a boolean
+        mask of which ones are valid.
+    """
+    dtype = packed_dtype(k)
+    codes, valid, n = _encode_codes(seq, k)
+    codes = codes.astype(dtype)
+    complements = dtype.type(3) - codes
+    top = dtype.type(2 * (k - 1))
+    forward = np.zeros(n, dtype=dtype)
+    reverse = np.zeros(n, dtype=dtype)
+    for i in range(k):
+        forward <<= dtype.type(2)
+        forward |= codes[i: i + n]
+        reverse >>= dtype.type(2)
+        reverse |= complements[i: i + n] << top
+    return forward, reverse, valid
+
+
+_COMPLEMENTS = str.maketrans('ACGTacgt', 'TGCAtgca')
+
+
+def reverse_complement(kmer: str) -> str:
+    return kmer.translate(_COMPLEMENTS)[::-1]
+
+
+def reverse_complement_packed(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Vectorized reverse complement of packed kmers.
+    :param values:
+    :param k:
+    :return:
+    """
+    dtype = packed_dtype(k)
+    complements = ~np.asarray(values, dtype=dtype)
+    reverse = np.zeros(len(complements), dtype=dtype)
+    for _ in range(k):
+        reverse <<= dtype.type(2)
+        reverse |= complements & dtype.type(3)
+        complements >>= dtype.type(2)
+    return reverse
+
+
+#########
+# Kmer string arrays
+#########
+
+_COMPLEMENT_BYTES = np.arange(256, dtype=np.uint8)
+for _base, _complement in zip('ACGTacgt', 'TGCAtgca'):
+    _COMPLEMENT_BYTES[ord(_base)] = ord(_complement)
+
+
+def sequence_kmers(seq: str, k: int) -> np.ndarray:
+    """
+    Every kmer of a sequence as a NumPy bytes array, including kmers with
+    bases other than ACGT, which can't be packed.
+    :param seq:
+    :param k:
+    :return: Array of dtype S<k>.
+    """
+    n = len(seq) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype='S{}'.format(k))
+    raw = np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)
+    windows = np.lib.stride_tricks.as_strided(
+        raw, shape=(n, k), strides=(raw.strides[0], raw.strides[0]),
+        writeable=False)
+    return np.ascontiguousarray(windows).view('S{}'.format(k)).ravel()
+
+
+def reverse_complement_kmers(kmers: np.ndarray, k: int) -> np.ndarray:
+    """
+    Vectorized reverse_complement() for an array from sequence_kmers().
+    :param kmers:
+    :param k:
+    :return:
+    """
+    chars = np.ascontiguousarray(kmers).view(np.uint8).reshape(-1, k)
+    return np.ascontiguousarray(
+        _COMPLEMENT_BYTES[chars[:, ::-1]]).view('S{}'.format(k)).ravel()
+
+
+def canonical_kmer(kmer: str) -> str:
+    """
+    The lexicographically smaller of a kmer and its reverse complement. This
+    matches the numerically smaller of their packed values.
+    :param kmer:
+    :return:
+    """
+    rc = reverse_complement(kmer)
+    return rc if rc < kmer else kmer
+
+
+def split_valid(values: np.ndarray, valid: np.ndarray,
+                offset: int = 0) -> typing.Generator:
+    """
+    Splits packed kmers into runs of consecutive valid kmers.
+    :param values:
+    :param valid:
+    :param offset: Position of values[0] in the contig.
+    :return: Generator of (packed kmers, position of the first kmer).
+    """
+    if len(values) == 0:
+        return
+    # Indices where a run of valid kmers starts or stops
+    edges = np.flatnonzero(
+        np.diff(np.concatenate(([False], valid, [False])).astype(np.int8)))
+    for start, end in zip(edges[::2], edges[1::2]):
+        yield values[start:end], offset + int(start)
+
+
+def encode_pieces(pieces: typing.Iterable[str],
+                  k: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    encode_sequence() for a sequence given as consecutive pieces.
+    :param pieces:
+    :param k:
+    :return:
+    """
+    values = []
+    valid = []
+    carry = ""
+    for piece in pieces:
+        s = carry + piece
+        v, m = encode_sequence(s, k)
+        values.append(v)
+        valid.append(m)
+        carry = s[max(0, len(s) - k + 1):]
+    if len(values) == 1:
+        return values[0], valid[0]
+    return np.concatenate(values), np.concatenate(valid)
+
+
+#########
+# Parallel extraction
+#########
+
+# A file is split into this many contig groups per process to balance load
+RANGES_PER_PROC = 4
+
+
+def _share(values: np.ndarray) -> tuple:
+    if shared_memory is None:
+        return None, values
+    shm = shared_memory.SharedMemory(create=True,
+                                     size=max(values.nbytes, 1))
+    np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+    # The parent unlinks the block once it's copied out, don't let the
+    # worker's resource tracker remove it when the worker exits
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    shm.close()
+    return shm.name, (values.dtype.str, len(values))
+
+
+def _receive(name: typing.Optional[str], values) -> np.ndarray:
+    if name is None:
+        return values
+    dtype, n = values
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray((n,), dtype=dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _encode_range(args: tuple) -> tuple:
+    """
+    Process pool worker, encodes the contigs in a byte range of a FASTA file.
+    :param args: (filepath, start, end, k, chunk_size)
+    :return: (headers, indices of contigs shorter than k, run table,
+        shared memory name, packed kmers). Without shared memory support the
+        name is None and the packed kmers are pickled back, otherwise only
+        their dtype and length are.
+    """
+    filepath, start, end, k, chunk_size = args
+    headers = []
+    short = []
+    runs = []
+    arrays = []
+    n = 0
+    for i, (header, pieces) in enumerate(
+            read_fasta_contigs(filepath, chunk_size, start, end)):
+        headers.append(header)
+        values, valid = encode_pieces(pieces, k)
+        if len(values) == 0:
+            short.append(i)
+            continue
+        for run, run_start in split_valid(values, valid):
+            runs.append((i, run_start, n, len(run)))
+            arrays.append(run)
+            n += len(run)
+    if arrays:
+        values = np.concatenate(arrays)
+    else:
+        values = np.empty(0, dtype=packed_dtype(k))
+    name, shared = _share(values)
+    return headers, short, np.array(runs, dtype=RUN_DTYPE), name, shared
+
+
+def _read_range(args: tuple) -> tuple:
+    """
+    Process pool worker, reads the contigs in a byte range of a FASTA file.
+    :param args: (filepath, start, end, chunk_size)
+    :return: (headers, length of each sequence, shared memory name, bases),
+        the bases of all the sequences are returned as in _encode_range().
+    """
+    filepath, start, end, chunk_size = args
+    headers = []
+    sequences = []
+    for header, pieces in read_fasta_contigs(filepath, chunk_size, start,
+                                             end):
+        headers.append(header)
+        sequences.append(''.join(pieces))
+    bases = np.frombuffer(''.join(sequences).encode('latin-1'),
+                          dtype=np.uint8)
+    name, shared = _share(bases)
+    return headers, [len(s) for s in sequences], name, shared
+
+
+class KmerCounts:
+    """
+    Result of count_kmers().
+    """
+
+    def __init__(self, unique: int, total: int,
+                 histogram: np.ndarray = None):
+        self.unique = unique
+        self.total = total
+        # histogram[i] is the number of distinct kmers seen exactly i times
+        self.histogram = histogram
+
+    def __str__(self):
+        return "prairiedog.kmers.KmerCounts with vars {}".format(vars(self))
+
+
+def _merge_counts(uniques: typing.List[np.ndarray],
+                  counts: typing.List[np.ndarray]) -> typing.Tuple[
+        np.ndarray, np.ndarray]:
+    if len(uniques) == 1:
+        return uniques[0], counts[0]
+    merged, inverse = np.unique(np.concatenate(uniques), return_inverse=True)
+    merged_counts = np.bincount(
+        inverse.ravel(), weights=np.concatenate(counts),
+        minlength=len(merged)).astype(np.int64)
+    return merged, merged_counts
+
+
+def count_kmers(arrays: typing.Iterable[np.ndarray], histogram: bool = False,
+                merge_size: int = 1 << 24) -> KmerCounts:
+    """
+    Counts packed kmers. Each array is reduced with np.unique() and the
+    per-array results are merged whenever more than merge_size distinct kmers
+    are pending, so memory stays bounded by the number of distinct kmers.
+    :param arrays: Packed kmers, ie. from Kmers.iter_packed().
+    :param histogram: Also compute how many distinct kmers occur 1, 2, ...
+        times.
+    :param merge_size:
+    :return:
+    """
+    uniques = []
+    counts = []
+    pending = 0
+    total = 0
+    for values in arrays:
+        if len(values) == 0:
+            continue
+        total += len(values)
+        u, c = np.unique(values, return_counts=True)
+        uniques.append(u)
+        counts.append(c)
+        pending += len(u)
+        if pending > merge_size:
+            u, c = _merge_counts(uniques, counts)
+            uniques, counts = [u], [c]
+            pending = len(u)
+    if not uniques:
+        return KmerCounts(0, 0, np.zeros(1, dtype=np.int64)
+                          if histogram else None)
+    u, c = _merge_counts(uniques, counts)
+    hist = np.bincount(c) if histogram else None
+    return KmerCounts(len(u), total, hist)
+
+
 class Kmers:
-    # TODO: This really should all be read from a buffer instead of directly
-    #  into memory
-    def __init__(self, filepath, k=11):
+    """
+    Kmers of a genome file. By default all contigs are read into memory. With
+    stream=True the file is instead read in blocks of chunk_size characters
+    whenever kmers are requested via iter_contigs() or iter_kmers(), so peak
+    memory does not grow with the size of the genome. The has_next/next()
+    interface is only available when the contigs are in memory.
+
+    A binary kmer file written by dump() can be passed as the filepath, in
+    which case the packed kmers are memory-mapped instead of parsed and
+    filepath is set to the genome file the kmers were created from.
+
+    With canonical=True every kmer is emitted as the smaller of itself and
+    its reverse complement, so both strands map to the same kmer. The
+    orientation of each kmer can be requested from iter_contigs() and
+    iter_packed().
+
+    With procs > 1 an uncompressed file is split at contig boundaries and
+    the groups of contigs are read by a pool of processes, which return
+    their sequences or packed kmers through shared memory. This applies to
+    loading the contigs into memory, counting and iter_batches(). Compressed
+    files can't be split and are always read serially.
+    """
+    def __init__(self, filepath, k=11, stream: bool = False,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 histogram: bool = False, canonical: bool = False,
+                 procs: int = 1):
         self.filepath = filepath
         # Sequences
         self.headers = []
@@ -36,11 +552,74 @@ class Kmers:
         self.li = 0  # Current line
         self.pi = 0  # Current position in the line
         self.k = k
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.canonical = canonical
+        self.procs = procs
+        self.kmer_path = None
+        self.kmer_file = None
+        self._n = 0  # non-unique kmers
+        self.histogram = None
+        if is_kmer_file(filepath):
+            self._open_kmer_file(filepath)
+            return
         # Load
-        self._load()
+        if not self.stream:
+            self._load()
         # Count the number of unique kmers
-        self._n = 0  # non-unique kmers
-        self.unique_kmers = self._count_unique()
+        self.unique_kmers = self._count_unique(histogram=histogram)
+
+    def _open_kmer_file(self, path: str):
+        self.kmer_path = path
+        self.kmer_file = KmerFile(path)
+        self.filepath = self.kmer_file.meta['source']
+        self.k = self.kmer_file.k
+        self.canonical = self.kmer_file.meta.get('canonical', False)
+        self.headers = self.kmer_file.headers
+        self._n = self.kmer_file.meta['total']
+        self.unique_kmers = self.kmer_file.meta['unique']
+        log.debug("Opened kmer file {} for {} with {} kmers".format(
+            path, self, self._n))
+
+    def __getstate__(self):
+        # Memory-mapped kmers are reopened instead of pickled
+        state = self.__dict__.copy()
+        state['kmer_file'] = None
+        return state
+
+    def __setstate__(self, state):
+        # Pickles made by older versions are missing newer attributes
+        self.stream = False
+        self.chunk_size = DEFAULT_CHUNK_SIZE
+        self.canonical = False
+        self.procs = 1
+        self.kmer_path = None
+        self.kmer_file = None
+        self.histogram = None
+        self.__dict__.update(state)
+        if self.kmer_path is not None:
+            self.kmer_file = KmerFile(self.kmer_path)
+
+    def dump(self, path: str) -> int:
+        """
+        Writes the packed kmers to a binary kmer file which can be opened
+        with Kmers(path).
+        :param path:
+        :return: Number of kmers written.
+        """
+        st = time.time()
+        headers = []
+        n = write_kmer_file(
+            path, self.k, packed_dtype(self.k), self._iter_runs(headers),
+            headers, meta={
+                'source': self.filepath,
+                'canonical': self.canonical,
+                'total': self._n,
+                'unique': self.unique_kmers,
+            })
+        log.debug("Dumped {} to {} in {} s".format(
+            self, path, time.time() - st))
+        return n
 
     def __str__(self):
         return os.path.basename(self.filepath)
@@ -48,7 +627,14 @@ class Kmers:
     def __len__(self):
         return self._n
 
+    @property
+    def _parallel(self) -> bool:
+        return self.procs > 1 and not is_compressed(self.filepath)
+
     def _load(self):
+        if self._parallel:
+            self._load_parallel()
+            return
         # We have to merge multiline sequences
         seq = ""
         log.debug(
@@ -58,12 +644,13 @@ class Kmers:
         log.debug("Seeing current working directory as: {}".format(
             os.getcwd()))
         st = time.time()
-        with open(self.filepath) as f:
+        with open_fasta(self.filepath) as f:
             for line in f:
                 ln = line.rstrip()
                 if ln.startswith(">"):
-                    # If we're at a new contig append the sequence
-                    if len(seq) != 0:
+                    # If we're at a new contig append the sequence, empty
+                    # contigs are kept so headers and sequences stay aligned
+                    if len(seq) != 0 or len(self.headers) != 0:
                         self.sequences.append(seq)
                         seq = ""
                     # Always append the header
@@ -76,6 +663,28 @@ class Kmers:
         en = time.time()
         log.debug("Done creating {} in {} s".format(self, en - st))
 
+    def _load_parallel(self):
+        """
+        _load() with the file split into groups of contigs that are read by
+        a pool of procs processes.
+        """
+        st = time.time()
+        ranges = contig_ranges(self.filepath, self.procs * RANGES_PER_PROC)
+        tasks = [(self.filepath, start, end, self.chunk_size)
+                 for start, end in ranges]
+        log.debug("Reading {} in {} contig groups with {} procs".format(
+            self.filepath, len(tasks), self.procs))
+        with multiprocessing.Pool(min(self.procs, len(tasks))) as pool:
+            for headers, lengths, name, shared in pool.imap(
+                    _read_range, tasks):
+                bases = _receive(name, shared).tobytes().decode('latin-1')
+                self.headers.extend(headers)
+                i = 0
+                for n in lengths:
+                    self.sequences.append(bases[i: i + n])
+                    i += n
+        log.debug("Done creating {} in {} s".format(self, time.time() - st))
+
     def _end_of_kmers(self) -> bool:
         return (self.pi + self.k) > len(self.sequences[self.li])
 
@@ -123,6 +732,226 @@ class Kmers:
 
         return header, sl
 
+    def _warn_short_contig(self, header: str):
+        log.warning(
+            "Contig {} in file {} was shorter than K of {},"
+            " skipping...".format(header, self.filepath, self.k))
+
+    def _iter_piece_kmers(self, header: str, pieces: typing.Iterable[str],
+                          orientation: bool = False) -> typing.Generator:
+        empty = True
+        for kmer in kmers_from_pieces(pieces, self.k):
+            empty = False
+            if self.canonical:
+                forward = kmer
+                kmer = canonical_kmer(kmer)
+                if orientation:
+                    yield kmer, kmer == forward
+                    continue
+            if orientation:
+                yield kmer, True
+            else:
+                yield kmer
+        if empty:
+            self._warn_short_contig(header)
+
+    def _iter_pieces(self) -> typing.Generator:
+        if self.stream:
+            yield from read_fasta_contigs(self.filepath, self.chunk_size)
+        else:
+            for header, seq in zip(self.headers, self.sequences):
+                yield header, (seq,)
+
+    def _iter_decoded(self, values: np.ndarray, orientation: bool = False,
+                      batch: int = 1 << 16) -> typing.Generator:
+        for i in range(0, len(values), batch):
+            values_batch, forward = self._orient(values[i: i + batch])
+            decoded = decode_kmers(values_batch, self.k)
+            if orientation:
+                yield from zip(decoded, forward.tolist())
+            else:
+                yield from decoded
+
+    def iter_contigs(self, orientation: bool = False) -> typing.Generator:
+        """
+        Iterates over the contigs, independent of the has_next/next() cursor.
+        In streaming mode the kmers of each contig are produced lazily from
+        the file and must be consumed before moving to the next contig.
+        A kmer file only stores packable kmers, so each run of consecutive
+        kmers is emitted as its own contig.
+        :param orientation: Emit (kmer, bool) pairs instead, where the bool
+            is False if the kmer was reverse complemented by canonical mode.
+        :return: Generator of (header, generator of kmers).
+        """
+        if self.kmer_file is not None:
+            for i, values, _ in self.kmer_file.iter_runs():
+                yield self.headers[i], self._iter_decoded(values, orientation)
+            return
+        for header, pieces in self._iter_pieces():
+            yield header, self._iter_piece_kmers(header, pieces, orientation)
+
+    def _batches(self, header: str, seq: str, start: int,
+                 orientation: bool) -> typing.Generator:
+        """
+        Splits a window of a contig into its runs of valid kmers, upper
+        cased as packed kmers are decoded.
+        """
+        seq = seq.upper()
+        _, valid, _ = _encode_codes(seq, self.k)
+        for kmers, run_start in split_valid(
+                sequence_kmers(seq, self.k), valid, start):
+            forward = np.ones(len(kmers), dtype=bool)
+            if self.canonical:
+                reverse = reverse_complement_kmers(kmers, self.k)
+                forward = kmers <= reverse
+                kmers = np.where(forward, kmers, reverse)
+            kmers = kmers.astype('U{}'.format(self.k))
+            if orientation:
+                yield header, kmers, run_start, forward
+            else:
+                yield header, kmers, run_start
+
+    def iter_batches(self, window: int = BATCH_SIZE,
+                     orientation: bool = False) -> typing.Generator:
+        """
+        Iterates over the kmers of each contig as NumPy string arrays of at
+        most window kmers. Consecutive batches of a contig overlap by k-1
+        bases, so a batch continues the previous one when its start offset
+        is where the previous batch ended. Kmers with bases other than ACGT
+        are dropped as in iter_packed(), so genome and kmer files give the
+        same batches, and a batch starting after such kmers is the start of
+        a new run of its contig. With procs > 1 the kmers of a genome file
+        are encoded by the process pool, see iter_packed().
+        :param window:
+        :param orientation: Also emit the orientation mask of the batch, see
+            iter_contigs().
+        :return: Generator of (header, kmers, position of the first kmer in
+            the contig) with the orientation mask appended if requested.
+        """
+        if self.kmer_file is not None or (
+                self._parallel and self.k <= MAX_PACKED_K):
+            headers = []
+            for i, values, start in self._iter_runs(headers):
+                for j in range(0, len(values), window):
+                    values_batch, forward = self._orient(
+                        values[j: j + window])
+                    kmers = _decode_bytes(values_batch, self.k).astype(
+                        'U{}'.format(self.k))
+                    if orientation:
+                        yield headers[i], kmers, start + j, forward
+                    else:
+                        yield headers[i], kmers, start + j
+            return
+        span = window + self.k - 1
+        for header, pieces in self._iter_pieces():
+            # Bases not yet emitted, always shorter than span
+            buf = ""
+            pos = 0
+            for piece in pieces:
+                buf += piece
+                i = 0
+                while len(buf) - i >= span:
+                    yield from self._batches(header, buf[i: i + span], pos,
+                                             orientation)
+                    i += window
+                    pos += window
+                buf = buf[i:]
+            if len(buf) >= self.k:
+                yield from self._batches(header, buf, pos, orientation)
+            elif pos == 0:
+                self._warn_short_contig(header)
+
+    def _orient(self, values: np.ndarray) -> typing.Tuple[np.ndarray,
+                                                          np.ndarray]:
+        """
+        Applies canonical mode to packed kmers.
+        :param values:
+        :return: The kmers and a boolean mask, False where the kmer was
+            replaced by its reverse complement.
+        """
+        if not self.canonical:
+            return values, np.ones(len(values), dtype=bool)
+        reverse = reverse_complement_packed(values, self.k)
+        forward = values <= reverse
+        return np.where(forward, values, reverse), forward
+
+    def iter_packed(self, orientation: bool = False) -> typing.Generator:
+        """
+        Iterates over the kmers as 2-bit packed NumPy arrays, one array per
+        run of consecutive kmers in a contig. Kmers with bases other than
+        ACGT are dropped, splitting their contig into multiple runs.
+        :param orientation: Also emit the orientation mask of the run, see
+            iter_contigs().
+        :return: Generator of (header, packed kmers, position of the first
+            kmer in the contig) with the orientation mask appended if
+            requested.
+        """
+        headers = []
+        for i, values, start in self._iter_runs(headers):
+            values, forward = self._orient(values)
+            if orientation:
+                yield headers[i], values, start, forward
+            else:
+                yield headers[i], values, start
+
+    def _iter_runs(self, headers: list) -> typing.Generator:
+        """
+        Iterates over the packed runs by contig index, before canonical mode
+        is applied.
+        :param headers: Filled with the contig headers as they're read.
+        :return: Generator of (contig index, packed kmers, position of the
+            first kmer in the contig).
+        """
+        if self.kmer_file is not None:
+            headers.extend(self.kmer_file.headers)
+            yield from self.kmer_file.iter_runs()
+            return
+        if self._parallel:
+            yield from self._iter_runs_parallel(headers)
+            return
+        for i, (header, pieces) in enumerate(self._iter_pieces()):
+            headers.append(header)
+            values, valid = encode_pieces(pieces, self.k)
+            if len(values) == 0:
+                self._warn_short_contig(header)
+                continue
+            for run, start in split_valid(values, valid):
+                yield i, run, start
+
+    def _iter_runs_parallel(self, headers: list) -> typing.Generator:
+        """
+        _iter_runs() with the file split into groups of contigs that are
+        encoded by a pool of procs processes. Groups are yielded in file
+        order.
+        """
+        ranges = contig_ranges(self.filepath, self.procs * RANGES_PER_PROC)
+        tasks = [(self.filepath, start, end, self.k, self.chunk_size)
+                 for start, end in ranges]
+        log.debug("Encoding {} in {} contig groups with {} procs".format(
+            self.filepath, len(tasks), self.procs))
+        with multiprocessing.Pool(min(self.procs, len(tasks))) as pool:
+            for group_headers, short, runs, name, shared in pool.imap(
+                    _encode_range, tasks):
+                values = _receive(name, shared)
+                first = len(headers)
+                headers.extend(group_headers)
+                for i in short:
+                    self._warn_short_contig(group_headers[i])
+                for run in runs:
+                    offset = int(run['offset'])
+                    yield (first + int(run['contig']),
+                           values[offset: offset + int(run['length'])],
+                           int(run['start']))
+
+    def iter_kmers(self) -> typing.Generator:
+        """
+        Iterates over every kmer in the file.
+        :return: Generator of (header, kmer).
+        """
+        for header, kmers in self.iter_contigs():
+            for kmer in kmers:
+                yield header, kmer
+
     def reset(self):
         """
         Resets Kmer iterator.
@@ -131,20 +960,43 @@ class Kmers:
         self.li = 0
         self.pi = 0
 
-    def _count_unique(self) -> int:
+    def _count_unique(self, histogram: bool = False) -> int:
         """
-        Counts the number of unique kmers in the file.
+        Counts the number of unique kmers in the file. Kmers are counted as
+        packed arrays unless K is too large to pack, in which case every kmer
+        string is added to a set. Only the packed counter skips kmers with
+        bases other than ACGT.
+        :param histogram: Also store the kmer count histogram.
         :return:
         """
         log.debug("Counting unique Kmers in file {}".format(self))
-        st = set()
-        c = 0
-        while self.has_next:
-            _, kmer = self.next()
-            st.add(kmer)
-            c += 1
-        self.reset()
-        uc = len(st)
+        if self.k <= MAX_PACKED_K:
+            counts = count_kmers(
+                (values for _, values, _ in self.iter_packed()),
+                histogram=histogram)
+            c = counts.total
+            uc = counts.unique
+            self.histogram = counts.histogram
+        else:
+            st = set()
+            c = 0
+            for _, kmer in self.iter_kmers():
+                st.add(kmer)
+                c += 1
+            uc = len(st)
         log.debug("Counted {} unique Kmers in file {}".format(uc, self))
         self._n = c
         return uc
+
+
+def load_kmers(path: str) -> Kmers:
+    """
+    Loads Kmers from either a binary kmer file or a pickle made by older
+    versions of the pipeline.
+    :param path:
+    :return:
+    """
+    if is_kmer_file(path):
+        return Kmers(path)
+    with open(path, 'rb') as f:
+        return dill.load(f)
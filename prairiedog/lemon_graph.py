@@ -1,13 +1,17 @@
+import collections
+import contextlib
 import os
 import logging
+import multiprocessing
+import threading
 import typing
-import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import LemonGraph
 
 import prairiedog.graph
 import prairiedog.config
-from prairiedog.edge import Edge
+from prairiedog.edge import Edge, EdgeBatch
 from prairiedog.node import Node, DEFAULT_NODE_TYPE
 from prairiedog.errors import GraphException
 
@@ -18,6 +22,92 @@ DB_PATH = os.path.join(
     prairiedog.config.OUTPUT_DIRECTORY,
     'pangenome.lemongraph')
 
+# Edges walked per chain query by LGGraph._find_path(). LemonGraph parses
+# chain queries recursively, so long paths are walked in batches that stay
+# well within the recursion limit
+PATH_BATCH_SIZE = 128
+
+# Nodes kept by the node cache of an LGGraph
+NODE_CACHE_SIZE = 1 << 16
+
+# The LMDB map starts at this size and doubles whenever the store fills
+# MAP_FILL of it, checked before every write transaction. The file is sparse,
+# so unused map size takes no disk
+MIN_MAP_SIZE = 4 << 30
+MAP_FILL = 0.5
+
+# Records copied per transaction by LGGraph.compact()
+COMPACT_BATCH_SIZE = 100000
+# Graph level item listing the keys set by LGGraph.set_graph_labels(), which
+# LGGraph.compact() copies
+GRAPH_LABELS_KEY = 'prairiedog_graph_labels'
+# LMDB keeps the lock file of a store next to it
+LOCK_SUFFIX = '-lock'
+
+
+def map_size_for(file_size: int, map_size: int = MIN_MAP_SIZE) -> int:
+    """
+    :param file_size: Of the store.
+    :param map_size: Current map size, the map never shrinks.
+    :return: Map size leaving room for the store to grow.
+    """
+    map_size = max(map_size, MIN_MAP_SIZE)
+    while file_size > map_size * MAP_FILL:
+        map_size *= 2
+    return map_size
+
+
+class NodeCache:
+    """
+    LRU cache of the nodes of the open transaction by type and value, so the
+    nodes shared by consecutive edges and recurring kmers are only looked up
+    once. Node handles belong to the transaction they were looked up in, so
+    the cache is cleared whenever it ends.
+    """
+
+    def __init__(self, size: int = NODE_CACHE_SIZE):
+        self.size = size
+        self._nodes = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __str__(self):
+        return "NodeCache of {} nodes with hit rate {:.2f}".format(
+            len(self), self.hit_rate)
+
+    def get(self, txn, node_type: str, value: str):
+        """
+        :param txn: The open transaction.
+        :param node_type:
+        :param value:
+        :return: The node, created if it doesn't exist.
+        """
+        key = (node_type, value)
+        node = self._nodes.get(key)
+        if node is not None:
+            self.hits += 1
+            self._nodes.move_to_end(key)
+            return node
+        self.misses += 1
+        node = self._nodes[key] = txn.node(type=node_type, value=value)
+        if len(self._nodes) > self.size:
+            self._nodes.popitem(last=False)
+        return node
+
+    def discard(self, node_type: str, value: str):
+        self._nodes.pop((node_type, value), None)
+
+    def clear(self):
+        self._nodes.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
 
 class LGGraph(prairiedog.graph.Graph):
     """
@@ -25,7 +115,8 @@ class LGGraph(prairiedog.graph.Graph):
     """
 
     def __init__(self, db_path: str = None, delete_on_exit=False, nosync=True,
-                 noreadahead=True, readonly=False):
+                 noreadahead=True, readonly=False,
+                 node_cache_size: int = NODE_CACHE_SIZE):
         if db_path is not None:
             self.db_path = db_path
         else:
@@ -35,10 +126,13 @@ class LGGraph(prairiedog.graph.Graph):
             self.db_path))
         self.g = LemonGraph.Graph(path=self.db_path, nosync=nosync,
                                   noreadahead=noreadahead, readonly=readonly)
-        ret = LemonGraph.lib.graph_set_mapsize(self.g._graph, (20 << 30) * 10)
-        assert (0 == ret)
+        self.map_size = 0
+        self._grow_map()
         self._ctx = None
         self._txn = None
+        self.node_cache = NodeCache(node_cache_size)
+        # Read transaction of the snapshot each thread is in
+        self._snapshots = threading.local()
         self.delete_on_exit = delete_on_exit
 
     def __del__(self):
@@ -51,9 +145,28 @@ class LGGraph(prairiedog.graph.Graph):
                 self.db_path))
             self.clear()
 
+    def _file_size(self) -> int:
+        return os.path.getsize(self.db_path) if os.path.exists(
+            self.db_path) else 0
+
+    def _grow_map(self):
+        """
+        Called between transactions, LMDB can't resize the map of an
+        environment with a transaction open.
+        """
+        size = map_size_for(self._file_size(), self.map_size)
+        if size == self.map_size:
+            return
+        ret = LemonGraph.lib.graph_set_mapsize(self.g._graph, size)
+        assert (0 == ret)
+        log.debug("Set map size of {} to {} bytes".format(
+            self.db_path, size))
+        self.map_size = size
+
     @property
     def ctx(self):
         if self._ctx is None:
+            self._grow_map()
             self._ctx = self.g.transaction(write=True)
         return self._ctx
 
@@ -103,7 +216,7 @@ class LGGraph(prairiedog.graph.Graph):
         #  we have to use a new txn (which is expensive for txn log) or figure
         #  another work around. Currently, we only add nodes via add_edge()
         #  which works fine for our use case, and upsert_node isn't called.
-        n = self.txn.node(type=node.node_type, value=node.value)
+        n = self.node_cache.get(self.txn, node.node_type, node.value)
 
         if node.labels is not None:
             for k, v in node.labels.items():
@@ -113,12 +226,13 @@ class LGGraph(prairiedog.graph.Graph):
             return LGGraph._parse_node(n)
 
     def add_edge(self, edge: Edge, echo: bool = True) -> typing.Optional[Edge]:
-        na = self.txn.node(type=DEFAULT_NODE_TYPE, value=edge.src)
-        nb = self.txn.node(type=DEFAULT_NODE_TYPE, value=edge.tgt)
+        txn = self.txn
+        na = self.node_cache.get(txn, DEFAULT_NODE_TYPE, edge.src)
+        nb = self.node_cache.get(txn, DEFAULT_NODE_TYPE, edge.tgt)
 
         # Add the edge
-        e = self.txn.edge(src=na, tgt=nb, type=edge.edge_type,
-                          value=str(edge.edge_value))
+        e = txn.edge(src=na, tgt=nb, type=edge.edge_type,
+                     value=str(edge.edge_value))
 
         if edge.labels is not None:
             for k, v in edge.labels.items():
@@ -127,37 +241,218 @@ class LGGraph(prairiedog.graph.Graph):
         if echo:
             return LGGraph._parse_edge(e)
 
+    def add_edges(self, edges: typing.Iterable[Edge]):
+        txn = self.txn
+        cache = self.node_cache
+        if isinstance(edges, EdgeBatch):
+            # Consecutive edges share a node, so each node is looked up once
+            # and no Edge is built
+            if len(edges) == 0:
+                return
+            na = cache.get(txn, DEFAULT_NODE_TYPE, edges.nodes[0])
+            for i in range(len(edges)):
+                nb = cache.get(txn, DEFAULT_NODE_TYPE, edges.nodes[i + 1])
+                e = txn.edge(src=na, tgt=nb, type=edges.edge_type,
+                             value=str(edges.edge_value + i))
+                labels = edges.labels(i)
+                if labels is not None:
+                    for k, v in labels.items():
+                        e[k] = v
+                na = nb
+            return
+        for edge in edges:
+            na = cache.get(txn, DEFAULT_NODE_TYPE, edge.src)
+            nb = cache.get(txn, DEFAULT_NODE_TYPE, edge.tgt)
+            e = txn.edge(src=na, tgt=nb, type=edge.edge_type,
+                         value=str(edge.edge_value))
+            if edge.labels is not None:
+                for k, v in edge.labels.items():
+                    e[k] = v
+
+    def _has_edges(self, value: str, txn) -> bool:
+        for query in ('@n(value="{}")->e()', 'e()->@n(value="{}")'):
+            for _ in txn.query(query.format(value)):
+                return True
+        return False
+
+    def remove_sample(self, edge_types: typing.Iterable[str]) -> int:
+        txn = self.txn
+        removed = 0
+        # Nodes that lost an edge, by value
+        touched = {}
+        for edge_type in edge_types:
+            # LemonGraph indexes edges by type, so this only visits the edges
+            # of the contig
+            chains = tuple(txn.query(
+                'n()->e(type="{}")->n()'.format(edge_type)))
+            for src, edge, tgt in chains:
+                touched[src['value']] = src
+                touched[tgt['value']] = tgt
+                edge.delete()
+                removed += 1
+        orphans = 0
+        for value, node in touched.items():
+            if not self._has_edges(value, txn):
+                node.delete()
+                self.node_cache.discard(node['type'], value)
+                orphans += 1
+        log.info("Removed {} edges and {} nodes left without edges".format(
+            removed, orphans))
+        return removed
+
     def clear(self):
+        self.node_cache.clear()
         self.g.delete()
 
     @property
     def nodes(self) -> typing.Set[Node]:
-        nodes = set(self.txn.nodes())
-        r_nodes = []
-        for node in nodes:
-            log.debug("raw node: {}".format(node))
-            r_nodes.append(LGGraph._parse_node(node))
-        return set(r_nodes)
+        return set(self.iter_nodes())
 
     @property
     def edges(self) -> typing.Set[Edge]:
-        edges = set(self.txn.edges())
-        r_edges = []
-        for edge in edges:
-            log.debug("raw edge: {}".format(edge))
-            r_edges.append(LGGraph._parse_edge(edge))
-        return set(r_edges)
+        return set(self.iter_edges())
+
+    @contextlib.contextmanager
+    def _current(self):
+        # The open write transaction also sees the writes not committed yet
+        if self._txn is not None:
+            yield self._txn
+        else:
+            with self._reading() as txn:
+                yield txn
+
+    @staticmethod
+    def _seek(txn, records: str, record_type: str, after: int):
+        """
+        Iterator over the nodes or edges of a transaction. LemonGraph can't
+        start an iterator after a given ID, so a cursor is applied while
+        scanning every record in ID order. Without one, the type index is
+        read when record_type is given.
+        """
+        if record_type is not None and after is None:
+            return getattr(txn, records)(type=record_type)
+        return getattr(txn, records)()
+
+    def _iter_records(self, records: str, parse: typing.Callable,
+                      record_type: str, after: int,
+                      batch_size: int) -> typing.Generator:
+        batch = []
+        with self._current() as txn:
+            for record in self._seek(txn, records, record_type, after):
+                if after is not None and record['ID'] <= after:
+                    continue
+                if record_type is not None and record['type'] != record_type:
+                    continue
+                if batch_size is None:
+                    yield parse(record)
+                    continue
+                batch.append(parse(record))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def iter_nodes(self, node_type: str = None, after: int = None,
+                   batch_size: int = None) -> typing.Generator:
+        """
+        Streams the nodes, parsing one at a time so memory doesn't grow with
+        the graph. Nodes come by ID, except when node_type is given without
+        after, where LemonGraph's type index decides the order. Pass
+        after=0 to read the nodes of a type by ID, to resume later.
+        :param node_type: Only nodes of this type.
+        :param after: Resume after the node with this db_id, ie. the last
+            one of an interrupted iteration by ID. The nodes up to it are
+            still read.
+        :param batch_size: Yield lists of up to batch_size nodes instead.
+        :return:
+        """
+        return self._iter_records('nodes', self._parse_node, node_type,
+                                  after, batch_size)
+
+    def iter_edges(self, edge_type: str = None, after: int = None,
+                   batch_size: int = None) -> typing.Generator:
+        """
+        Streams the edges, see iter_nodes().
+        :param edge_type: Only edges of this type, ie. of a contig.
+        :param after:
+        :param batch_size:
+        :return:
+        """
+        return self._iter_records('edges', self._parse_edge, edge_type,
+                                  after, batch_size)
+
+    def stats(self) -> dict:
+        """
+        Size of the store, counting its records without loading them.
+        Pages freed by updates and deletes stay in the file, see compact().
+        :return:
+        """
+        with self._current() as txn:
+            nodes = sum(1 for _ in txn.nodes())
+            edges = sum(1 for _ in txn.edges())
+        file_size = self._file_size()
+        return {
+            'file_bytes': file_size,
+            'map_bytes': self.map_size,
+            'map_fill': file_size / self.map_size,
+            'nodes': nodes,
+            'edges': edges,
+            'bytes_per_edge': file_size / edges if edges else None,
+        }
+
+    def compact(self, path: str,
+                batch_size: int = COMPACT_BATCH_SIZE) -> 'LGGraph':
+        """
+        Rewrites the graph densely into a new store, without the free pages
+        and the history of deleted records LemonGraph keeps. Records are
+        streamed, so memory doesn't grow with the graph. Node IDs change,
+        graph labels are copied.
+        :param path: Of the new store, which must not exist.
+        :param batch_size: Records copied per transaction.
+        :return: The new graph.
+        """
+        if os.path.exists(path):
+            raise FileExistsError(path)
+        out = LGGraph(path)
+        n = 0
+        with self._current() as txn:
+            out.set_graph_labels(
+                {k: txn[k] for k in txn.get(GRAPH_LABELS_KEY, [])})
+            for node in txn.nodes():
+                out.upsert_node(self._parse_node(node), echo=False)
+                n += 1
+                if n % batch_size == 0:
+                    out.save()
+            for src, edge, tgt in txn.query('n()->e()->n()'):
+                e = self._parse_edge(edge)
+                e.src, e.tgt = src['value'], tgt['value']
+                out.add_edge(e, echo=False)
+                n += 1
+                if n % batch_size == 0:
+                    out.save()
+        out.save()
+        log.info("Compacted {} of {} bytes into {} of {} bytes".format(
+            self.db_path, self._file_size(), path, out._file_size()))
+        return out
 
     def get_labels(self, node: str) -> dict:
         return dict(self.txn.nodes()[node])
 
-    def save(self, f=None):
+    def _end_txn(self):
+        # Cached nodes belong to the transaction
+        log.debug("Ending transaction with {}".format(self.node_cache))
+        self.node_cache.clear()
         self.ctx.__exit__(None, None, None)
+
+    def save(self, f=None):
+        self._end_txn()
         self._ctx = None
         self._txn = None
 
     def new_txn(self, write=True):
-        self.ctx.__exit__(None, None, None)
+        self._end_txn()
+        self._grow_map()
         self._ctx = self.g.transaction(write=write)
         self._txn = self.ctx.__enter__()
 
@@ -168,6 +463,8 @@ class LGGraph(prairiedog.graph.Graph):
     def set_graph_labels(self, labels: dict):
         for k, v in labels.items():
             self.txn[k] = v
+        keys = set(self.txn.get(GRAPH_LABELS_KEY, [])) | set(labels)
+        self.txn[GRAPH_LABELS_KEY] = sorted(keys)
 
     def filter(self):
         pass
@@ -177,7 +474,7 @@ class LGGraph(prairiedog.graph.Graph):
 
     def connected(self, node_a: str, node_b: str) -> typing.Tuple[
                     bool, typing.Tuple]:
-        with self.g.transaction(write=False) as txn:
+        with self._reading() as txn:
             # Gather edges from these nodes and only return the edges
             query_a = '@n(value="{}")->e()'.format(node_a)
             edges_a = tuple(txn.query(query_a))
@@ -218,63 +515,112 @@ class LGGraph(prairiedog.graph.Graph):
                 log.debug("src_edges are {}".format(src_edges))
                 return True, src_edges
 
-    def _find_path(self, edge_a: Edge, edge_b: Edge, txn) -> typing.Tuple[
-            Node]:
-        query = 'N()'
-        i = edge_a.edge_value
-        ln = edge_b.edge_value - edge_a.edge_value
-        log.info("Edge along {} has len {}".format(edge_a.edge_type, ln))
-
-        # LemonGraph uses a recursive function to parse edges
-        rdepth = sys.getrecursionlimit()
-        n_rdepth = None
-        if ln > rdepth:
-            log.warning("Length {} of edge {}".format(ln, edge_a.edge_type) +
-                        " is greater than recursion depth {} ".format(rdepth))
-            # TODO: fix this
-            log.warning("Skipping...")
-            return -1
-            n_rdepth = int(ln*1.15)
-            log.warning("Temporarily setting recursion depth to {}".format(
-                n_rdepth
-            ))
-            sys.setrecursionlimit(n_rdepth)
-
-        # This will only add 1 edge if edge_a.incr == edge_b.incr
-        while i <= edge_b.edge_value:
-            query += '->@e(type="{}",value="{}")->N()'.format(
-                edge_a.edge_type, i
-            )
-            i += 1
-        log.debug("Using query {}".format(query))
+    def node_edges(self, node: str) -> typing.Tuple[Edge, ...]:
+        with self._reading() as txn:
+            edges = tuple(txn.query('@n(value="{}")->e()'.format(node)))
+            edges += tuple(txn.query('e()->@n(value="{}")'.format(node)))
+            return tuple(LGGraph._parse_edge(e[0]) for e in edges)
+
+    def _edges_to(self, node: str) -> typing.Tuple[Edge, ...]:
+        # Parsed edges hold the ID of their target, not its value
+        with self._reading() as txn:
+            return tuple(LGGraph._parse_edge(e[0]) for e in txn.query(
+                'e()->@n(value="{}")'.format(node)))
 
-        chains = tuple(txn.query(query))
-        log.debug("Got chains {}".format(chains))
-        # There should only be one chain per path
-        try:
-            assert len(chains) == 1
-        except AssertionError as e:
-            log.fatal("Length of chains is {} != 1".format(len(chains)))
-            raise e
-        # In the nested chain (a tuple), there should be at least 2 nodes
-        chain = chains[0]
-        assert len(chain) >= 2
+    @staticmethod
+    def _chains(edge_type: str, first: int, last: int, txn) -> tuple:
+        query = 'N()' + ''.join(
+            '->@e(type="{}",value="{}")->N()'.format(edge_type, i)
+            for i in range(first, last + 1))
+        log.debug("Using query {}".format(query))
+        return tuple(txn.query(query))
 
+    def _find_path(self, edge_a: Edge, edge_b: Edge, txn,
+                   batch_size: int = PATH_BATCH_SIZE
+                   ) -> typing.Optional[typing.Tuple[Node]]:
+        """
+        Walks the edges of the contig of edge_a by ascending value, from
+        edge_a to edge_b. Each batch of batch_size edges is one chain query
+        that continues from the last node of the previous batch.
+        :param edge_a:
+        :param edge_b:
+        :param txn: Read transaction all the batches are queried in.
+        :param batch_size:
+        :return: Nodes of the path, or None if edge_b isn't on the same run
+            of the contig as edge_a.
+        """
+        log.info("Edge along {} has len {}".format(
+            edge_a.edge_type, edge_b.edge_value - edge_a.edge_value))
+        chain = []
+        # ID of the node the next batch starts from
+        start = edge_a.src
+        i = edge_a.edge_value
+        while i <= edge_b.edge_value:
+            j = min(edge_b.edge_value, i + batch_size - 1)
+            # Batches are linked by node ID
+            chains = [c for c in self._chains(edge_a.edge_type, i, j, txn)
+                      if c[0]['ID'] == start]
+            if len(chains) == 0:
+                # The values of the kmers spanning an N are missing, so the
+                # walk can't reach a run after it
+                log.debug("No chain for edges {} to {} of {}".format(
+                    i, j, edge_a.edge_type))
+                return None
+            if len(chains) > 1:
+                log.fatal("Found {} chains for edges {} to {} of {}".format(
+                    len(chains), i, j, edge_a.edge_type))
+                raise GraphException(g=self)
+            batch = chains[0]
+            chain.extend(batch if not chain else batch[1:])
+            start = batch[-1]['ID']
+            i = j + 1
+        if start != edge_b.tgt:
+            log.debug("Path along {} doesn't end at {}".format(
+                edge_a.edge_type, edge_b))
+            return None
         # Convert the chain into a tuple of Nodes and return
-        nodes = tuple(self._parse_node(n) for n in chain)
+        return tuple(self._parse_node(n) for n in chain)
 
-        # Reset recursion depth
-        if n_rdepth is not None:
-            log.warning("Resetting recursion depth to default of {}".format(
-                rdepth
-            ))
-            sys.setrecursionlimit(rdepth)
+    @contextlib.contextmanager
+    def snapshot(self):
+        """
+        Every query of the calling thread within the block reads the graph
+        in one read transaction, so they all see the same snapshot of it
+        while a writer keeps committing. Threads each have their own.
+        """
+        if getattr(self._snapshots, 'txn', None) is not None:
+            yield self
+            return
+        with self.g.transaction(write=False) as txn:
+            self._snapshots.txn = txn
+            try:
+                yield self
+            finally:
+                self._snapshots.txn = None
+
+    @contextlib.contextmanager
+    def _reading(self):
+        txn = getattr(self._snapshots, 'txn', None)
+        if txn is not None:
+            yield txn
+            return
+        with self.g.transaction(write=False) as txn:
+            yield txn
 
-        return nodes
+    def path_spans(self, node_a: str, node_b: str) -> typing.Tuple[
+            typing.Tuple[str, int, int, dict], ...]:
+        with self.snapshot():
+            return super().path_spans(node_a, node_b)
 
     def path(self, node_a: str, node_b: str) -> typing.Tuple[
             typing.Tuple[typing.Tuple[Node], ...],
             typing.Tuple[typing.Dict[str, typing.Any], ...]]:
+        with self.snapshot():
+            return self._path(node_a, node_b)
+
+    def _path(self, node_a: str, node_b: str) -> typing.Tuple[
+            typing.Tuple[typing.Tuple[Node], ...],
+            typing.Tuple[typing.Dict[str, typing.Any], ...]]:
         connected, src_edges = self.connected(node_a, node_b)
         if not connected:
             return tuple(), tuple()
@@ -284,7 +630,7 @@ class LGGraph(prairiedog.graph.Graph):
         for src_edge in src_edges:
             log.debug("Finding path between {} and {} with source edge {}"
                       "".format(node_a, node_b, src_edge))
-            with self.g.transaction(write=False) as txn:
+            with self._reading() as txn:
                 # Find the last edge we're looking for.
                 query = 'e(type="{}")->@n(value="{}")'.format(
                     src_edge.edge_type, node_b)
@@ -310,7 +656,8 @@ class LGGraph(prairiedog.graph.Graph):
                                   "source edge has greater incr tag")
                         continue
                     path_nodes = self._find_path(src_edge, tgt_edge, txn)
-                    if path_nodes == -1:
+                    if path_nodes is None:
+                        # The target edge is on another run of the contig
                         continue
                     if len(path_nodes) < 2:
                         raise GraphException(g=self)
@@ -332,3 +679,104 @@ class LGGraph(prairiedog.graph.Graph):
                                 'edge_type': src_edge.edge_type
                             })
         return tuple(paths), tuple(paths_meta)
+
+
+def compact_store(db_path: str = DB_PATH) -> typing.Tuple[int, int]:
+    """
+    Compacts a store in place with LGGraph.compact(), nothing else may have
+    it open meanwhile.
+    :param db_path:
+    :return: Sizes of the store in bytes, before and after.
+    """
+    tmp = db_path + '.compact'
+    for f in (tmp, tmp + LOCK_SUFFIX):
+        if os.path.exists(f):
+            os.remove(f)
+    g = LGGraph(db_path, readonly=True)
+    before = g._file_size()
+    out = g.compact(tmp)
+    after = out._file_size()
+    out.g.close()
+    g.g.close()
+    os.replace(tmp, db_path)
+    if os.path.exists(tmp + LOCK_SUFFIX):
+        os.remove(tmp + LOCK_SUFFIX)
+    return before, after
+
+
+class ReadPool:
+    """
+    Read-only access to a LemonGraph database for many concurrent queries.
+    LMDB environments can't be opened twice in a process nor used across a
+    fork, so a process opens the database once, lazily, and threads share it
+    with a read transaction each. Every snapshot() sees the graph as of its
+    start, while a writer in another process keeps committing.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, workers: int = None):
+        """
+        :param db_path:
+        :param workers: Threads or processes used by map(), the number of
+            CPUs by default.
+        """
+        self.db_path = db_path
+        self.workers = workers if workers is not None else os.cpu_count()
+        self._graph = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def graph(self) -> LGGraph:
+        if self._pid != os.getpid():
+            # Forked, the handle of the parent can't be used
+            self.__init__(self.db_path, self.workers)
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._graph = LGGraph(self.db_path, readonly=True)
+        return self._graph
+
+    @contextlib.contextmanager
+    def snapshot(self) -> typing.Generator:
+        """
+        :return: The graph, reading one snapshot for the calling thread.
+        """
+        with self.graph.snapshot() as g:
+            yield g
+
+    def _call(self, fn: typing.Callable, item):
+        with self.snapshot() as g:
+            return fn(g, item)
+
+    def map(self, fn: typing.Callable, items: typing.Iterable,
+            processes: bool = False) -> typing.List:
+        """
+        Calls fn(graph, item) for every item, each in its own snapshot.
+        :param fn: Picklable if processes is set.
+        :param items:
+        :param processes: Use forked processes instead of threads, for
+            queries that mostly run Python code.
+        :return: Results in the order of items.
+        """
+        items = list(items)
+        if processes:
+            with multiprocessing.Pool(
+                    self.workers, initializer=_init_worker,
+                    initargs=(self.db_path,)) as pool:
+                return pool.starmap(_call_worker, ((fn, i) for i in items))
+        with ThreadPoolExecutor(self.workers) as executor:
+            return list(executor.map(lambda i: self._call(fn, i), items))
+
+
+# ReadPool of a worker process of ReadPool.map(), so each process opens the
+# database once for all its items
+_worker_pool = None
+
+
+def _init_worker(db_path: str):
+    global _worker_pool
+    _worker_pool = ReadPool(db_path, workers=1)
+
+
+def _call_worker(fn: typing.Callable, item):
+    return _worker_pool._call(fn, item)
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import typing
+
+from prairiedog.fasta import sample_name
+
+log = logging.getLogger("prairiedog")
+
+# Stored next to the graph, ie. "outputs/pangenome.lemongraph.manifest.json"
+MANIFEST_EXTENSION = '.manifest.json'
+
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+DIGEST_CHUNK_SIZE = 1 << 20
+
+
+def manifest_path(graph_path: str) -> str:
+    return graph_path.rstrip('/') + MANIFEST_EXTENSION
+
+
+def file_digest(path: str, chunk_size: int = DIGEST_CHUNK_SIZE) -> str:
+    """
+    SHA-256 of the content of a file, read in chunks.
+    :param path:
+    :param chunk_size:
+    :return: Hex digest.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    Records which samples are in a graph and the content of the file each
+    one was read from, so only new or changed samples need to be graphed.
+    """
+
+    def __init__(self):
+        # Sample name : dict of path, digest, edge_types, added
+        self.samples = {}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __contains__(self, sample: str):
+        return sample in self.samples
+
+    def status(self, sample: str, digest: str) -> str:
+        """
+        :param sample:
+        :param digest: Of the file the sample would be read from.
+        :return: NEW, CHANGED or UNCHANGED.
+        """
+        entry = self.samples.get(sample)
+        if entry is None:
+            return NEW
+        if entry['digest'] != digest:
+            return CHANGED
+        return UNCHANGED
+
+    def record(self, sample: str, path: str, digest: str = None,
+               edge_types: str = None):
+        """
+        :param sample:
+        :param path: File the sample was read from.
+        :param digest: Computed from the file if not given.
+        :param edge_types: Side table of the edge types of the sample.
+        :return:
+        """
+        if digest is None:
+            digest = file_digest(path)
+        self.samples[sample] = {
+            'path': path,
+            'digest': digest,
+            'edge_types': edge_types,
+            'added': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+    def remove(self, sample: str):
+        self.samples.pop(sample, None)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Written to a temporary file first so a crash never leaves a
+        # truncated manifest
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'samples': self.samples}, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+        log.debug("Wrote manifest of {} samples to {}".format(len(self), path))
+
+    @classmethod
+    def load(cls, path: str) -> 'Manifest':
+        """
+        :param path:
+        :return: An empty manifest if the file doesn't exist.
+        """
+        manifest = cls()
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest.samples = json.load(f)['samples']
+        return manifest
+
+    def pending(self, paths: typing.Iterable[str]) -> typing.List[
+            typing.Tuple[str, str, str, str]]:
+        """
+        Compares sample files against the manifest.
+        :param paths: FASTA files, named as in sample_name().
+        :return: List of (sample, path, digest, status) of the files that are
+            not UNCHANGED.
+        """
+        pending = []
+        for path in paths:
+            sample = sample_name(path)
+            digest = file_digest(path)
+            status = self.status(sample, digest)
+            if status != UNCHANGED:
+                pending.append((sample, path, digest, status))
+        return pending
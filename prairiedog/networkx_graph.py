@@ -4,6 +4,8 @@ import typing
 import networkx as nx
 
 import prairiedog.graph
+from prairiedog.edge import Edge, EdgeBatch
+from prairiedog.node import Node, NodeBatch
 
 log = logging.getLogger("prairiedog")
 
@@ -24,6 +26,22 @@ class NetworkXGraph(prairiedog.graph.Graph):
         else:
             self.g.add_edge(node_a, node_b)
 
+    def upsert_nodes(self, nodes: typing.Iterable[Node]):
+        if isinstance(nodes, NodeBatch):
+            self.g.add_nodes_from(nodes.values)
+            return
+        self.g.add_nodes_from(
+            (node.value, node.labels or {}) for node in nodes)
+
+    def add_edges(self, edges: typing.Iterable[Edge]):
+        if isinstance(edges, EdgeBatch):
+            self.g.add_edges_from(
+                (src, tgt, edges.labels(i) or {}) for i, (src, tgt) in
+                enumerate(zip(edges.src, edges.tgt)))
+            return
+        self.g.add_edges_from(
+            (edge.src, edge.tgt, edge.labels or {}) for edge in edges)
+
     def clear(self):
         self.g.clear()
 
@@ -1,5 +1,7 @@
 import typing
 
+from prairiedog.kmers import reverse_complement
+
 DEFAULT_NODE_TYPE = 'km'
 
 
@@ -19,6 +21,25 @@ class Node:
         return "prairiedog.node.Node with vars {}".format(vars(self))
 
 
+class NodeBatch:
+    """
+    Values of many nodes of one type, iterating builds a Node per value for
+    backends that need them.
+    """
+
+    def __init__(self, values: typing.Sequence[str],
+                 node_type: str = DEFAULT_NODE_TYPE):
+        self.values = values
+        self.node_type = node_type
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self) -> typing.Iterator[Node]:
+        for value in self.values:
+            yield Node(value=value, node_type=self.node_type)
+
+
 def concat_values(nodes: typing.Tuple[Node], additional: int = 1) -> str:
     """
     Concatenate value strings in Nodes. Used to reconstruct Kmers.
@@ -35,3 +56,33 @@ def concat_values(nodes: typing.Tuple[Node], additional: int = 1) -> str:
         suffix = node.value[len(node.value)-additional:]
         s += suffix
     return s
+
+
+def concat_oriented(nodes: typing.Tuple[Node], first: str) -> typing.Optional[
+        str]:
+    """
+    Concatenate canonical kmers into the sequence of one strand. Canonical
+    nodes may store either strand of a kmer, so each node is oriented to
+    overlap the previous one by k-1 bases.
+    :param nodes:
+    :param first: The first kmer on the wanted strand, must be the value of
+        nodes[0] or its reverse complement.
+    :return: The sequence or None if the nodes don't overlap on one strand.
+    """
+    if len(nodes) == 0:
+        return ""
+    if first not in (nodes[0].value, reverse_complement(nodes[0].value)):
+        return None
+    s = first
+    prev = first
+    for i in range(1, len(nodes)):
+        value = nodes[i].value
+        if value[:-1] == prev[1:]:
+            prev = value
+        else:
+            rc = reverse_complement(value)
+            if rc[:-1] != prev[1:]:
+                return None
+            prev = rc
+        s += prev[-1]
+    return s
@@ -0,0 +1,423 @@
+import json
+import logging
+import os
+import typing
+
+import numpy as np
+
+from prairiedog.edge import Edge
+from prairiedog.graph import Graph
+from prairiedog.node import Node
+
+log = logging.getLogger("prairiedog")
+
+META_FILE = 'meta.json'
+ARRAYS = ('nodes', 'order', 'types', 'offsets', 'counts', 'data',
+          'run_positions', 'run_indices', 'run_offsets', 'checkpoint_offsets',
+          'checkpoint_ids', 'checkpoint_starts')
+# Nodes between the absolute IDs a record can be decoded from
+CHECKPOINT_INTERVAL = 1024
+
+
+def encode_varints(values: np.ndarray) -> typing.Tuple[np.ndarray,
+                                                       np.ndarray]:
+    """
+    LEB128 encodes unsigned ints, 7 bits per byte with the high bit set on
+    every byte but the last of a value.
+    :param values:
+    :return: (bytes, number of bytes of each value)
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    n = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        n += rest > 0
+        rest >>= np.uint64(7)
+    out = np.empty(int(n.sum()), dtype=np.uint8)
+    starts = np.cumsum(n) - n
+    for j in range(int(n.max()) if len(n) else 0):
+        mask = n > j
+        byte = (values[mask] >> np.uint64(7 * j)) & np.uint64(0x7f)
+        more = (n[mask] > j + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + j] = byte | more
+    return out, n
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """
+    Reverses encode_varints().
+    :param data:
+    :return: Array of uint64.
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    last = (data & 0x80) == 0
+    starts = np.concatenate(([0], np.nonzero(last)[0][:-1] + 1))
+    value = np.concatenate(([0], np.cumsum(last)[:-1]))
+    shift = (np.arange(len(data)) - starts[value]) * 7
+    parts = (data & 0x7f).astype(np.uint64) << shift.astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+def encode_deltas(ids: np.ndarray, previous: int = 0) -> np.ndarray:
+    """
+    Zigzag encoded differences between consecutive IDs.
+    :param ids:
+    :param previous: ID before the first one.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    deltas = np.diff(ids, prepend=previous)
+    return ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+
+def decode_deltas(zigzag: np.ndarray, previous: int = 0) -> np.ndarray:
+    zigzag = np.asarray(zigzag, dtype=np.uint64)
+    deltas = (zigzag >> np.uint64(1)).astype(np.int64) ^ \
+        -(zigzag & np.uint64(1)).astype(np.int64)
+    return previous + np.cumsum(deltas)
+
+
+class _Record:
+    """
+    A record being built, as the encoded bytes of each batch.
+    """
+    __slots__ = ('chunks', 'size', 'count', 'last', 'runs', 'checkpoints')
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0  # Bytes
+        self.count = 0  # Nodes
+        self.last = 0  # ID of the last node
+        self.runs = []  # (position, index) of the first node of every run
+        self.checkpoints = []  # (byte offset, ID before the node)
+
+
+class PathTable:
+    """
+    Every contig of a graph as the array of its node IDs, so a path along a
+    contig is a slice of one record instead of a walk through the graph.
+    IDs are given in order of first appearance, so the IDs of a new stretch
+    of contig are consecutive. Each record is stored as the varint encoded
+    deltas of its IDs, about a byte per node, and encoded as nodes are
+    added. Every CHECKPOINT_INTERVAL nodes the ID reached is kept, so a
+    slice is decoded from the checkpoint before it.
+
+    A record joins the runs of a contig split by Ns, with the contig
+    position of the first node of every run to find the node at a position.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: A table written by save(), or None to build one with
+            add().
+        """
+        self.path = path
+        self._building = {}  # Edge type : _Record
+        self._ids = {}  # Node value : ID, while building
+        self._index = {}
+        self.interval = CHECKPOINT_INTERVAL
+        if path is None:
+            return
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.interval = self.meta.get('checkpoint_interval', self.interval)
+        for name in ARRAYS:
+            setattr(self, name, np.load(
+                os.path.join(path, name + '.npy'), mmap_mode='r'))
+        self._index = {t: i for i, t in enumerate(self.types.tolist())}
+
+    def __len__(self):
+        return len(self._index) + len(self._building)
+
+    def __contains__(self, edge_type: str):
+        return edge_type in self._index
+
+    def __str__(self):
+        return "PathTable in {}".format(self.path)
+
+    def _node_ids(self, nodes: typing.Sequence[str]) -> np.ndarray:
+        ids = self._ids
+        return np.fromiter(
+            (ids.setdefault(str(v), len(ids)) for v in nodes),
+            dtype=np.int64, count=len(nodes))
+
+    def add(self, edge_type: str, nodes: typing.Sequence[str],
+            position: int = None):
+        """
+        Appends nodes to the record of a contig.
+        :param edge_type:
+        :param nodes:
+        :param position: Contig position of the first node, which starts a
+            new run if it doesn't follow the nodes already added. None
+            continues the last run.
+        :return:
+        """
+        if len(nodes) == 0:
+            return
+        record = self._building.get(edge_type)
+        if record is None:
+            record = self._building[edge_type] = _Record()
+        if not record.runs:
+            record.runs.append((position or 0, 0))
+        elif position is not None and \
+                position != record.runs[-1][0] + record.count - \
+                record.runs[-1][1]:
+            record.runs.append((position, record.count))
+        ids = self._node_ids(nodes)
+        data, n = encode_varints(encode_deltas(ids, record.last))
+        # Nodes of the batch where a checkpoint falls
+        first = -record.count % self.interval
+        starts = np.cumsum(n) - n
+        for i in range(first, len(ids), self.interval):
+            record.checkpoints.append((
+                record.size + int(starts[i]),
+                record.last if i == 0 else int(ids[i - 1])))
+        record.chunks.append(data)
+        record.size += len(data)
+        record.count += len(ids)
+        record.last = int(ids[-1])
+
+    def save(self, path: str):
+        types = list(self._building)
+        records = [self._building[t] for t in types]
+        counts = np.array([r.count for r in records], dtype=np.int64)
+        data = np.concatenate(
+            [c for r in records for c in r.chunks]) if records else \
+            np.zeros(0, dtype=np.uint8)
+        offsets = np.concatenate(
+            ([0], np.cumsum([r.size for r in records]))).astype(np.int64)
+        nodes = np.array(list(self._ids), dtype=np.bytes_)
+
+        def concat(lists: list) -> typing.Tuple[np.ndarray, np.ndarray]:
+            starts = np.concatenate(([0], np.cumsum([len(x) for x in lists])))
+            rows = np.array([row for x in lists for row in x],
+                            dtype=np.int64).reshape(-1, 2)
+            return rows, starts.astype(np.int64)
+        runs, run_offsets = concat([r.runs for r in records])
+        checkpoints, checkpoint_starts = concat(
+            [r.checkpoints for r in records])
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            'nodes': nodes,
+            'order': np.argsort(nodes, kind='stable'),
+            'types': np.array(types, dtype=np.str_),
+            'offsets': offsets,
+            'counts': counts,
+            'data': data,
+            'run_positions': runs[:, 0],
+            'run_indices': runs[:, 1],
+            'run_offsets': run_offsets,
+            'checkpoint_offsets': checkpoints[:, 0],
+            'checkpoint_ids': checkpoints[:, 1],
+            'checkpoint_starts': checkpoint_starts,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump({'contigs': len(types), 'nodes': len(nodes),
+                       'checkpoint_interval': self.interval}, f)
+        log.info("Wrote path table of {} contigs, {} nodes in {} bytes to "
+                 "{}".format(len(types), int(counts.sum()), len(data), path))
+        self._building = {}
+        self._ids = {}
+        self.__init__(path)
+
+    def ids(self, edge_type: str, start: int = 0,
+            end: int = None) -> np.ndarray:
+        """
+        Decodes the IDs of a slice of a record, from the checkpoint before
+        start to the one after end.
+        :param edge_type:
+        :param start:
+        :param end:
+        :return: The node IDs of the contig from start to end.
+        """
+        i = self._index[edge_type]
+        count = int(self.counts[i])
+        end = count if end is None else min(end, count)
+        if start >= end:
+            return np.zeros(0, dtype=np.int64)
+        first = int(self.checkpoint_starts[i])
+        c = first + start // self.interval
+        c_end = first + -(-end // self.interval)
+        lo = int(self.offsets[i]) + int(self.checkpoint_offsets[c])
+        if c_end < int(self.checkpoint_starts[i + 1]):
+            hi = int(self.offsets[i]) + int(self.checkpoint_offsets[c_end])
+        else:
+            hi = int(self.offsets[i + 1])
+        ids = decode_deltas(decode_varints(self.data[lo:hi]),
+                            int(self.checkpoint_ids[c]))
+        skip = start - (c - first) * self.interval
+        return ids[skip: skip + end - start]
+
+    def run(self, edge_type: str, position: int
+            ) -> typing.Optional[typing.Tuple[int, int]]:
+        """
+        :param edge_type:
+        :param position: A position in the contig.
+        :return: Indices in the record of the node at the position and of
+            the last node of its run, or None if no node is at the position.
+        """
+        i = self._index[edge_type]
+        lo, hi = int(self.run_offsets[i]), int(self.run_offsets[i + 1])
+        positions = self.run_positions[lo:hi]
+        r = int(np.searchsorted(positions, position, side='right')) - 1
+        if r < 0:
+            return None
+        index = int(self.run_indices[lo + r]) + position - int(positions[r])
+        end = int(self.run_indices[lo + r + 1]) if lo + r + 1 < hi else \
+            int(self.counts[i])
+        if index >= end:
+            return None
+        return index, end - 1
+
+    def node_id(self, value: str) -> int:
+        """
+        :param value:
+        :return: The ID of a node, or -1 if it isn't in the table.
+        """
+        key = value.encode('ascii')
+        i = int(np.searchsorted(self.nodes, key, sorter=self.order))
+        if i == len(self.order) or self.nodes[self.order[i]] != key:
+            return -1
+        return int(self.order[i])
+
+    def values(self, ids: np.ndarray) -> typing.List[str]:
+        return [b.decode('ascii') for b in self.nodes[ids]]
+
+    def nodes_of(self, edge_type: str, start: int = 0,
+                 end: int = None) -> typing.List[str]:
+        """
+        :param edge_type:
+        :param start:
+        :param end:
+        :return: The values of the nodes of a contig from start to end.
+        """
+        return self.values(self.ids(edge_type, start, end))
+
+
+class PathTables:
+    """
+    Path tables of many samples, ie. every table in a directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.exists(os.path.join(path, META_FILE)):
+            tables = [PathTable(path)]
+        else:
+            tables = [PathTable(os.path.join(path, d))
+                      for d in sorted(os.listdir(path))
+                      if os.path.exists(os.path.join(path, d, META_FILE))]
+        self._tables = {}  # Edge type : table
+        for table in tables:
+            for edge_type in table.types.tolist():
+                self._tables[edge_type] = table
+
+    def __contains__(self, edge_type: str):
+        return edge_type in self._tables
+
+    def __getitem__(self, edge_type: str) -> PathTable:
+        return self._tables[edge_type]
+
+
+class PathTableGraph(Graph):
+    """
+    Wraps a graph to find the paths along a contig from its path table,
+    while connected() and every other method go to the wrapped graph.
+    """
+
+    def __init__(self, g: Graph, tables: PathTables):
+        self.g = g
+        self.tables = tables
+
+    def upsert_node(self, node: Node, echo: bool = True) -> typing.Optional[
+            Node]:
+        return self.g.upsert_node(node, echo=echo)
+
+    def add_edge(self, edge: Edge, echo: bool = True) -> typing.Optional[Edge]:
+        return self.g.add_edge(edge, echo=echo)
+
+    def upsert_nodes(self, nodes: typing.Iterable[Node]):
+        self.g.upsert_nodes(nodes)
+
+    def add_edges(self, edges: typing.Iterable[Edge]):
+        self.g.add_edges(edges)
+
+    def remove_sample(self, edge_types: typing.Iterable[str]) -> int:
+        return self.g.remove_sample(edge_types)
+
+    def clear(self):
+        self.g.clear()
+
+    @property
+    def nodes(self) -> typing.Set[Node]:
+        return self.g.nodes
+
+    @property
+    def edges(self) -> typing.Set[Edge]:
+        return self.g.edges
+
+    def get_labels(self, node: str) -> dict:
+        return self.g.get_labels(node)
+
+    def save(self, f: str = None):
+        self.g.save(f)
+
+    @property
+    def edgelist(self) -> typing.Generator:
+        return self.g.edgelist
+
+    def set_graph_labels(self, labels: dict):
+        self.g.set_graph_labels(labels)
+
+    def filter(self):
+        self.g.filter()
+
+    def __len__(self):
+        return len(self.g)
+
+    def connected(self, node_a: str, node_b: str) -> typing.Tuple[
+            bool, typing.Tuple]:
+        return self.g.connected(node_a, node_b)
+
+    def node_edges(self, node: str) -> typing.Tuple[Edge, ...]:
+        return self.g.node_edges(node)
+
+    def path_spans(self, node_a: str, node_b: str) -> typing.Tuple[
+            typing.Tuple[str, int, int, dict], ...]:
+        return self.g.path_spans(node_a, node_b)
+
+    def path(self, node_a: str, node_b: str) -> typing.Tuple[
+            typing.Tuple[typing.Tuple[Node], ...],
+            typing.Tuple[typing.Dict[str, typing.Any], ...]]:
+        connected, src_edges = self.connected(node_a, node_b)
+        if not connected:
+            return tuple(), tuple()
+        missing = [e for e in src_edges if e.edge_type not in self.tables]
+        if missing:
+            log.warning("{} contigs aren't in the path tables, walking the "
+                        "graph instead".format(len(missing)))
+            return self.g.path(node_a, node_b)
+        paths = []
+        paths_meta = []
+        for src_edge in src_edges:
+            table = self.tables[src_edge.edge_type]
+            # Edge values are contig positions, the record skips the kmers
+            # spanning an N
+            span = table.run(src_edge.edge_type, src_edge.edge_value)
+            if span is None:
+                continue
+            start, last = span
+            ids = table.ids(src_edge.edge_type, start, last + 1)
+            id_b = table.node_id(node_b)
+            # The edge at a position goes from the node at that position to
+            # the next one, up to the end of the run
+            for end in np.nonzero(ids[1:] == id_b)[0] + 1:
+                paths.append(tuple(
+                    Node(value=v) for v in table.values(ids[: end + 1])))
+                paths_meta.append({
+                    'edge_type': src_edge.edge_type,
+                    **(src_edge.labels or {})})
+        return tuple(paths), tuple(paths_meta)
@@ -2,32 +2,156 @@
 
 """Main module."""
 import logging
+import typing
 
+from prairiedog.edge_types import EdgeTypes
+from prairiedog.fasta_index import FastaIndexes
 from prairiedog.graph import Graph
-from prairiedog.node import concat_values
+from prairiedog.kmers import canonical_kmer, reverse_complement, kmer_key, \
+    key_kmer
+from prairiedog.node import Node, concat_values, concat_oriented
 from prairiedog.pretty_hits import PrettyHits
+from prairiedog.subgraph_ref import uncouple_edge_type
 
 log = logging.getLogger("prairiedog")
 
 
 class Prairiedog:
-    def __init__(self, g: Graph):
+    def __init__(self, g: Graph, canonical: bool = False,
+                 edge_types: EdgeTypes = None,
+                 fasta_indexes: FastaIndexes = None,
+                 packed_keys: bool = False):
+        """
+        :param g:
+        :param canonical: The graph was built with canonical kmers, search
+            both strands.
+        :param edge_types: Side table of the edge types in the graph.
+        :param fasta_indexes: Indexes of the graphed FASTA files, to read
+            the sequence of a hit from its sample instead of walking its
+            nodes.
+        :param packed_keys: The graph was built with packed keys, see
+            prairiedog.kmers.kmer_key().
+        """
         self.g = g
+        self.canonical = canonical
+        self.edge_types = edge_types
+        self.fasta_indexes = fasta_indexes
+        self.packed_keys = packed_keys
 
-    def query(self, src: str, dst: str):
-        log.info("Looking for all strings between {} and {} ...".format(
-            src, dst))
-        paths, paths_meta = self.g.path(src, dst)
+    def _key(self, kmer: str) -> str:
+        return kmer_key(kmer) if self.packed_keys else kmer
+
+    def _kmers(self, path: tuple, k: int) -> tuple:
+        """
+        Decodes the nodes of a path back to kmers, when keys are packed.
+        """
+        if not self.packed_keys:
+            return path
+        return tuple(Node(value=key_kmer(node.value, k)) for node in path)
+
+    def _sliced_hits(self, node_a: str, node_b: str, src: str, dst: str,
+                     strand: str = None) -> typing.Optional[list]:
+        """
+        :return: None if a hit can't be read from the FASTA indexes.
+        """
+        k = len(node_a)
+        key = canonical_kmer if self.canonical else str
+        spans = self.g.path_spans(self._key(node_a), self._key(node_b))
+        if spans is None:
+            return None
+        list_hits = []
+        for edge_type, first, last, meta in spans:
+            sample, contig = uncouple_edge_type(edge_type, self.edge_types)
+            string = self.fasta_indexes.fetch(sample, contig, first,
+                                              last + 1 + k)
+            if string is None or len(string) != last - first + 1 + k or \
+                    key(string[:k]) != node_a or key(string[-k:]) != node_b:
+                log.debug("Can't read {} to {} of {} in {} from its index"
+                          "".format(first, last, contig, sample))
+                return None
+            # Canonical nodes also match paths on the other strand
+            if not (string.startswith(src) and string.endswith(dst)):
+                continue
+            hit = {'string': string, **meta}
+            if strand is not None:
+                if strand == '-':
+                    hit['string'] = reverse_complement(string)
+                hit['strand'] = strand
+            list_hits.append(hit)
+        return list_hits
+
+    def _indexed_hits(self, src: str, dst: str) -> typing.Optional[list]:
+        try:
+            if not self.canonical:
+                return self._sliced_hits(src, dst, src, dst)
+            list_hits = self._sliced_hits(
+                canonical_kmer(src), canonical_kmer(dst), src, dst, '+')
+            if list_hits is None:
+                return None
+            rc_src, rc_dst = reverse_complement(src), reverse_complement(dst)
+            rc_hits = self._sliced_hits(
+                canonical_kmer(rc_dst), canonical_kmer(rc_src), rc_dst,
+                rc_src, '-')
+            if rc_hits is None:
+                return None
+            return list_hits + rc_hits
+        except (NotImplementedError, KeyError, ValueError) as e:
+            log.debug("Can't use the FASTA indexes: {}".format(e))
+            return None
+
+    def _canonical_hits(self, src: str, dst: str, strand: str) -> list:
+        paths, paths_meta = self.g.path(self._key(canonical_kmer(src)),
+                                        self._key(canonical_kmer(dst)))
         list_hits = []
         for i in range(len(paths)):
-            path = paths[i]
-            meta = paths_meta[i]
-            string = concat_values(path)
+            string = concat_oriented(self._kmers(paths[i], len(src)), src)
+            # Canonical nodes also match paths on the other strand
+            if string is None or not string.endswith(dst):
+                continue
+            if strand == '-':
+                string = reverse_complement(string)
             list_hits.append(
                 {
                     'string': string,
-                    **meta
+                    'strand': strand,
+                    **paths_meta[i]
                 }
             )
-        ph = PrettyHits(list_hits)
+        return list_hits
+
+    def _walked_hits(self, src: str, dst: str) -> list:
+        if self.canonical:
+            # A hit on the reverse strand runs from the reverse complement of
+            # dst to the reverse complement of src
+            list_hits = self._canonical_hits(src, dst, '+')
+            list_hits += self._canonical_hits(
+                reverse_complement(dst), reverse_complement(src), '-')
+        else:
+            paths, paths_meta = self.g.path(self._key(src), self._key(dst))
+            list_hits = []
+            for i in range(len(paths)):
+                path = self._kmers(paths[i], len(src))
+                meta = paths_meta[i]
+                string = concat_values(path)
+                list_hits.append(
+                    {
+                        'string': string,
+                        **meta
+                    }
+                )
+        return list_hits
+
+    def query(self, src: str, dst: str) -> PrettyHits:
+        log.info("Looking for all strings between {} and {} ...".format(
+            src, dst))
+        list_hits = None
+        if self.fasta_indexes is not None:
+            list_hits = self._indexed_hits(src, dst)
+            if list_hits is None:
+                log.warning("Hits can't be read from the FASTA indexes, "
+                            "walking their paths instead")
+        if list_hits is None:
+            list_hits = self._walked_hits(src, dst)
+        ph = PrettyHits(list_hits, self.edge_types)
         log.info("Found: {}".format(ph))
+        return ph
@@ -1,11 +1,13 @@
+from prairiedog.edge_types import EdgeTypes
 from prairiedog.subgraph_ref import uncouple_edge_type
 
 
 class Hit:
-    def __init__(self, string: str, edge_type: str):
+    def __init__(self, string: str, edge_type: str,
+                 edge_types: EdgeTypes = None):
         self.sequence = string
         self.source = edge_type
-        sample, contig = uncouple_edge_type(edge_type)
+        sample, contig = uncouple_edge_type(edge_type, edge_types)
         self.sample = sample
         self.contig = contig
 
@@ -33,9 +35,14 @@ class PrettyHits:
             variant_set.add(hit.sequence)
         return sample_map
 
-    def __init__(self, list_hits: list):
+    def __init__(self, list_hits: list, edge_types: EdgeTypes = None):
+        """
+        :param list_hits:
+        :param edge_types: Side table to resolve the edge types of the hits.
+        """
         hits = [
-            Hit(string=hit['string'], edge_type=hit['edge_type'])
+            Hit(string=hit['string'], edge_type=hit['edge_type'],
+                edge_types=edge_types)
             for hit in list_hits
         ]
         self.sample_map = PrettyHits.parse_hits(hits)
@@ -1,43 +1,247 @@
 import os
 import time
 import logging
+import multiprocessing
+import traceback
 import typing
 
+import dill
+import numpy as np
+
+import prairiedog.config as config
 from prairiedog.gref import GRef
-from prairiedog.kmers import Kmers
+from prairiedog.kmers import Kmers, load_kmers, kmer_keys, MAX_PACKED_K
 from prairiedog.graph import Graph
 from prairiedog.graph_ref import GraphRef
-from prairiedog.edge import Edge
-from prairiedog.node import Node
+from prairiedog.edge import EdgeBatch
+from prairiedog.node import NodeBatch
 from prairiedog.lemon_graph import LGGraph
+from prairiedog.unitigs import Unitigs
+from prairiedog.edge_types import EdgeTypes, EDGE_TYPES_EXTENSION
+from prairiedog.fasta_index import FastaIndex, FAI_EXTENSION
+from prairiedog.manifest import Manifest, CHANGED
+from prairiedog.commit import CommitPolicy, GraphWriter, EDGE_OVERHEAD_BYTES
 
 log = logging.getLogger("prairiedog")
 
 
+# Edge types of graphs built before edge types were interned
 ET_DELIMITER = ' in '
 
+# Edge batches waiting for the writer when ingesting many samples
+INGEST_QUEUE_SIZE = 16
+
 
-def uncouple_edge_type(edge_type: str) -> typing.Tuple[str, str]:
-    split = edge_type.split(ET_DELIMITER)
-    assert len(split) == 2
-    return split[1], split[0]
+def uncouple_edge_type(edge_type: str, edge_types: EdgeTypes = None
+                       ) -> typing.Tuple[str, str]:
+    """
+    Resolves an edge type into the names of its sample and contig.
+    :param edge_type: An ID from EdgeTypes, or a "contig in sample" string.
+    :param edge_types: Side table the ID was interned in.
+    :return: (sample, contig)
+    """
+    if ET_DELIMITER in edge_type:
+        split = edge_type.split(ET_DELIMITER)
+        assert len(split) == 2
+        return split[1], split[0]
+    if edge_types is None:
+        raise ValueError(
+            "Edge type {} needs an edge types side table".format(edge_type))
+    return edge_types.resolve(edge_type)
+
+
+def _ingest_worker(tasks: multiprocessing.Queue,
+                   batches: multiprocessing.Queue, unitigs_path: str,
+                   packed_keys: bool = False):
+    """
+    Prepares the edge batches of the samples in tasks for the writer in
+    SubgraphRef.ingest(), until a None task is read.
+    """
+    unitigs = Unitigs(unitigs_path) if unitigs_path is not None else None
+    while True:
+        path = tasks.get()
+        if path is None:
+            batches.put(None)
+            return
+        try:
+            km = load_kmers(path)
+            for batch in SubgraphRef._iter_edge_batches(
+                    km, None, False, unitigs, packed_keys):
+                batches.put(('batch', path, batch))
+            batches.put(('done', path, None))
+        except Exception:
+            batches.put(('error', path, traceback.format_exc()))
 
 
 class SubgraphRef(GRef):
     """
     Helper for creating a NetworkX graph, created for each genome file.
     """
-    def __init__(self, graph: Graph):
+    def __init__(self, graph: Graph, edge_types: EdgeTypes = None,
+                 packed_keys: bool = False):
         """
+        :param graph:
+        :param edge_types: Side table to intern the edge types in, ie. one
+            shared with the graph.
+        :param packed_keys: Key the nodes by their packed kmer, see
+            prairiedog.kmers.kmer_key(), instead of the kmer string.
         """
         self.graph = graph
+        self.packed_keys = packed_keys
+        # Contigs of the graphed samples, see save_edge_types()
+        self.edge_types = edge_types if edge_types is not None else \
+            EdgeTypes()
+        # Set to a PathTable to also record every contig as a path, see
+        # prairiedog.path_table
+        self.path_table = None
         self.out_file = None
 
     def __str__(self):
         return "SubgraphRef"
 
+    def _add_edges(self, edges: EdgeBatch):
+        try:
+            self.graph.add_edges(edges)
+        except Exception as e:
+            log.fatal(
+                "Failed to add edges from {} to {} of {}".format(
+                    edges.nodes[0], edges.nodes[-1], edges.edge_type))
+            raise e
+
+    @staticmethod
+    def _iter_kmer_batches(km: Kmers, gr: GraphRef, encode: bool,
+                           packed_keys: bool = False) -> typing.Generator:
+        # Last node of the previous batch, to link batches of a contig
+        prev_header, prev_end, prev_node, prev_forward = None, 0, None, True
+        # Batches are pulled one at a time so streaming Kmers never load the
+        # whole file
+        for header, kmers, start, forward in km.iter_batches(
+                orientation=True):
+            if packed_keys:
+                nodes = kmer_keys(kmers)
+            else:
+                nodes = kmers.tolist()
+            if encode and not packed_keys:
+                nodes = [gr.node_label(kmer) for kmer in nodes]
+            new_nodes = len(nodes)
+            # The batch continues the contig of the previous batch
+            continues = (start > 0 and header == prev_header and
+                         start == prev_end)
+            if continues:
+                nodes.insert(0, prev_node)
+                forward = np.concatenate(([prev_forward], forward))
+            prev_header, prev_end = header, start + len(kmers)
+            prev_node, prev_forward = nodes[-1], forward[-1]
+            yield header, nodes, new_nodes, forward, start, continues
+
+    @staticmethod
+    def _iter_unitig_batches(km: Kmers,
+                             unitigs: Unitigs) -> typing.Generator:
+        # Unitig edges aren't positions in the contig, but the runs of a
+        # contig still get distinct edge values with a gap between them
+        prev_header, start = None, 0
+        for header, walk in unitigs.walks(km):
+            if header != prev_header:
+                start = 0
+            nodes = [unitigs.sequence(i) for i in walk.tolist()]
+            yield header, nodes, len(nodes), None, start, False
+            prev_header, start = header, start + len(nodes)
+
+    @staticmethod
+    def _iter_edge_batches(km: Kmers, gr: GraphRef, encode: bool,
+                           unitigs: Unitigs = None,
+                           packed_keys: bool = False) -> typing.Generator:
+        """
+        Prepares the edges of every contig of a sample in batches, which only
+        need the graph to be written. Unitigs vary in length, so they can't
+        be packed into keys.
+        :return: Generator of (header, sample, nodes, number of new nodes,
+            value of the first edge, orientations, continues the contig of
+            the previous batch).
+        """
+        sample = str(km)
+        if unitigs is not None:
+            if packed_keys:
+                raise ValueError("Unitigs can't be stored as packed keys")
+            batches = SubgraphRef._iter_unitig_batches(km, unitigs)
+        else:
+            batches = SubgraphRef._iter_kmer_batches(
+                km, gr, encode, packed_keys)
+        for header, nodes, new_nodes, forward, start, continues in batches:
+            # The value of an edge is the position of its source kmer in the
+            # contig, a continued batch starts with the last node of the
+            # previous one
+            edge_c = start - 1 if continues else start
+            orientations = None
+            if km.canonical and forward is not None:
+                strands = np.where(forward, '+', '-')
+                orientations = np.char.add(
+                    strands[:-1], strands[1:]).tolist()
+            yield (header, sample, nodes, new_nodes, edge_c, orientations,
+                   continues)
+
+    def _write_batch(self, writer: GraphWriter, batch: tuple) -> int:
+        """
+        Writes a batch from _iter_edge_batches().
+        :param writer:
+        :param batch:
+        :return: Number of nodes added.
+        """
+        header, sample, nodes, new_nodes, edge_c, orientations, \
+            continues = batch
+        policy = writer.policy
+        c = 0
+        if not isinstance(self.graph, LGGraph):
+            writer.write(self.graph.upsert_nodes,
+                         NodeBatch(nodes[len(nodes) - new_nodes:]))
+        if not continues:
+            # Counts the first node of the contig
+            c += 1
+            policy.record(1, len(nodes[0]) if nodes else 0)
+        edge_type = self.edge_types.add(header, sample)
+        if self.path_table is not None:
+            # The first node of a continued run was added with the last batch
+            self.path_table.add(
+                edge_type, nodes[1:] if continues else nodes,
+                edge_c + 1 if continues else edge_c)
+        # Edges are added in slices so a transaction never holds more than
+        # policy.max_items nodes
+        i = 0
+        n_edges = len(nodes) - 1
+        while i < n_edges:
+            room = policy.room()
+            j = n_edges if room is None else min(n_edges, i + room)
+            edges = EdgeBatch(
+                nodes[i: j + 1], edge_type, edge_c + i,
+                orientations[i: j] if orientations is not None else None)
+            writer.write(self._add_edges, edges)
+            policy.record(
+                j - i,
+                sum(map(len, nodes[i + 1: j + 1])) +
+                (j - i) * (len(edge_type) + EDGE_OVERHEAD_BYTES))
+            c += j - i
+            i = j
+            writer.maybe_commit()
+        return c
+
     def update_graph(self, km: Kmers, gr: GraphRef, encode: bool = False,
-                     buffer: int = 333) -> int:
+                     buffer: int = 333, unitigs: Unitigs = None,
+                     policy: CommitPolicy = None,
+                     background: bool = False) -> int:
+        """
+        Adds every contig of a sample as a chain of edges.
+        :param km:
+        :param gr:
+        :param encode:
+        :param buffer: Save the graph every buffer nodes, if no policy is
+            given.
+        :param unitigs: Add the contigs as chains of unitigs from this index
+            instead of chains of kmers.
+        :param policy: Decides when the graph is saved.
+        :param background: Write and save the graph on a background thread
+            while the next batch of edges is built.
+        :return: Number of nodes added.
+        """
         self.out_file = os.path.join(
             'outputs/',
             km.filepath + '.rdf'
@@ -47,73 +251,207 @@ class SubgraphRef(GRef):
             "Starting to graph {} in pid {}".format(
                 km, os.getpid()))
         st = time.time()
+        if policy is None:
+            policy = CommitPolicy(max_items=buffer)
+        writer = GraphWriter(self.graph, policy, self.out_file, background)
         c = 0
-        while km.has_next:
-            header1, kmer1 = km.next()
-            # Create the first node
-            node1_label = gr.node_label(kmer1) if encode else kmer1
-            if not isinstance(self.graph, LGGraph):
-                self.graph.upsert_node(
-                    Node(value=node1_label))
-            c += 1
-            # Used to incrementally encode the edges
-            edge_c = 0
-            # The same contig still has a kmer
-            while km.contig_has_next:
-                header2, kmer2 = km.next()
-                # Create the second node
-                node2_label = gr.node_label(kmer2) if encode else kmer2
-                if not isinstance(self.graph, LGGraph):
-                    self.graph.upsert_node(
-                        Node(node2_label))
-                # Create an edge
-                try:
-                    self.graph.add_edge(
-                        Edge(
-                            src=node1_label,
-                            tgt=node2_label,
-                            edge_type='{}{}{}'.format(
-                                header2, ET_DELIMITER, str(km)),
-                            edge_value=edge_c,
-                        ),
-                        echo=False
-                    )
-                    # self.graph.add_edge(
-                    #     Edge(
-                    #         src=node1_label,
-                    #         tgt=node2_label,
-                    #         edge_type='{} in {}'.format(header2, str(km)),
-                    #         edge_value=edge_c,
-                    #         labels={
-                    #             'f': str(km),
-                    #             'hd': header2
-                    #         }
-                    #     ),
-                    #     echo=False
-                    # )
-                except Exception as e:
-                    log.fatal(
-                        "Failed to add edge between {} and {}".format(
-                            node1_label, node2_label))
-                    raise e
-                # Set node1_id to node2_id
-                node1_label = node2_label
-                c += 1
-                edge_c += 1
-                if c % buffer == 0:
-                    # log.debug("Committing txn...")
-                    self.graph.save(self.out_file)
-                if c % 100000 == 0:
-                    log.debug("{}/{}, {}%".format(
-                        c, len(km), int(c/len(km)*100)))
-
-            # At this point, we're out of kmers on that contig
-            # The loop will check if there's still kmers, and reset kmer1
+        try:
+            for batch in self._iter_edge_batches(km, gr, encode, unitigs,
+                                                 self.packed_keys):
+                c += self._write_batch(writer, batch)
+                log.debug("{} nodes of {} added".format(c, km))
+            writer.close()
+        finally:
+            # Only commits on success, closing twice is a no-op
+            writer.close(commit=False)
         en = time.time()
-        log.debug("Done graphing {}, covering {} kmers in {} s".format(
-            km, c, en - st))
+        log.debug(
+            "Done graphing {}, covering {} nodes in {} s with {} commits, "
+            "last took {} s".format(
+                km, c, en - st, policy.commits, policy.latency))
+        return c
+
+    def ingest(self, paths: typing.List[str], gr: GraphRef = None,
+               procs: int = 1, unitigs: Unitigs = None,
+               policy: CommitPolicy = None, background: bool = False,
+               queue_size: int = INGEST_QUEUE_SIZE) -> int:
+        """
+        Adds many samples to the graph. The edges are prepared by procs
+        worker processes, one sample at a time each, and written by this
+        process alone as LemonGraph only allows a single writer. At most
+        queue_size batches wait for the writer.
+        :param paths: Kmer files, see load_kmers().
+        :param gr: Indexed with every sample.
+        :param procs:
+        :param unitigs:
+        :param policy: Decides when the graph is saved.
+        :param background: Write and save the graph on a background thread
+            while the next batch is received.
+        :param queue_size:
+        :return: Number of nodes added.
+        """
+        if gr is not None:
+            for path in paths:
+                gr.index_kmers(load_kmers(path))
+        if policy is None:
+            policy = CommitPolicy()
+        procs = min(procs, len(paths))
+        if procs <= 1:
+            return sum(
+                self.update_graph(load_kmers(path), gr, unitigs=unitigs,
+                                  policy=policy, background=background)
+                for path in paths)
+
+        self.out_file = os.path.join('outputs/', 'samples', 'ingest.rdf')
+        log.debug("Ingesting {} samples with {} procs".format(
+            len(paths), procs))
+        st = time.time()
+        tasks = multiprocessing.Queue()
+        for path in paths:
+            tasks.put(path)
+        batches = multiprocessing.Queue(maxsize=queue_size)
+        workers = []
+        for _ in range(procs):
+            tasks.put(None)
+            p = multiprocessing.Process(
+                target=_ingest_worker,
+                args=(tasks, batches,
+                      unitigs.path if unitigs is not None else None,
+                      self.packed_keys),
+                daemon=True)
+            p.start()
+            workers.append(p)
+        writer = GraphWriter(self.graph, policy, self.out_file, background)
+        c = 0
+        running = procs
+        try:
+            while running > 0:
+                item = batches.get()
+                if item is None:
+                    running -= 1
+                    continue
+                kind, path, batch = item
+                if kind == 'error':
+                    raise RuntimeError(
+                        "Failed to ingest {}:\n{}".format(path, batch))
+                if kind == 'done':
+                    log.debug("Done graphing {}, {} nodes added so far".format(
+                        path, c))
+                    continue
+                c += self._write_batch(writer, batch)
+            writer.close()
+        finally:
+            writer.close(commit=False)
+            for p in workers:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+        log.debug(
+            "Done ingesting {} samples, covering {} nodes in {} s with {} "
+            "commits".format(len(paths), c, time.time() - st,
+                             policy.commits))
         return c
 
+    def add_samples(self, paths: typing.List[str], manifest: Manifest,
+                    update: bool = False, k: int = config.K,
+                    canonical: bool = config.CANONICAL,
+                    gr: GraphRef = None, procs: int = 1,
+                    policy: CommitPolicy = None, background: bool = False,
+                    kmers_dir: str = os.path.join(config.OUTPUT_DIRECTORY,
+                                                  'kmers'),
+                    edge_types_dir: str = os.path.join(
+                        config.OUTPUT_DIRECTORY, 'edge_types'),
+                    fasta_index_dir: str = os.path.join(
+                        config.OUTPUT_DIRECTORY, 'fasta_index')
+                    ) -> typing.List[str]:
+        """
+        Adds the samples that are not in the manifest yet to the graph, and
+        records them in the manifest. The caller saves the graph, then the
+        manifest.
+        :param paths: FASTA files.
+        :param manifest:
+        :param update: Replace the samples whose file changed since they
+            were added, instead of skipping them.
+        :param k:
+        :param canonical:
+        :param gr:
+        :param procs: See ingest().
+        :param policy:
+        :param background:
+        :param kmers_dir: Where the kmer files of the samples are written.
+        :param edge_types_dir: Where the edge types of every sample are
+            written.
+        :param fasta_index_dir: Where the FASTA index of every sample is
+            written, None to skip them.
+        :return: Names of the samples added.
+        """
+        new = []
+        for sample, path, digest, status in manifest.pending(paths):
+            if status == CHANGED:
+                if not update:
+                    log.warning(
+                        "{} changed since it was added to the graph, skipping "
+                        "it".format(sample))
+                    continue
+                self.remove_sample(sample, manifest)
+            new.append((sample, path, digest))
+        if not new:
+            log.info("No new samples to add")
+            return []
+        os.makedirs(kmers_dir, exist_ok=True)
+        kmer_paths = []
+        for sample, path, _ in new:
+            kmer_path = os.path.join(kmers_dir, '{}.kmers'.format(sample))
+            km = Kmers(path, k, canonical=canonical)
+            if k <= MAX_PACKED_K:
+                km.dump(kmer_path)
+            else:
+                with open(kmer_path, 'wb') as f:
+                    dill.dump(km, f)
+            kmer_paths.append(kmer_path)
+        self.ingest(kmer_paths, gr, procs=procs, policy=policy,
+                    background=background)
+        for (sample, path, digest), kmer_path in zip(new, kmer_paths):
+            edge_types_path = os.path.join(
+                edge_types_dir, sample + EDGE_TYPES_EXTENSION)
+            self.edge_types.of_sample(
+                str(load_kmers(kmer_path))).save(edge_types_path)
+            manifest.record(sample, path, digest, edge_types_path)
+            if fasta_index_dir is not None:
+                FastaIndex.build(path, os.path.join(
+                    fasta_index_dir, sample + FAI_EXTENSION))
+        log.info("Added {} samples".format(len(new)))
+        return [sample for sample, _, _ in new]
+
+    def remove_sample(self, sample: str, manifest: Manifest) -> int:
+        """
+        Removes a sample recorded in the manifest from the graph, with its
+        edge types side table. The caller saves the graph, then the manifest.
+        :param sample:
+        :param manifest:
+        :return: Number of edges removed.
+        """
+        if sample not in manifest:
+            raise KeyError("{} is not in the manifest".format(sample))
+        path = manifest.samples[sample]['edge_types']
+        edge_types = EdgeTypes.load(path)
+        removed = self.graph.remove_sample(edge_types.names)
+        for edge_type in edge_types.names:
+            self.edge_types.names.pop(edge_type, None)
+        os.remove(path)
+        manifest.remove(sample)
+        log.info("Removed {} edges of {}".format(removed, sample))
+        return removed
+
+    def save_edge_types(self, path: str):
+        """
+        Writes the side table needed to resolve the edge types back to the
+        sample and contig names.
+        :param path:
+        :return:
+        """
+        self.edge_types.save(path)
+
     def save(self, f: str):
         # Drop some nodes due to size constraints
         # full_length = len(self.graph)
@@ -0,0 +1,369 @@
+import json
+import logging
+import os
+import typing
+
+import numpy as np
+
+from prairiedog.edge import Edge
+from prairiedog.graph import Graph
+from prairiedog.kmers import (Kmers, BASES, MAX_PACKED_K, packed_dtype,
+                              decode_kmers, encode_kmer)
+from prairiedog.node import Node
+
+log = logging.getLogger("prairiedog")
+
+# A unitig index is a directory of NumPy arrays, memory-mapped when opened:
+#   - kmers.npy: every distinct packed kmer, sorted
+#   - unitig.npy, offset.npy: the unitig of each kmer and its position in it
+#   - starts.npy: offset of each unitig in sequences.npy, plus the end
+#   - sequences.npy: the ASCII sequences of every unitig back to back
+META_FILE = 'meta.json'
+ARRAYS = ('kmers', 'unitig', 'offset', 'starts', 'sequences')
+
+_CODE_BASES = np.frombuffer(BASES.encode('ascii'), dtype=np.uint8)
+
+
+def _unique(values: np.ndarray) -> np.ndarray:
+    # Sorting directly is much faster than np.unique() for large arrays
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    return values[np.concatenate(([True], values[1:] != values[:-1]))]
+
+
+def _index_of(sorted_values: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Index of each value in sorted_values, -1 if missing.
+    """
+    if len(sorted_values) == 0:
+        return np.full(len(values), -1, dtype=np.int64)
+    idx = np.searchsorted(sorted_values, values)
+    idx[idx == len(sorted_values)] = 0
+    return np.where(sorted_values[idx] == values, idx, -1)
+
+
+def _neighbours(kmers: np.ndarray, k: int,
+                successors: bool) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: The number of successors (or predecessors) of every kmer that
+        are in kmers and the index of the last one found.
+    """
+    dtype = kmers.dtype.type
+    mask = dtype((1 << (2 * k)) - 1)
+    degree = np.zeros(len(kmers), dtype=np.int8)
+    neighbour = np.full(len(kmers), -1, dtype=np.int64)
+    for base in range(4):
+        if successors:
+            values = ((kmers << dtype(2)) | dtype(base)) & mask
+        else:
+            values = (kmers >> dtype(2)) | (dtype(base) << dtype(2 * (k - 1)))
+        idx = _index_of(kmers, values)
+        found = idx >= 0
+        degree += found
+        neighbour = np.where(found, idx, neighbour)
+    return degree, neighbour
+
+
+def build_unitigs(kms: typing.Iterable[Kmers], path: str) -> 'Unitigs':
+    """
+    Compacts the de Bruijn graph of the kmers of every sample into unitigs,
+    maximal chains of kmers without branches. Unitigs are also split where
+    any contig starts or ends, and the first kmer of a contig is kept as a
+    unitig of its own, so every contig is an exact walk over at least two
+    unitigs unless it only has one kmer.
+    :param kms: Kmers of every sample that will be added to the graph. Only
+        forward-strand kmers with k <= MAX_PACKED_K are supported.
+    :param path: Directory to write the unitig index to.
+    :return:
+    """
+    k = None
+    samples = []
+    uniques = []
+    firsts = []
+    lasts = []
+    for km in kms:
+        if km.canonical:
+            raise ValueError(
+                "Unitigs can't be built from canonical kmers of {}".format(km))
+        if km.k > MAX_PACKED_K:
+            raise ValueError("Unitigs need k <= {}, got {}".format(
+                MAX_PACKED_K, km.k))
+        if k is not None and km.k != k:
+            raise ValueError("Kmers of {} have k of {}, expected {}".format(
+                km, km.k, k))
+        k = km.k
+        samples.append(str(km))
+        runs = []
+        for _, values, _ in km.iter_packed():
+            runs.append(values)
+            firsts.append(values[:1])
+            lasts.append(values[-1:])
+        if runs:
+            uniques.append(_unique(np.concatenate(runs)))
+    if k is None:
+        raise ValueError("No samples to build unitigs from")
+    dtype = packed_dtype(k)
+    kmers = _unique(np.concatenate(uniques)).astype(dtype) if uniques \
+        else np.empty(0, dtype=dtype)
+    n = len(kmers)
+    log.debug("Building unitigs from {} distinct kmers in {} samples".format(
+        n, len(samples)))
+
+    # Contig starts and ends break unitigs
+    is_first = np.zeros(n, dtype=bool)
+    is_last = np.zeros(n, dtype=bool)
+    if firsts:
+        is_first[_index_of(kmers, np.concatenate(firsts))] = True
+        is_last[_index_of(kmers, np.concatenate(lasts))] = True
+
+    out_degree, successor = _neighbours(kmers, k, successors=True)
+    in_degree, _ = _neighbours(kmers, k, successors=False)
+    merge = (out_degree == 1) & ~is_last & ~is_first
+    targets = successor[merge]
+    merge[merge] = (in_degree[targets] == 1) & ~is_first[targets]
+    following = np.where(merge, successor, -1)
+
+    # Walk every unitig from its first kmer at once, one kmer per step
+    has_previous = np.zeros(n, dtype=bool)
+    has_previous[following[following >= 0]] = True
+    frontier = np.flatnonzero(~has_previous)
+    n_unitigs = len(frontier)
+    unitig = np.empty(n, dtype='<u4')
+    offset = np.empty(n, dtype='<u4')
+    ids = np.arange(n_unitigs, dtype='<u4')
+    step = 0
+    while len(frontier):
+        unitig[frontier] = ids
+        offset[frontier] = step
+        frontier = following[frontier]
+        keep = frontier >= 0
+        frontier = frontier[keep]
+        ids = ids[keep]
+        step += 1
+
+    # Sequence of a unitig is its first kmer followed by the last base of
+    # every other kmer
+    lengths = np.bincount(unitig, minlength=n_unitigs) + k - 1
+    starts = np.concatenate(([0], np.cumsum(lengths))).astype('<u8')
+    sequences = np.empty(int(starts[-1]), dtype=np.uint8)
+    first = offset == 0
+    first_bases = np.frombuffer(
+        ''.join(decode_kmers(kmers[first], k)).encode('ascii'),
+        dtype=np.uint8).reshape(-1, k)
+    positions = starts[unitig[first]][:, None] + np.arange(k, dtype='<u8')
+    sequences[positions] = first_bases
+    rest = ~first
+    positions = starts[unitig[rest]] + offset[rest] + np.uint64(k - 1)
+    sequences[positions] = _CODE_BASES[kmers[rest] & dtype.type(3)]
+
+    os.makedirs(path, exist_ok=True)
+    arrays = {'kmers': kmers, 'unitig': unitig, 'offset': offset,
+              'starts': starts, 'sequences': sequences}
+    for name in ARRAYS:
+        np.save(os.path.join(path, name + '.npy'), arrays[name])
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump({'k': k, 'samples': samples}, f)
+    log.info("Compacted {} kmers into {} unitigs in {}".format(
+        n, n_unitigs, path))
+    return Unitigs(path)
+
+
+class Unitigs:
+    """
+    Unitig index written by build_unitigs(). Maps every kmer to its unitig
+    and position in the unitig.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.k = self.meta['k']
+        for name in ARRAYS:
+            setattr(self, name, np.load(
+                os.path.join(path, name + '.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __str__(self):
+        return "Unitigs in {}".format(self.path)
+
+    def sequence(self, i: int) -> str:
+        return bytes(
+            self.sequences[int(self.starts[i]): int(self.starts[i + 1])]
+        ).decode('ascii')
+
+    def locate(self, kmer: str) -> typing.Optional[typing.Tuple[int, int]]:
+        """
+        :param kmer:
+        :return: The unitig of a kmer and the position of the kmer in it, or
+            None if the kmer isn't in the index.
+        """
+        if len(kmer) != self.k:
+            return None
+        try:
+            value = encode_kmer(kmer)
+        except ValueError:
+            return None
+        i = int(_index_of(self.kmers, np.array(
+            [value], dtype=self.kmers.dtype))[0])
+        if i == -1:
+            return None
+        return int(self.unitig[i]), int(self.offset[i])
+
+    def walks(self, km: Kmers) -> typing.Generator:
+        """
+        Translates the contigs of a sample into unitigs. As with kmer files,
+        each run of consecutive kmers is its own contig.
+        :param km: Kmers of a sample the index was built from.
+        :return: Generator of (header, array of unitig indices).
+        """
+        for header, values, _ in km.iter_packed():
+            idx = _index_of(self.kmers, values)
+            if (idx == -1).any():
+                raise ValueError(
+                    "{} has kmers that aren't in {}".format(km, self))
+            yield header, np.asarray(self.unitig[idx[self.offset[idx] == 0]])
+
+
+def join_unitigs(values: typing.Sequence[str], k: int) -> str:
+    """
+    Concatenates consecutive unitigs, which overlap by k-1 bases.
+    :param values:
+    :param k:
+    :return:
+    """
+    if len(values) == 0:
+        return ""
+    return values[0] + ''.join(v[k - 1:] for v in values[1:])
+
+
+class UnitigGraph(Graph):
+    """
+    Wraps a graph built from unitigs so connected() and path() still accept
+    any kmer. Kmers are translated into their unitigs with the index and the
+    paths are trimmed and split back into kmer nodes. Everything else is
+    passed on to the wrapped graph.
+    """
+
+    def __init__(self, g: Graph, unitigs: Unitigs):
+        self.g = g
+        self.unitigs = unitigs
+
+    def upsert_node(self, node: Node, echo: bool = True) -> typing.Optional[
+            Node]:
+        return self.g.upsert_node(node, echo=echo)
+
+    def add_edge(self, edge: Edge, echo: bool = True) -> typing.Optional[Edge]:
+        return self.g.add_edge(edge, echo=echo)
+
+    def upsert_nodes(self, nodes: typing.Iterable[Node]):
+        self.g.upsert_nodes(nodes)
+
+    def add_edges(self, edges: typing.Iterable[Edge]):
+        self.g.add_edges(edges)
+
+    def remove_sample(self, edge_types: typing.Iterable[str]) -> int:
+        return self.g.remove_sample(edge_types)
+
+    def clear(self):
+        self.g.clear()
+
+    @property
+    def nodes(self) -> typing.Set[Node]:
+        return self.g.nodes
+
+    @property
+    def edges(self) -> typing.Set[Edge]:
+        return self.g.edges
+
+    def get_labels(self, node: str) -> dict:
+        return self.g.get_labels(node)
+
+    def save(self, f: str = None):
+        self.g.save(f)
+
+    @property
+    def edgelist(self) -> typing.Generator:
+        return self.g.edgelist
+
+    def set_graph_labels(self, labels: dict):
+        self.g.set_graph_labels(labels)
+
+    def filter(self):
+        self.g.filter()
+
+    def __len__(self):
+        return len(self.g)
+
+    def node_edges(self, node: str) -> typing.Tuple[Edge, ...]:
+        return self.g.node_edges(node)
+
+    def path_spans(self, node_a: str, node_b: str) -> typing.Tuple[
+            typing.Tuple[str, int, int, dict], ...]:
+        raise NotImplementedError(
+            "Edges of a unitig graph aren't positions in the contigs")
+
+    def _locate(self, node_a: str, node_b: str) -> typing.Optional[tuple]:
+        a = self.unitigs.locate(node_a)
+        b = self.unitigs.locate(node_b)
+        if a is None or b is None:
+            log.warning("No unitigs found for {} and {}".format(
+                node_a, node_b))
+            return None
+        return a, b
+
+    def _same_unitig_edges(self, unitig: int) -> typing.Tuple[Edge, ...]:
+        # Every contig through a unitig covers all of it, so one edge per
+        # contig touching the unitig is a hit
+        edges = {}
+        for edge in self.g.node_edges(self.unitigs.sequence(unitig)):
+            edges.setdefault(edge.edge_type, edge)
+        return tuple(edges.values())
+
+    def connected(self, node_a: str, node_b: str) -> typing.Tuple[
+            bool, typing.Tuple]:
+        located = self._locate(node_a, node_b)
+        if located is None:
+            return False, ()
+        (unitig_a, offset_a), (unitig_b, offset_b) = located
+        edges = ()
+        if unitig_a == unitig_b and offset_a <= offset_b:
+            edges = self._same_unitig_edges(unitig_a)
+        # Also finds contigs that come back to the same unitig
+        _, src_edges = self.g.connected(self.unitigs.sequence(unitig_a),
+                                        self.unitigs.sequence(unitig_b))
+        edges += tuple(src_edges)
+        return len(edges) > 0, edges
+
+    def _kmer_path(self, sequence: str) -> typing.Tuple[Node, ...]:
+        k = self.unitigs.k
+        return tuple(Node(value=sequence[i: i + k])
+                     for i in range(len(sequence) - k + 1))
+
+    def path(self, node_a: str, node_b: str) -> typing.Tuple[tuple, tuple]:
+        located = self._locate(node_a, node_b)
+        if located is None:
+            return tuple(), tuple()
+        (unitig_a, offset_a), (unitig_b, offset_b) = located
+        k = self.unitigs.k
+        seq_a = self.unitigs.sequence(unitig_a)
+        seq_b = self.unitigs.sequence(unitig_b)
+        kmer_paths = []
+        kmer_paths_meta = []
+        if unitig_a == unitig_b and offset_a <= offset_b:
+            nodes = self._kmer_path(seq_a[offset_a: offset_b + k])
+            for edge in self._same_unitig_edges(unitig_a):
+                kmer_paths.append(nodes)
+                kmer_paths_meta.append({'edge_type': edge.edge_type})
+        paths, paths_meta = self.g.path(seq_a, seq_b)
+        # Bases of the last unitig after node_b
+        trim = len(seq_b) - offset_b - k
+        for nodes, meta in zip(paths, paths_meta):
+            sequence = join_unitigs([n.value for n in nodes], k)
+            kmer_paths.append(self._kmer_path(
+                sequence[offset_a: len(sequence) - trim]))
+            kmer_paths_meta.append(meta)
+        return tuple(kmer_paths), tuple(kmer_paths_meta)
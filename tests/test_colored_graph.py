@@ -0,0 +1,116 @@
+import pytest
+
+from prairiedog.colored_graph import ColoredGraph
+from prairiedog.edge import Edge
+from prairiedog.edge_types import EdgeTypes
+from prairiedog.graph_ref import GraphRef
+from prairiedog.kmers import Kmers
+from prairiedog.node import concat_values
+from prairiedog.prairiedog import Prairiedog
+from prairiedog.subgraph_ref import SubgraphRef
+
+GENOME_FILES = [
+    "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta",
+    "tests/SRR1060582_SHORTENED.fasta",
+    "tests/SRR1106609_SHORTENED.fasta",
+]
+
+
+def _contigs(g: ColoredGraph):
+    # Two samples sharing BCE -> CEF
+    g.add_edges([
+        Edge(src="ABC", tgt="BCE", edge_type="a", edge_value=0),
+        Edge(src="BCE", tgt="CEF", edge_type="a", edge_value=1),
+        Edge(src="BCE", tgt="CEF", edge_type="b", edge_value=0),
+        Edge(src="CEF", tgt="EFG", edge_type="b", edge_value=1),
+    ])
+
+
+def test_colored_graph_distinct_edges():
+    g = ColoredGraph()
+    _contigs(g)
+    assert g.distinct_edges == 3
+    assert len(g.edges) == 4
+    assert len(g) == 4
+    assert g.samples(g._edges[("BCE", "CEF")].colors) == ["a", "b"]
+    # Stored once, with a position per sample
+    assert len(g._edges[("BCE", "CEF")]) == 2
+
+
+def test_colored_graph_path():
+    g = ColoredGraph()
+    _contigs(g)
+    connected, src_edges = g.connected("BCE", "EFG")
+    assert connected
+    assert [(e.edge_type, e.edge_value) for e in src_edges] == [("b", 0)]
+    assert not g.connected("ABC", "EFG")[0]
+    paths, paths_meta = g.path("ABC", "CEF")
+    assert [concat_values(p) for p in paths] == ["ABCEF"]
+    assert paths_meta == ({'edge_type': "a"},)
+
+
+def test_colored_graph_remove_sample():
+    g = ColoredGraph()
+    _contigs(g)
+    assert g.remove_sample(["b"]) == 2
+    assert g.distinct_edges == 2
+    assert {n.value for n in g.nodes} == {"ABC", "BCE", "CEF"}
+    assert g.samples(g._edges[("BCE", "CEF")].colors) == ["a"]
+
+
+def test_colored_graph_n_contig(tmpdir):
+    # Kmers spanning the N split the contig into two runs of edges
+    seq = "ACGTACGTAAGGTTNCCAAGGTTACGATCGA"
+    fasta = str(tmpdir.join("n.fasta"))
+    with open(fasta, 'w') as f:
+        f.write(">c1\n{}\n".format(seq))
+    edge_types = EdgeTypes()
+    sgr = SubgraphRef(ColoredGraph(edge_types), edge_types)
+    sgr.update_graph(Kmers(fasta, k=5), GraphRef())
+    g = sgr.graph
+    paths, _ = g.path(seq[15:20], seq[20:25])
+    assert [concat_values(p) for p in paths] == [seq[15:25]]
+    assert not g.path(seq[0:5], seq[15:20])[0]
+    # Both runs are removed, not only the one starting the contig
+    assert g.remove_sample(list(edge_types.names)) == 20
+    assert g.distinct_edges == 0
+    assert len(g) == 0
+
+
+@pytest.mark.parametrize("canonical", [False, True])
+def test_colored_graph_samples(tmpdir, canonical):
+    edge_types = EdgeTypes()
+    sgr = SubgraphRef(ColoredGraph(edge_types), edge_types)
+    kms = [Kmers(f, canonical=canonical) for f in GENOME_FILES]
+    for km in kms:
+        sgr.update_graph(km, GraphRef())
+    g = sgr.graph
+    assert g.colors == [str(km) for km in kms]
+    assert g.distinct_edges <= len(g.edges)
+    path = str(tmpdir.join("pangenome.colored"))
+    g.dump(path)
+    loaded = ColoredGraph.load(path, edge_types)
+    assert loaded.distinct_edges == g.distinct_edges
+    if not canonical:
+        seq = kms[0].sequences[0]
+        src, dst = seq[2: 2 + kms[0].k], seq[10: 10 + kms[0].k]
+        paths, _ = loaded.path(src, dst)
+        assert seq[2: 10 + kms[0].k] in [concat_values(p) for p in paths]
+
+
+@pytest.mark.parametrize("canonical", [False, True])
+def test_colored_graph_packed_keys(canonical):
+    edge_types = EdgeTypes()
+    sgr = SubgraphRef(ColoredGraph(edge_types), edge_types, packed_keys=True)
+    km = Kmers(GENOME_FILES[0], canonical=canonical)
+    sgr.update_graph(km, GraphRef())
+    g = sgr.graph
+    assert all(n.value.isdigit() for n in g.nodes)
+    seq = km.sequences[0]
+    src, dst = seq[2: 2 + km.k], seq[10: 10 + km.k]
+    ph = Prairiedog(g, canonical=canonical, edge_types=edge_types,
+                    packed_keys=True).query(src, dst)
+    variants = set().union(*(variant_set
+                             for contig_map in ph.sample_map.values()
+                             for variant_set in contig_map.values()))
+    assert seq[2: 10 + km.k] in variants
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from prairiedog.commit import CommitPolicy, GraphWriter
+
+
+class SavedGraph:
+    """Records the order of writes and saves."""
+
+    def __init__(self):
+        self.calls = []
+
+    def add(self, value):
+        self.calls.append(value)
+
+    def save(self, f=None):
+        self.calls.append("save")
+
+
+def test_commit_policy_limits():
+    policy = CommitPolicy(max_items=10, max_bytes=100)
+    assert not policy.due()
+    assert policy.room() == 10
+    policy.record(4, 10)
+    assert policy.room() == 6
+    assert not policy.due()
+    policy.record(6, 10)
+    assert policy.due()
+    policy.reset()
+    assert policy.commits == 1
+    policy.record(1, 100)
+    assert policy.due()
+
+
+def test_commit_policy_seconds():
+    policy = CommitPolicy(max_seconds=0.01)
+    policy.record(1)
+    assert not policy.due()
+    time.sleep(0.02)
+    assert policy.due()
+
+
+def test_commit_policy_overhead():
+    policy = CommitPolicy(overhead=0.5)
+    assert policy.room() is None
+    policy.record(1)
+    # Commits once to measure the latency
+    assert policy.due()
+    policy.reset()
+    policy.measured(0.01)
+    policy.record(1)
+    assert not policy.due()
+    time.sleep(0.03)
+    assert policy.due()
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_graph_writer(background):
+    g = SavedGraph()
+    policy = CommitPolicy(max_items=2)
+    writer = GraphWriter(g, policy, background=background)
+    for i in range(5):
+        writer.write(g.add, i)
+        policy.record(1)
+        writer.maybe_commit()
+    writer.close()
+    # Closing commits the last write
+    assert g.calls == [0, 1, "save", 2, 3, "save", 4, "save"]
+    assert policy.commits == 3
+    assert policy.latency is not None
+    writer.close()
+    assert policy.commits == 3
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_graph_writer_close_without_commit(background):
+    g = SavedGraph()
+    policy = CommitPolicy()
+    writer = GraphWriter(g, policy, background=background)
+    writer.write(g.add, 0)
+    policy.record(1)
+    writer.close(commit=False)
+    assert g.calls == [0]
+
+
+def test_graph_writer_error():
+    def fail():
+        raise ValueError("write failed")
+
+    writer = GraphWriter(SavedGraph(), CommitPolicy(), background=True)
+    writer.write(fail)
+    with pytest.raises(ValueError):
+        writer.close()
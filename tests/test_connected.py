@@ -1,7 +1,8 @@
-import pytest
 import logging
+import sys
 
 from prairiedog.graph import Graph
+from prairiedog.lemon_graph import LGGraph, PATH_BATCH_SIZE
 from prairiedog.node import Node, concat_values
 from prairiedog.edge import Edge
 from prairiedog.errors import GraphException
@@ -272,7 +273,7 @@ def test_graph_connected_repeats_full_path(g: Graph):
 
     try:
         paths, _ = g.path('ABC', 'CDE')
-    except:
+    except Exception:
         raise GraphException(g)
 
     assert len(paths) == 3
@@ -294,6 +295,7 @@ def test_graph_connected_repeats_full_path(g: Graph):
 
     assert c == 2
 
+
 def test_graph_connected_repeats_end_path(g: Graph):
     n1 = Node(value="ABC")
     n2 = Node(value="BCD")
@@ -378,3 +380,35 @@ def test_graph_connected_repeats_one_long_path(g: Graph):
 
     paths, _ = g.path('ABC', 'DEF')
     assert len(paths) == 1
+
+
+def test_lemongraph_long_path(lgr: LGGraph):
+    # Longer than the recursion limit, so it's walked in batches
+    n = sys.getrecursionlimit() + PATH_BATCH_SIZE + 3
+    values = ["{:04d}".format(i) for i in range(n)]
+    lgr.add_edges(
+        Edge(src=values[i], tgt=values[i + 1], edge_type="long",
+             edge_value=i) for i in range(n - 1))
+    lgr.save()
+    paths, _ = lgr.path(values[1], values[-1])
+    assert len(paths) == 1
+    assert [node.value for node in paths[0]] == values[1:]
+
+
+def test_lemongraph_n_contig_path(lgr: LGGraph):
+    # A contig split by an N, with BBB -> CCC in both runs. Edge values are
+    # positions, so values 3 and 4 of the kmers spanning the N are missing
+    nodes = ["AAA", "BBB", "CCC", "DDD"], ["XXX", "BBB", "CCC", "YYY"]
+    for first, run in zip((0, 5), nodes):
+        lgr.add_edges(
+            Edge(src=run[i], tgt=run[i + 1], edge_type="n",
+                 edge_value=first + i) for i in range(len(run) - 1))
+    lgr.save()
+    # The BBB -> CCC edge of the second run is skipped, not an error
+    paths, _ = lgr.path("AAA", "CCC")
+    assert [[node.value for node in p] for p in paths] == [
+        ["AAA", "BBB", "CCC"]]
+    # Only the source edge on the run of YYY reaches it
+    paths, _ = lgr.path("BBB", "YYY")
+    assert [[node.value for node in p] for p in paths] == [
+        ["BBB", "CCC", "YYY"]]
@@ -165,6 +165,9 @@ def test_dgraph_edges_multiple_reverse(dg: Dgraph):
         assert len(edges) == 2
     except:
         raise GraphException(dg)
+    # Each edge has its own source
+    assert sorted(e.src for e in edges) == ["BCD", "XYZ"]
+    assert sorted(e.edge_type for e in edges) == ["path1", "path2"]
 
 
 def test_dgraph_parse_edges(dg: Dgraph):
@@ -184,3 +187,33 @@ def test_dgraph_parse_edges(dg: Dgraph):
             assert e.tgt == 'CEF'
         else:
             assert False
+
+
+def test_dgraph_upsert_block():
+    edges = [
+        Edge(src="ABC", tgt="BCE", edge_type="a", edge_value=0),
+        Edge(src="BCE", tgt="CEF", edge_type="a", edge_value=1),
+    ]
+    query, mutations = Dgraph._upsert_block(edges)
+    # A mutation per node, then per edge
+    assert len(mutations) == 5
+    assert 'n0 as var(func: eq(km, "ABC"))' in query
+    assert mutations[0] == ('uid(n0) <km> "ABC" .', '@if(eq(len(n0), 0))')
+    nquads, cond = mutations[-1]
+    assert cond == '@if(eq(len(e1), 0))'
+    assert 'uid(n1) <fd> _:e1 .' in nquads
+    assert '_:e1 <fd> uid(n2) .' in nquads
+
+
+def test_dgraph_upsert_edges(dg: Dgraph):
+    edges = [
+        Edge(src="ABC", tgt="BCE", edge_type="a", edge_value=0),
+        Edge(src="BCE", tgt="CEF", edge_type="a", edge_value=1),
+        Edge(src="BCE", tgt="CEF", edge_type="b", edge_value=0),
+    ]
+    dg.upsert_edges(edges, batch_size=2)
+    # Existing edges and nodes are not added again
+    dg.upsert_edges(edges + edges)
+    assert len(dg.edges) == 3
+    assert {n.value for n in dg.nodes} == {"ABC", "BCE", "CEF"}
+    assert len(dg.find_edges("BCE")) == 2
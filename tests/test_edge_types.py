@@ -0,0 +1,33 @@
+import pytest
+
+from prairiedog.edge_types import EdgeTypes, edge_type_id
+from prairiedog.pretty_hits import PrettyHits
+from prairiedog.subgraph_ref import uncouple_edge_type
+
+
+def test_edge_types_save_load(tmpdir):
+    et = EdgeTypes()
+    a = et.add(">NODE_1_length_1019_cov_210.04", "a.fasta")
+    b = et.add(">NODE_1_length_1019_cov_210.04", "b.fasta")
+    assert a != b
+    assert a == edge_type_id(">NODE_1_length_1019_cov_210.04", "a.fasta")
+    et.save(str(tmpdir.join("edge_types", "a.tsv")))
+    loaded = EdgeTypes.load(str(tmpdir.join("edge_types")))
+    assert loaded.names == et.names
+    assert uncouple_edge_type(b, loaded) == (
+        "b.fasta", ">NODE_1_length_1019_cov_210.04")
+    with pytest.raises(KeyError):
+        loaded.resolve("1")
+
+
+def test_edge_types_legacy():
+    assert uncouple_edge_type(">contig in a.fasta") == (
+        "a.fasta", ">contig")
+    with pytest.raises(ValueError):
+        uncouple_edge_type("12")
+
+
+def test_edge_types_pretty_hits():
+    et = EdgeTypes()
+    hits = [{'string': "ACGT", 'edge_type': et.add(">c", "a.fasta")}]
+    assert PrettyHits(hits, et).sample_map == {"a.fasta": {">c": {"ACGT"}}}
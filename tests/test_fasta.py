@@ -0,0 +1,84 @@
+import gzip
+
+import pytest
+
+from prairiedog import kmers
+from prairiedog.fasta import (is_fasta, sample_name, open_fasta,
+                              contig_ranges, read_fasta_contigs)
+
+GENOME = "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta"
+
+
+def test_fasta_names():
+    assert is_fasta("samples/a.fasta")
+    assert is_fasta("a.fna.gz")
+    assert is_fasta("a.fa.zst")
+    assert not is_fasta("a.csv")
+    assert not is_fasta("a.gz")
+    assert sample_name("samples/SRR1060582_SHORTENED.fasta.gz") == \
+        "SRR1060582_SHORTENED"
+    assert sample_name("GCA_900015695.1_ED647.fna") == "GCA_900015695.1_ED647"
+
+
+def test_fasta_contig_ranges():
+    ranges = contig_ranges(GENOME, 3)
+    assert ranges[0][0] == 0
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    contigs = [(header, "".join(pieces)) for start, end in ranges
+               for header, pieces in read_fasta_contigs(GENOME, 7, start, end)]
+    assert contigs == [(header, "".join(pieces)) for header, pieces
+                       in read_fasta_contigs(GENOME)]
+    assert len(contigs) == 3
+
+
+def _expected():
+    km = kmers.Kmers(GENOME)
+    return km, list(km.iter_kmers())
+
+
+def test_fasta_gzip(tmpdir):
+    km, expected = _expected()
+    with open(GENOME, 'rb') as f:
+        raw = f.read()
+    path = str(tmpdir.join("genome.fasta.gz"))
+    with gzip.open(path, 'wb') as f:
+        f.write(raw)
+    assert list(kmers.Kmers(path).iter_kmers()) == expected
+    assert list(kmers.Kmers(path, stream=True,
+                            chunk_size=5).iter_kmers()) == expected
+    assert kmers.Kmers(path).headers == km.headers
+
+
+def test_fasta_bgzip(tmpdir):
+    """bgzip writes a series of gzip members."""
+    _, expected = _expected()
+    with open(GENOME, 'rb') as f:
+        raw = f.read()
+    path = str(tmpdir.join("genome.fasta.bgz"))
+    half = len(raw) // 2
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(raw[:half]))
+        f.write(gzip.compress(raw[half:]))
+    assert list(kmers.Kmers(path, stream=True).iter_kmers()) == expected
+
+
+def test_fasta_zstd(tmpdir):
+    zstandard = pytest.importorskip("zstandard")
+    _, expected = _expected()
+    with open(GENOME, 'rb') as f:
+        raw = f.read()
+    path = str(tmpdir.join("genome.fasta.zst"))
+    with open(path, 'wb') as f:
+        f.write(zstandard.ZstdCompressor().compress(raw))
+    assert list(kmers.Kmers(path).iter_kmers()) == expected
+
+
+def test_fasta_threaded_close(tmpdir):
+    """Closing early stops the decompression thread."""
+    path = str(tmpdir.join("big.fasta.gz"))
+    with gzip.open(path, 'wt') as f:
+        f.write(">a\n")
+        for _ in range(10000):
+            f.write("ACGT" * 20 + "\n")
+    with open_fasta(path) as f:
+        assert f.readline() == ">a\n"
@@ -0,0 +1,69 @@
+import gzip
+
+from prairiedog.colored_graph import ColoredGraph
+from prairiedog.edge_types import EdgeTypes
+from prairiedog.fasta_index import FastaIndex, FastaIndexes
+from prairiedog.kmers import Kmers
+from prairiedog.prairiedog import Prairiedog
+from prairiedog.subgraph_ref import SubgraphRef
+
+GENOME_FILES = [
+    "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta",
+    "tests/SRR1060582_SHORTENED.fasta",
+]
+
+MULTILINE = ">a\nACGTA\nCCGTT\nGA\n>b desc\nTTTT\nTTTT\n>c\nACG\nACGTA\nC\n" \
+            ">d\nACNGT\n"
+
+
+def test_fasta_index_fetch(tmpdir):
+    path = str(tmpdir.join("genome.fasta"))
+    with open(path, 'w') as f:
+        f.write(MULTILINE)
+    index = FastaIndex.build(path, str(tmpdir.join("genome.fasta.fai")))
+    index = FastaIndex.load(str(tmpdir.join("genome.fasta.fai")))
+    assert index.sample == "genome.fasta"
+    assert index.fetch(">a", 0, 12) == "ACGTACCGTTGA"
+    assert index.fetch(">a", 3, 11) == "TACCGTTG"
+    assert index.fetch(">b desc", 2, 100) == "TTTTTT"
+    # Irregular lines
+    assert index.contigs[">c"][2] == 0
+    assert index.fetch(">c", 2, 6) == "GACG"
+    indexes = FastaIndexes(str(tmpdir))
+    assert indexes.fetch("genome.fasta", ">a", 1, 3) == "CG"
+    # Ranges may cross an invalid base, which paths of the graph never do
+    assert indexes.fetch("genome.fasta", ">d", 0, 2) is None
+
+
+def test_fasta_index_gzip(tmpdir):
+    path = str(tmpdir.join("genome.fasta.gz"))
+    with gzip.open(path, 'wt') as f:
+        f.write(MULTILINE)
+    index = FastaIndex.build(path, str(tmpdir.join("genome.fasta.gz.fai")))
+    assert index.sample == "genome.fasta.gz"
+    assert index.fetch(">a", 3, 11) == "TACCGTTG"
+
+
+def _query_hits(g, edge_types: EdgeTypes, tmpdir):
+    for f in GENOME_FILES:
+        SubgraphRef(g, edge_types).update_graph(Kmers(f, 11), None)
+        FastaIndex.build(f, str(tmpdir.join(f.split('/')[-1] + '.fai')))
+    walked = Prairiedog(g, edge_types=edge_types)
+    sliced = Prairiedog(g, edge_types=edge_types,
+                        fasta_indexes=FastaIndexes(str(tmpdir)))
+    km = Kmers(GENOME_FILES[0], 11)
+    seq = max(km.sequences, key=len)
+    src, dst = seq[:11], seq[-11:]
+    assert sliced._indexed_hits(src, dst)
+    assert sliced.query(src, dst).sample_map == \
+        walked.query(src, dst).sample_map
+
+
+def test_fasta_index_query(tmpdir):
+    edge_types = EdgeTypes()
+    _query_hits(ColoredGraph(edge_types), edge_types, tmpdir)
+
+
+def test_fasta_index_query_lemongraph(tmpdir, lgr):
+    # LemonGraph edges hold the ID of their target rather than its value
+    _query_hits(lgr, EdgeTypes(), tmpdir)
@@ -9,7 +9,8 @@ from prairiedog.graph import Graph
 from prairiedog.node import Node
 from prairiedog.edge import Edge
 from prairiedog.errors import GraphException
-from prairiedog.lemon_graph import LGGraph
+from prairiedog.lemon_graph import LGGraph, NodeCache, ReadPool, \
+    map_size_for, MIN_MAP_SIZE
 from prairiedog.dgraph import Dgraph
 
 
@@ -83,3 +84,151 @@ def test_graph_node_labels(g: Graph):
         else:
             # Something went wrong
             assert False
+
+
+def test_graph_bulk(g: Graph):
+    values = ["ABC", "BCE", "CEF"]
+    g.upsert_nodes(Node(value=v) for v in values)
+    g.add_edges(
+        Edge(src=values[i], tgt=values[i + 1], edge_type="c", edge_value=i)
+        for i in range(len(values) - 1))
+    g.save()
+    assert {n.value for n in g.nodes} == set(values)
+    assert len(g.edges) == 2
+    paths, _ = g.path("ABC", "CEF")
+    assert len(paths) == 1
+
+
+def test_graph_remove_sample(g: Graph):
+    # Two contigs sharing BCE and CEF
+    g.add_edges([
+        Edge(src="ABC", tgt="BCE", edge_type="a", edge_value=0),
+        Edge(src="BCE", tgt="CEF", edge_type="a", edge_value=1),
+        Edge(src="BCE", tgt="CEF", edge_type="b", edge_value=0),
+        Edge(src="CEF", tgt="EFG", edge_type="b", edge_value=1),
+    ])
+    g.save()
+    assert g.remove_sample(["b"]) == 2
+    g.save()
+    assert len(g.edges) == 2
+    # EFG was only in the removed contig
+    assert {n.value for n in g.nodes} == {"ABC", "BCE", "CEF"}
+    paths, _ = g.path("ABC", "CEF")
+    assert len(paths) == 1
+
+
+def test_lemongraph_node_cache(lgr: LGGraph):
+    # Consecutive edges share a node
+    lgr.add_edges([
+        Edge(src="ABC", tgt="BCE", edge_type="a", edge_value=0),
+        Edge(src="BCE", tgt="CEF", edge_type="a", edge_value=1),
+        Edge(src="CEF", tgt="EFG", edge_type="a", edge_value=2),
+    ])
+    assert lgr.node_cache.hits == 2
+    assert lgr.node_cache.misses == 4
+    assert len(lgr.node_cache) == 4
+    # Cached nodes belong to the transaction
+    lgr.save()
+    assert len(lgr.node_cache) == 0
+    lgr.add_edge(Edge(src="EFG", tgt="FGH", edge_type="a", edge_value=3))
+    lgr.save()
+    assert len(lgr.edges) == 4
+    assert len(lgr.nodes) == 5
+
+
+def test_lemongraph_node_cache_evicts():
+    class Txn:
+        def node(self, type: str, value: str):
+            return {'type': type, 'value': value}
+
+    cache = NodeCache(size=2)
+    txn = Txn()
+    for value in ("ABC", "BCE", "ABC", "CEF", "BCE"):
+        cache.get(txn, "n", value)
+    # BCE was the least recently used when CEF was added
+    assert cache.hits == 1
+    assert cache.misses == 4
+    assert cache.hit_rate == 0.2
+    assert len(cache) == 2
+
+
+def _count_paths(g: LGGraph, pair: tuple) -> int:
+    return len(g.path(*pair)[0])
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_lemongraph_read_pool(lgr: LGGraph, processes: bool):
+    lgr.add_edges([
+        Edge(src="ABC", tgt="BCE", edge_type="a", edge_value=0),
+        Edge(src="BCE", tgt="CEF", edge_type="a", edge_value=1),
+        Edge(src="CEF", tgt="EFG", edge_type="a", edge_value=2),
+    ])
+    lgr.save()
+    # LMDB can't have the store open twice in a process
+    lgr.g.close()
+    pool = ReadPool(lgr.db_path, workers=2)
+    pairs = [("ABC", "EFG"), ("BCE", "CEF"), ("EFG", "ABC")] * 4
+    assert pool.map(_count_paths, pairs, processes=processes) == [1, 1, 0] * 4
+
+
+def test_lemongraph_iter_edges(lgr: LGGraph):
+    lgr.add_edges([
+        Edge(src="ABC", tgt="BCE", edge_type="a", edge_value=0),
+        Edge(src="BCE", tgt="CEF", edge_type="a", edge_value=1),
+        Edge(src="BCE", tgt="CEF", edge_type="b", edge_value=0),
+    ])
+    # The open transaction is read before it is committed
+    assert len(list(lgr.iter_edges())) == 3
+    lgr.save()
+    batches = list(lgr.iter_edges(batch_size=2))
+    assert [len(b) for b in batches] == [2, 1]
+    assert [e.edge_value for e in lgr.iter_edges(edge_type="a")] == [0, 1]
+    # Resume after the first edge
+    edges = list(lgr.iter_edges(after=batches[0][0].db_id))
+    assert [e.db_id for e in edges] == [
+        e.db_id for e in batches[0][1:] + batches[1]]
+    # A type with a cursor is read by ID
+    first = next(lgr.iter_edges(edge_type="a", after=0))
+    assert [e.edge_value for e in lgr.iter_edges(
+        edge_type="a", after=first.db_id)] == [1]
+    assert {n.value for n in lgr.iter_nodes()} == {"ABC", "BCE", "CEF"}
+
+
+def test_map_size_for():
+    assert map_size_for(0) == MIN_MAP_SIZE
+    assert map_size_for(MIN_MAP_SIZE // 2) == MIN_MAP_SIZE
+    assert map_size_for(MIN_MAP_SIZE // 2 + 1) == MIN_MAP_SIZE * 2
+    assert map_size_for(MIN_MAP_SIZE * 3) == MIN_MAP_SIZE * 8
+    # The map never shrinks
+    assert map_size_for(0, MIN_MAP_SIZE * 4) == MIN_MAP_SIZE * 4
+
+
+def test_lemongraph_compact(lgr: LGGraph, tmpdir):
+    lgr.add_edges([
+        Edge(src="ABC", tgt="BCE", edge_type="a", edge_value=0),
+        Edge(src="BCE", tgt="CEF", edge_type="a", edge_value=1),
+        Edge(src="BCE", tgt="CEF", edge_type="b", edge_value=0),
+        Edge(src="CEF", tgt="EFG", edge_type="b", edge_value=1),
+    ])
+    lgr.set_graph_labels({"k": 11})
+    lgr.save()
+    lgr.remove_sample(["b"])
+    lgr.save()
+    out = lgr.compact(str(tmpdir.join("compact.lemongraph")), batch_size=2)
+
+    # Parsed edges hold node IDs, which compact() renumbers
+    def edge_values(g: LGGraph) -> set:
+        with g._reading() as txn:
+            return {(src['value'], tgt['value'], e['type'], int(e['value']))
+                    for src, e, tgt in txn.query('n()->e()->n()')}
+    assert edge_values(out) == edge_values(lgr) == {
+        ("ABC", "BCE", "a", 0), ("BCE", "CEF", "a", 1)}
+    with out._reading() as txn:
+        assert txn["k"] == 11
+    assert {n.value for n in out.nodes} == {"ABC", "BCE", "CEF"}
+    paths, _ = out.path("ABC", "CEF")
+    assert len(paths) == 1
+    stats = out.stats()
+    assert stats['edges'] == 2
+    assert stats['nodes'] == 3
+    assert stats['file_bytes'] <= lgr.stats()['file_bytes']
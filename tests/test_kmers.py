@@ -3,6 +3,10 @@
 
 """Tests for `prairiedog` package."""
 
+import itertools
+
+import dill
+import numpy as np
 import pytest
 
 from prairiedog import kmers
@@ -67,3 +71,216 @@ def test_kmers_unique():
     """
     km = kmers.Kmers("tests/15.fa")
     assert km.unique_kmers == 5
+
+
+@pytest.mark.parametrize("f", [
+    "tests/15.fa",
+    "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta",
+    "tests/SRR1106609_SHORTENED.fasta",
+])
+def test_kmers_stream(f):
+    """Streaming should emit the same kmers as the in-memory reader, even when
+    kmers span two blocks of the file.
+    """
+    km = kmers.Kmers(f)
+    km_stream = kmers.Kmers(f, stream=True, chunk_size=7)
+    assert km_stream.sequences == []
+    assert list(km_stream.iter_kmers()) == list(km.iter_kmers())
+    assert km_stream.unique_kmers == km.unique_kmers
+    assert len(km_stream) == len(km)
+
+
+def test_kmers_encode_decode():
+    for k in (1, 11, 16, 17, 32):
+        for kmer in itertools.islice(kmers.possible_kmers(k), 50):
+            value = kmers.encode_kmer(kmer)
+            assert kmers.decode_kmer(value, k) == kmer
+    assert kmers.encode_kmer("AAAA") == 0
+    assert kmers.encode_kmer("TTTT") == 255
+    assert kmers.encode_kmer("ACGT") < kmers.encode_kmer("AGTA")
+    assert kmers.packed_dtype(16) == np.uint32
+    assert kmers.packed_dtype(17) == np.uint64
+    with pytest.raises(ValueError):
+        kmers.encode_kmer("ACNT")
+    with pytest.raises(ValueError):
+        kmers.packed_dtype(33)
+
+
+def test_kmers_keys():
+    km = np.array(["ACGTA", "TTTTT", "AAAAA"])
+    keys = kmers.kmer_keys(km)
+    assert keys == [kmers.kmer_key(kmer) for kmer in km]
+    assert keys[1:] == ["1023", "0"]
+    assert [kmers.key_kmer(key, 5) for key in keys] == km.tolist()
+    assert kmers.key_kmer(1023, 5) == "TTTTT"
+    assert kmers.kmer_keys(np.array([], dtype='U5')) == []
+    assert len(set(kmers.packed_kmer_keys(3))) == 64
+    with pytest.raises(ValueError):
+        kmers.kmer_keys(np.array(["ACNTA"]))
+
+
+def test_kmers_encode_sequence():
+    seq = "ACGTTGCANCGTAGGCTTAC"
+    values, valid = kmers.encode_sequence(seq, 5)
+    assert len(values) == len(seq) - 5 + 1
+    for i, value in enumerate(values):
+        kmer = seq[i: i + 5]
+        assert valid[i] == ("N" not in kmer)
+        if valid[i]:
+            assert value == kmers.encode_kmer(kmer)
+    assert kmers.decode_kmers(values[valid], 5) == [
+        seq[i: i + 5] for i in range(len(values)) if valid[i]]
+
+
+def test_kmers_iter_packed():
+    km = kmers.Kmers(
+        "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta")
+    km_stream = kmers.Kmers(km.filepath, stream=True, chunk_size=7)
+    packed = list(km.iter_packed())
+    assert len(packed) == 3
+    for (header, values, start), (_, expected) in zip(packed,
+                                                      km.iter_contigs()):
+        assert start == 0
+        assert kmers.decode_kmers(values, km.k) == list(expected)
+    for a, b in zip(packed, km_stream.iter_packed()):
+        assert a[0] == b[0]
+        assert np.array_equal(a[1], b[1])
+
+
+@pytest.mark.parametrize("canonical", [False, True])
+def test_kmers_iter_batches(tmpdir, canonical):
+    """Batches should join back into the kmers of iter_contigs()."""
+    km = kmers.Kmers(
+        "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta",
+        stream=True, chunk_size=7, canonical=canonical)
+    path = str(tmpdir.join("a.kmers"))
+    km.dump(path)
+    for k in (km, kmers.Kmers(path)):
+        contigs = []
+        for header, batch, start, forward in k.iter_batches(
+                window=100, orientation=True):
+            assert len(batch) <= 100
+            pairs = list(zip(batch.tolist(), forward.tolist()))
+            if start == 0:
+                contigs.append((header, pairs))
+            else:
+                contigs[-1][1].extend(pairs)
+        assert contigs == [(header, list(oriented)) for header, oriented
+                           in k.iter_contigs(orientation=True)]
+
+
+@pytest.mark.parametrize("f", [
+    "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta",
+    "tests/SRR1106609_SHORTENED.fasta",
+])
+def test_kmers_procs(f):
+    """Encoding contig groups in a process pool should keep file order."""
+    km = kmers.Kmers(f, stream=True)
+    km_procs = kmers.Kmers(f, stream=True, chunk_size=7, procs=2)
+    assert km_procs.unique_kmers == km.unique_kmers
+    assert list(km_procs.iter_kmers()) == list(km.iter_kmers())
+
+
+@pytest.mark.parametrize("canonical", [False, True])
+def test_kmers_procs_load(canonical):
+    """Loading and batching with a process pool match the serial reads."""
+    f = "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta"
+    km = kmers.Kmers(f, canonical=canonical)
+    km_procs = kmers.Kmers(f, canonical=canonical, chunk_size=7, procs=2)
+    assert km_procs.headers == km.headers
+    assert km_procs.sequences == km.sequences
+
+    def batches(k):
+        return [(header, batch.tolist(), start, forward.tolist())
+                for header, batch, start, forward in k.iter_batches(
+                    window=10, orientation=True)]
+    assert batches(km_procs) == batches(km)
+
+
+def test_kmers_count():
+    arrays = [np.array([3, 1, 3, 2], dtype=np.uint32),
+              np.array([], dtype=np.uint32),
+              np.array([1, 5, 3], dtype=np.uint32)]
+    counts = kmers.count_kmers(arrays, histogram=True)
+    assert counts.unique == 4
+    assert counts.total == 7
+    # 2 and 5 once, 1 twice, 3 three times
+    assert list(counts.histogram) == [0, 2, 1, 1]
+    # Merging early should give the same result
+    merged = kmers.count_kmers(arrays, histogram=True, merge_size=1)
+    assert merged.unique == counts.unique
+    assert list(merged.histogram) == list(counts.histogram)
+
+
+def test_kmers_unique_histogram():
+    km = kmers.Kmers("tests/SRR1106609_SHORTENED.fasta", histogram=True)
+    expected = set(kmer for _, kmer in km.iter_kmers())
+    assert km.unique_kmers == len(expected)
+    assert km.histogram.sum() == km.unique_kmers
+
+
+def test_kmers_dump(tmpdir):
+    f = "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta"
+    km = kmers.Kmers(f)
+    path = str(tmpdir.join("genome.kmers"))
+    km.dump(path)
+    km_file = kmers.Kmers(path)
+    assert km_file.kmer_file is not None
+    assert km_file.filepath == f
+    assert str(km_file) == str(km)
+    assert km_file.k == km.k
+    assert km_file.headers == km.headers
+    assert len(km_file) == len(km)
+    assert km_file.unique_kmers == km.unique_kmers
+    assert list(km_file.iter_kmers()) == list(km.iter_kmers())
+    for a, b in zip(km.iter_packed(), km_file.iter_packed()):
+        assert a[0] == b[0] and a[2] == b[2]
+        assert np.array_equal(a[1], b[1])
+    assert kmers.load_kmers(path).unique_kmers == km.unique_kmers
+
+
+def test_kmers_load_pickle(tmpdir):
+    km = kmers.Kmers("tests/15.fa")
+    path = str(tmpdir.join("15.pkl"))
+    with open(path, 'wb') as f:
+        dill.dump(km, f)
+    loaded = kmers.load_kmers(path)
+    assert list(loaded.iter_kmers()) == list(km.iter_kmers())
+
+
+def test_kmers_canonical(tmpdir):
+    seq = "ACGTTGCATCGTAGGCTTACCA"
+    assert kmers.reverse_complement("AACGT") == "ACGTT"
+    assert kmers.canonical_kmer("TTGCA") == "TGCAA"
+    forward, reverse, valid = kmers.encode_sequence_strands(seq, 5)
+    assert valid.all()
+    assert np.array_equal(
+        reverse, kmers.reverse_complement_packed(forward, 5))
+    values, _ = kmers.encode_sequence(seq, 5, canonical=True)
+    assert kmers.decode_kmers(values, 5) == [
+        kmers.canonical_kmer(seq[i: i + 5]) for i in range(len(values))]
+
+    # Both strands of a genome have the same canonical kmers
+    f = tmpdir.join("fwd.fa")
+    f.write(">fwd\n{}\n".format(seq))
+    r = tmpdir.join("rev.fa")
+    r.write(">rev\n{}\n".format(kmers.reverse_complement(seq)))
+    km = kmers.Kmers(str(f), k=5, canonical=True)
+    km_rev = kmers.Kmers(str(r), k=5, canonical=True, stream=True)
+    fwd_kmers = [kmer for _, kmer in km.iter_kmers()]
+    assert fwd_kmers == [
+        kmer for _, kmer in km_rev.iter_kmers()][::-1]
+    assert km.unique_kmers == km_rev.unique_kmers
+    _, oriented = next(km.iter_contigs(orientation=True))
+    assert [kmer if fwd else kmers.reverse_complement(kmer)
+            for kmer, fwd in oriented] == [
+        seq[i: i + 5] for i in range(len(seq) - 4)]
+
+    # The kmer file keeps the canonical setting
+    path = str(tmpdir.join("fwd.kmers"))
+    km.dump(path)
+    km_file = kmers.Kmers(path)
+    assert km_file.canonical
+    assert [kmer for _, kmer in km_file.iter_kmers()] == fwd_kmers
+    assert list(next(km_file.iter_contigs(orientation=True))[1]) == list(
+        next(km.iter_contigs(orientation=True))[1])
@@ -0,0 +1,35 @@
+import shutil
+
+from prairiedog.manifest import (Manifest, file_digest, manifest_path, NEW,
+                                 CHANGED, UNCHANGED)
+
+GENOME_FILE = "tests/SRR1060582_SHORTENED.fasta"
+
+
+def test_manifest_status(tmpdir):
+    path = str(tmpdir.join("a.fasta"))
+    shutil.copy(GENOME_FILE, path)
+    manifest = Manifest()
+    assert manifest.status("a", file_digest(path)) == NEW
+    assert manifest.pending([path])[0][3] == NEW
+    manifest.record("a", path)
+    assert "a" in manifest
+    assert manifest.status("a", file_digest(path)) == UNCHANGED
+    assert manifest.pending([path]) == []
+    with open(path, 'a') as f:
+        f.write(">new\nACGTACGTACGTACGT\n")
+    assert manifest.pending([path])[0][:2] == ("a", path)
+    assert manifest.pending([path])[0][3] == CHANGED
+    manifest.remove("a")
+    assert len(manifest) == 0
+
+
+def test_manifest_save(tmpdir):
+    path = manifest_path(str(tmpdir.join("pangenome.lemongraph")))
+    assert len(Manifest.load(path)) == 0
+    manifest = Manifest()
+    manifest.record("a", GENOME_FILE, edge_types="a.tsv")
+    manifest.save(path)
+    loaded = Manifest.load(path)
+    assert loaded.samples == manifest.samples
+    assert loaded.samples["a"]["digest"] == file_digest(GENOME_FILE)
@@ -0,0 +1,105 @@
+import numpy as np
+
+from prairiedog.colored_graph import ColoredGraph
+from prairiedog.edge_types import EdgeTypes
+from prairiedog.kmers import Kmers
+from prairiedog.node import concat_values
+from prairiedog.path_table import (PathTable, PathTables, PathTableGraph,
+                                   encode_varints, decode_varints,
+                                   encode_deltas, decode_deltas)
+from prairiedog.subgraph_ref import SubgraphRef
+
+GENOME_FILES = [
+    "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta",
+    "tests/SRR1060582_SHORTENED.fasta",
+]
+
+
+def test_path_table_varints():
+    values = np.array([0, 1, 127, 128, 300, 2 ** 63 + 5], dtype=np.uint64)
+    data, n = encode_varints(values)
+    assert n.tolist() == [1, 1, 1, 2, 2, 10]
+    assert decode_varints(data).tolist() == values.tolist()
+    ids = np.array([5, 6, 7, 2, 8, 8])
+    assert decode_deltas(encode_deltas(ids)).tolist() == ids.tolist()
+
+
+def test_path_table_save(tmpdir):
+    table = PathTable()
+    table.add("a", ["ABC", "BCD"])
+    table.add("a", ["CDE"])
+    table.add("b", ["BCD", "CDE", "DEF"])
+    table.save(str(tmpdir))
+    table = PathTable(str(tmpdir))
+    assert len(table) == 2
+    assert table.nodes_of("a") == ["ABC", "BCD", "CDE"]
+    assert table.nodes_of("b", 1) == ["CDE", "DEF"]
+    # IDs are given in order of first appearance
+    assert table.ids("b").tolist() == [1, 2, 3]
+    assert table.node_id("DEF") == 3
+    assert table.node_id("XYZ") == -1
+
+
+def test_path_table_graph(tmpdir):
+    edge_types = EdgeTypes()
+    g = ColoredGraph(edge_types)
+    kms = []
+    for i, f in enumerate(GENOME_FILES):
+        km = Kmers(f, 11)
+        kms.append(km)
+        sg = SubgraphRef(g, edge_types)
+        sg.path_table = PathTable()
+        sg.update_graph(km, None)
+        sg.path_table.save(str(tmpdir.join(str(i))))
+    pg = PathTableGraph(g, PathTables(str(tmpdir)))
+    for km in kms:
+        seq = max(km.sequences, key=len)
+        src, dst = seq[:11], seq[-11:]
+        expected = sorted((concat_values(p), m['edge_type'])
+                          for p, m in zip(*g.path(src, dst)))
+        paths, paths_meta = pg.path(src, dst)
+        assert sorted((concat_values(p), m['edge_type'])
+                      for p, m in zip(paths, paths_meta)) == expected
+        assert seq in [p for p, _ in expected]
+
+
+def test_path_table_n_contig(tmpdir):
+    # The record joins both runs of the contig, edge values are positions
+    seq = "ACGTACGTAAGGTTNCCAAGGTTACGATCGA"
+    fasta = str(tmpdir.join("n.fasta"))
+    with open(fasta, 'w') as f:
+        f.write(">c1\n{}\n".format(seq))
+    edge_types = EdgeTypes()
+    g = ColoredGraph(edge_types)
+    sg = SubgraphRef(g, edge_types)
+    sg.path_table = PathTable()
+    sg.update_graph(Kmers(fasta, 5), None)
+    sg.path_table.save(str(tmpdir.join("t")))
+    table = PathTable(str(tmpdir.join("t")))
+    edge_type = table.types[0]
+    assert table.run(edge_type, 0) == (0, 9)
+    assert table.run(edge_type, 16) == (11, 21)
+    assert table.run(edge_type, 12) is None
+    pg = PathTableGraph(g, PathTables(str(tmpdir.join("t"))))
+    paths, _ = pg.path(seq[16:21], seq[20:25])
+    assert [concat_values(p) for p in paths] == [seq[16:25]]
+    assert not pg.path(seq[0:5], seq[15:20])[0]
+
+
+def test_path_table_checkpoints(tmpdir):
+    table = PathTable()
+    table.interval = 4
+    values = ["N{}".format(i % 7) for i in range(23)]
+    table.add("a", values[:5])
+    table.add("a", values[5:])
+    table.add("b", values[3:6])
+    table.save(str(tmpdir))
+    table = PathTable(str(tmpdir))
+    assert table.interval == 4
+    ids = table.ids("a")
+    assert table.values(ids) == values
+    for start in range(len(values)):
+        for end in range(start, len(values) + 2):
+            assert table.ids("a", start, end).tolist() == \
+                ids[start:end].tolist()
+    assert table.nodes_of("b") == values[3:6]
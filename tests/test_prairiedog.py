@@ -8,6 +8,7 @@ import pytest
 from click.testing import CliRunner
 
 from prairiedog import cli
+from prairiedog.node import Node, concat_oriented
 
 
 def test_command_line_interface():
@@ -21,3 +22,12 @@ def test_command_line_interface():
     # assert help_result.exit_code == 0
     # # assert 'Show this message and exit.' in help_result.output
     assert True
+
+
+def test_concat_oriented():
+    # ACGTTGC with the second kmer stored as its reverse complement
+    nodes = (Node(value="ACGTT"), Node(value="CAACG"), Node(value="GTTGC"))
+    assert concat_oriented(nodes, "ACGTT") == "ACGTTGC"
+    assert concat_oriented(nodes, "GGGGG") is None
+    assert concat_oriented((Node(value="ACGTT"), Node(value="AAAAA")),
+                           "ACGTT") is None
@@ -1,9 +1,20 @@
+import os
+
 import pytest
 import logging
 
 from prairiedog.profiler import Profiler
 from prairiedog.subgraph_ref import SubgraphRef
 from prairiedog.graph_ref import GraphRef
+from prairiedog.commit import CommitPolicy
+from prairiedog.kmers import Kmers, load_kmers
+from prairiedog.manifest import Manifest
+from prairiedog.fasta import sample_name
+from prairiedog.edge_types import EdgeTypes
+from prairiedog.fasta_index import FastaIndexes
+from prairiedog.colored_graph import ColoredGraph
+from prairiedog.edge import EdgeBatch, ORIENTATION_LABEL
+from prairiedog.node import NodeBatch
 
 log = logging.getLogger("prairiedog")
 
@@ -36,3 +47,118 @@ def test_subgraph_creation_profile(g, km_short):
 
     log.info("Trying to print profiler test...")
     print(profiler.output_text(unicode=True, color=True))
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_subgraph_commit_policy(lgr, km_short, background):
+    sgr = SubgraphRef(lgr)
+    policy = CommitPolicy(max_items=100, overhead=0.05)
+    c = sgr.update_graph(km_short, GraphRef(), policy=policy,
+                         background=background)
+    sgr.save(None)
+    assert policy.commits >= c // 100
+    assert policy.latency is not None
+    assert len(lgr.edges) > 0
+
+
+def test_subgraph_ingest(lgr, genome_files_shortened, tmpdir):
+    paths = []
+    for f in genome_files_shortened:
+        path = str(tmpdir.join(os.path.basename(f) + '.kmers'))
+        Kmers(f).dump(path)
+        paths.append(path)
+    sgr = SubgraphRef(lgr)
+    c = sgr.ingest(paths, GraphRef(), procs=2,
+                   policy=CommitPolicy(max_items=100))
+    sgr.save(None)
+    assert c == sum(len(list(kmers)) for p in paths
+                    for _, kmers in load_kmers(p).iter_contigs())
+    assert len(sgr.edge_types) == sum(
+        len(load_kmers(p).headers) for p in paths)
+    assert len(lgr.edges) > 0
+
+
+def test_subgraph_add_samples(lgr, genome_files_shortened, tmpdir):
+    manifest = Manifest()
+    sgr = SubgraphRef(lgr)
+    kw = dict(kmers_dir=str(tmpdir.join("kmers")),
+              edge_types_dir=str(tmpdir.join("edge_types")),
+              fasta_index_dir=str(tmpdir.join("fasta_index")))
+    added = sgr.add_samples(genome_files_shortened[:1], manifest, **kw)
+    assert added == [sample_name(genome_files_shortened[0])]
+    edges = len(lgr.edges)
+    # Only the samples that are not in the manifest yet are graphed
+    added = sgr.add_samples(genome_files_shortened, manifest, **kw)
+    assert len(added) == len(genome_files_shortened) - 1
+    assert len(lgr.edges) > edges
+    assert sgr.add_samples(genome_files_shortened, manifest, **kw) == []
+    assert len(manifest) == len(genome_files_shortened)
+    assert len(EdgeTypes.load(str(tmpdir.join("edge_types")))) == len(
+        sgr.edge_types)
+    assert len(FastaIndexes(str(tmpdir.join("fasta_index")))) == len(
+        genome_files_shortened)
+
+
+def test_subgraph_remove_sample(lgr, genome_files_shortened, tmpdir):
+    manifest = Manifest()
+    sgr = SubgraphRef(lgr)
+    kw = dict(kmers_dir=str(tmpdir.join("kmers")),
+              edge_types_dir=str(tmpdir.join("edge_types")),
+              fasta_index_dir=str(tmpdir.join("fasta_index")))
+    sgr.add_samples(genome_files_shortened[:1], manifest, **kw)
+    sgr.save(None)
+    edges = len(lgr.edges)
+    sgr.add_samples(genome_files_shortened[1:2], manifest, **kw)
+    sgr.save(None)
+    added = len(lgr.edges) - edges
+    sample = sample_name(genome_files_shortened[1])
+    assert sgr.remove_sample(sample, manifest) == added
+    sgr.save(None)
+    assert len(lgr.edges) == edges
+    assert sample not in manifest
+    assert len(sgr.edge_types) == len(
+        EdgeTypes.load(str(tmpdir.join("edge_types"))))
+
+
+def test_subgraph_edge_values(tmpdir):
+    # Kmers spanning the N aren't graphed, which splits the contig in two
+    fasta = str(tmpdir.join("n.fasta"))
+    with open(fasta, 'w') as f:
+        f.write(">c1\nACGTACGTAAGGTTNCCAAGGTTACGATCGA\n")
+    km = Kmers(fasta, k=5)
+    kmer_path = str(tmpdir.join("n.kmers"))
+    km.dump(kmer_path)
+    for k in (km, load_kmers(kmer_path)):
+        batches = [
+            (len(nodes), edge_c, continues)
+            for _, _, nodes, _, edge_c, _, continues in
+            SubgraphRef._iter_edge_batches(k, None, False)]
+        # Edge values are positions in the contig, the second run starts
+        # after the 5 kmers spanning the N
+        assert batches == [(10, 0, False), (12, 15, False)]
+
+
+def test_subgraph_edge_batch():
+    edges = EdgeBatch(["ABC", "BCE", "CEF"], "c1", 4, ["++", "+-"])
+    assert len(edges) == 2
+    assert list(edges.src) == ["ABC", "BCE"]
+    assert list(edges.tgt) == ["BCE", "CEF"]
+    assert list(edges.values) == [4, 5]
+    assert [(e.src, e.tgt, e.edge_value, e.labels) for e in edges] == [
+        ("ABC", "BCE", 4, {ORIENTATION_LABEL: "++"}),
+        ("BCE", "CEF", 5, {ORIENTATION_LABEL: "+-"})]
+    assert len(EdgeBatch(["ABC"], "c1")) == 0
+
+
+def test_subgraph_edge_batch_backends():
+    # Backends reading the arrays match those iterating Edges
+    nodes = ["ABC", "BCE", "CEF"]
+    batched = ColoredGraph()
+    batched.upsert_nodes(NodeBatch(nodes))
+    batched.add_edges(EdgeBatch(nodes, "c1", 0))
+    iterated = ColoredGraph()
+    iterated.upsert_nodes(list(NodeBatch(nodes)))
+    iterated.add_edges(list(EdgeBatch(nodes, "c1", 0)))
+    for cg in (batched, iterated):
+        assert {n.value for n in cg.nodes} == set(nodes)
+        assert cg.connected("ABC", "CEF")[0]
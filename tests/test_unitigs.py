@@ -0,0 +1,59 @@
+import pytest
+
+from prairiedog.kmers import Kmers
+from prairiedog.node import concat_values
+from prairiedog.subgraph_ref import SubgraphRef
+from prairiedog.graph_ref import GraphRef
+from prairiedog.unitigs import build_unitigs, join_unitigs, UnitigGraph
+
+GENOME_FILES = [
+    "tests/GCA_900015695.1_ED647_contigs_genomic_SHORTENED.fasta",
+    "tests/SRR1060582_SHORTENED.fasta",
+    "tests/SRR1106609_SHORTENED.fasta",
+]
+
+
+@pytest.fixture
+def unitigs(tmpdir):
+    kms = [Kmers(f) for f in GENOME_FILES]
+    return kms, build_unitigs(kms, str(tmpdir.join("unitigs")))
+
+
+def test_unitigs_walks(unitigs):
+    """Every contig should be rebuilt from its walk over the unitigs."""
+    kms, u = unitigs
+    assert len(u) < len(u.kmers)
+    for km in kms:
+        walks = list(u.walks(km))
+        assert len(walks) == len(km.headers)
+        for (header, walk), seq in zip(walks, km.sequences):
+            assert len(walk) >= 2
+            assert join_unitigs([u.sequence(i) for i in walk], u.k) == seq
+
+
+def test_unitigs_locate(unitigs):
+    kms, u = unitigs
+    for kmer in kms[0].iter_kmers():
+        unitig, offset = u.locate(kmer[1])
+        assert u.sequence(unitig)[offset: offset + u.k] == kmer[1]
+    assert u.locate("N" * u.k) is None
+    assert u.locate("A") is None
+
+
+def test_unitigs_canonical(tmpdir):
+    with pytest.raises(ValueError):
+        build_unitigs([Kmers(GENOME_FILES[0], canonical=True)], str(tmpdir))
+
+
+def test_unitigs_path(lgr, unitigs):
+    kms, u = unitigs
+    sgr = SubgraphRef(lgr)
+    for km in kms:
+        sgr.update_graph(km, GraphRef(), unitigs=u)
+    sgr.save(None)
+    g = UnitigGraph(lgr, u)
+    seq = kms[0].sequences[0]
+    src, dst = seq[2: 2 + u.k], seq[10: 10 + u.k]
+    paths, paths_meta = g.path(src, dst)
+    assert len(paths) > 0
+    assert seq[2: 10 + u.k] in [concat_values(p) for p in paths]